@@ -1,63 +1,176 @@
-import os
-import subprocess
 from datetime import datetime
+import os
+import time
 import logging
+import argparse
+import subprocess
+from utils.git_utils import find_git_repo, commit_all, tree_snapshot, ignored_dirs, GitError
+from utils.blob_store import BlobStore
+from utils.push_queue import PushQueue, DEFAULT_MAX_BEHIND
+
+LOG_FILE = 'auto_commit.log'
 
 logging.basicConfig(
-    filename='auto_commit.log',
+    filename=LOG_FILE,
     level=logging.INFO,
     format='%(asctime)s - %(message)s'
 )
 
-def is_large_file(file_path, max_size_mb=1):
-    """Kiểm tra xem file có lớn hơn giới hạn không."""
-    max_size_bytes = max_size_mb * 1024 * 1024  # Convert MB to bytes
-    return os.path.getsize(file_path) > max_size_bytes
+MAX_FILE_SIZE_MB = 1
+DEFAULT_INTERVAL = 60
+
+def _commit(git_repo, blobs=None, push_queue=None):
+    """Commit và push một lần, trả về True nếu đã commit và push thành công.
+
+    Có push_queue thì không push ở đây: commit được đưa vào hàng đợi để thread
+    nền push (kết quả push được ghi log ở đó).
+    """
+    result = commit_all(git_repo, MAX_FILE_SIZE_MB, push=push_queue is None, blobs=blobs)
+    for file, size in result['large']:
+        print(f"Bỏ qua file lớn: {file}")
+    for pointer in result['stored']:
+        print(f"Đã lưu file lớn vào kho, commit pointer: {pointer}")
+    if not result['committed']:
+        print("Không có file nào dưới 1MB để commit" if result['large'] else "Không có thay đổi để commit")
+        return False
+
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if push_queue is not None:
+        push_queue.add()
+        print(f"Đã commit lúc: {current_time}, chờ push nền")
+        logging.info(f"Đã commit {result['files']} file, đưa vào hàng đợi push")
+        return True
+    if result['push_code'] != 0:
+        print(f"Đã commit nhưng push lỗi (mã {result['push_code']})")
+        logging.error(f"Push lỗi với mã {result['push_code']}")
+        return False
+    print(f"Đã commit và push thành công lúc: {current_time}")
+    logging.info("Đã commit và push thành công")
+    return True
 
-def auto_git_commit():
+def auto_git_commit(use_blobs=False, blob_remote=None):
     """Tự động commit và push code lên GitHub."""
     try:
-        # Kiểm tra trạng thái git
-        status = subprocess.run(['git', 'status'], capture_output=True, text=True)
-        if 'nothing to commit' in status.stdout:
-            print("Không có thay đổi để commit")
+        git_repo = find_git_repo()
+        if not git_repo:
+            print("Không tìm thấy Git repository")
             return False
+        return _commit(git_repo, BlobStore(git_repo, blob_remote) if use_blobs else None)
 
-        # Lấy danh sách file thay đổi
-        changed_files = subprocess.run(['git', 'diff', '--name-only'], 
-                                     capture_output=True, text=True).stdout.splitlines()
-        
-        # Kiểm tra và bỏ qua các file lớn
-        for file in changed_files:
-            if os.path.exists(file) and is_large_file(file):
-                print(f"Bỏ qua file lớn: {file}")
-                subprocess.run(['git', 'reset', file])
-
-        # Lấy thời gian hiện tại
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Add các file còn lại
-        subprocess.run(['git', 'add', '.'])
-        
-        # Kiểm tra xem còn gì để commit không
-        status = subprocess.run(['git', 'status'], capture_output=True, text=True)
-        if 'nothing to commit' in status.stdout:
-            print("Không có file nào dưới 1MB để commit")
-            return False
-        
-        # Commit và push
-        commit_message = f"Auto commit at {current_time}"
-        subprocess.run(['git', 'commit', '-m', commit_message])
-        subprocess.run(['git', 'push'])
-        
-        print(f"Đã commit và push thành công lúc: {current_time}")
-        logging.info("Đã commit và push thành công")
-        return True
-        
     except Exception as e:
         print(f"Lỗi khi commit code: {e}")
         logging.error(f"Lỗi: {e}")
         return False
 
+class ChangeWatcher:
+    """Chỉ gọi git khi cây thư mục thay đổi so với lần kiểm tra trước.
+
+    Mỗi lần kiểm tra chỉ quét (path, size, mtime) trong bộ nhớ; lần đầu luôn
+    commit để bắt các thay đổi có từ trước khi daemon khởi động. Nếu commit
+    lỗi thì lần sau thử lại dù cây thư mục không đổi. Khi số commit chưa push
+    đã chạm giới hạn của push_queue thì tạm không commit (thay đổi được giữ
+    lại cho lần kiểm tra sau). Các thư mục bị ignore (.venv, node_modules,
+    build) không được quét; danh sách này được hỏi lại git mỗi khi cây thư
+    mục thay đổi, nên sửa .gitignore hay tạo thư mục ignore mới đều được thấy.
+    """
+
+    def __init__(self, git_repo, blobs=None, push_queue=None):
+        self.git_repo = git_repo
+        self.blobs = blobs
+        self.push_queue = push_queue
+        self.waiting = False
+        self.skip_names = {os.path.basename(LOG_FILE)}
+        self.ignored = None
+        self.snapshot = None
+
+    def _ignored_dirs(self):
+        try:
+            return ignored_dirs(self.git_repo)
+        except (GitError, OSError, subprocess.SubprocessError) as e:
+            # Không lấy được thì quét cả cây như trước (chậm hơn nhưng không bỏ sót)
+            logging.warning(f"Không lấy được danh sách thư mục bị ignore: {e}")
+            return set()
+
+    def tick(self):
+        if self.ignored is None:
+            self.ignored = self._ignored_dirs()
+        snapshot = tree_snapshot(self.git_repo, self.skip_names, self.ignored)
+        if snapshot == self.snapshot:
+            return False
+        ignored = self._ignored_dirs()
+        if ignored != self.ignored:
+            # .gitignore vừa đổi hoặc có thư mục ignore mới: quét lại với danh sách mới
+            self.ignored = ignored
+            snapshot = tree_snapshot(self.git_repo, self.skip_names, self.ignored)
+            if snapshot == self.snapshot:
+                return False
+        if self.push_queue is not None and not self.push_queue.has_room():
+            if not self.waiting:
+                print(f"Có {self.push_queue.unpushed} commit chưa push, tạm dừng commit")
+                logging.warning(f"Có {self.push_queue.unpushed} commit chưa push, tạm dừng commit")
+                self.waiting = True
+            return False
+        self.waiting = False
+        try:
+            _commit(self.git_repo, self.blobs, self.push_queue)
+            self.snapshot = snapshot
+        except Exception as e:
+            print(f"Lỗi khi commit code: {e}")
+            logging.error(f"Lỗi: {e}")
+            self.snapshot = None
+        return True
+
+def run_daemon(interval, use_blobs=False, blob_remote=None, max_behind=DEFAULT_MAX_BEHIND):
+    """Chạy liên tục, kiểm tra thay đổi mỗi interval giây bằng thư viện schedule.
+
+    Commit được push ở thread nền (PushQueue) nên remote chậm hoặc mất kết nối
+    không làm chậm các lần kiểm tra.
+    """
+    import schedule
+
+    git_repo = find_git_repo()
+    if not git_repo:
+        print("Không tìm thấy Git repository")
+        return False
+    push_queue = PushQueue(git_repo, max_behind).start()
+    watcher = ChangeWatcher(git_repo, BlobStore(git_repo, blob_remote) if use_blobs else None, push_queue)
+    schedule.every(interval).seconds.do(watcher.tick)
+    logging.info(f"Bắt đầu chế độ daemon cho {git_repo}, kiểm tra mỗi {interval} giây")
+    print(f"Đang theo dõi {git_repo}, kiểm tra mỗi {interval} giây (Ctrl+C để dừng)")
+    watcher.tick()
+    try:
+        while True:
+            schedule.run_pending()
+            time.sleep(max(schedule.idle_seconds() or 0, 0.1))
+    except KeyboardInterrupt:
+        unpushed = push_queue.close(push_queue.timeout)
+        if unpushed:
+            print(f"Dừng khi còn {unpushed} commit chưa push")
+        logging.info(f"Dừng chế độ daemon, còn {unpushed} commit chưa push")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Tự động commit và push các thay đổi nhỏ hơn 1MB.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Chạy liên tục và chỉ commit khi có file thay đổi")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                        help=f"Số giây giữa hai lần kiểm tra thay đổi ở chế độ daemon (mặc định {DEFAULT_INTERVAL})")
+    parser.add_argument("--blobs", action="store_true",
+                        help=f"Lưu file lớn hơn {MAX_FILE_SIZE_MB}MB vào kho file lớn (.git/blobs) và commit file pointer")
+    parser.add_argument("--blob-remote", metavar="DIR",
+                        help="Thư mục dùng làm kho file lớn chung (object được chép sang khi push)")
+    parser.add_argument("--max-behind", type=int, default=DEFAULT_MAX_BEHIND,
+                        help=f"Số commit chưa push tối đa trước khi daemon tạm dừng commit (mặc định {DEFAULT_MAX_BEHIND})")
+    args = parser.parse_args()
+    use_blobs = args.blobs or bool(args.blob_remote)
+    if args.interval <= 0:
+        parser.error("--interval phải lớn hơn 0")
+    if args.max_behind < 1:
+        parser.error("--max-behind phải lớn hơn 0")
+    if args.daemon:
+        run_daemon(args.interval, use_blobs, args.blob_remote, args.max_behind)
+    else:
+        auto_git_commit(use_blobs, args.blob_remote)
+
 if __name__ == "__main__":
-    auto_git_commit() 
\ No newline at end of file
+    main()
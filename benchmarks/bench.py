@@ -0,0 +1,328 @@
+"""Benchmark toàn bộ luồng main() của script.py trên các file MKV tổng hợp.
+
+Cách dùng:
+    python benchmarks/bench.py run [--sizes 10 100 1000] [--output results.json]
+    python benchmarks/bench.py compare old.json new.json [--threshold 10]
+
+Các file mẫu được tạo bằng nguồn lavfi của ffmpeg (audio vie đầu / vie thứ hai,
+không audio, nhiều subtitle, 720p tới 4K) rồi nhân bản thành 10/100/1000 file.
+Mỗi lần chạy main() nằm trong một process con riêng, gọi ffmpeg/ffprobe qua các
+shim trong PATH để đếm số lần spawn. Kết quả gồm thời gian, số spawn, số byte
+đọc/ghi (từ file metrics của script, chỉ có khi script.py hỗ trợ --metrics) và
+RSS lớn nhất, ghi kèm git commit để so sánh giữa các commit. Cần hệ điều hành POSIX (shim là shell script, dùng wait4).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_VERSION = 1
+TEMPLATE_DURATION = 2
+RESOLUTIONS = [(1280, 720), (1920, 1080), (3840, 2160)]
+
+# Mỗi layout: danh sách audio (language, title, channels) và subtitle (language)
+LAYOUTS = {
+    'vie_first': {'audio': [('vie', 'TM', 2), ('eng', '', 6)], 'subtitles': ['eng']},
+    'vie_second': {'audio': [('eng', '', 6), ('vie', 'LT', 2)], 'subtitles': ['vie']},
+    'no_audio': {'audio': [], 'subtitles': []},
+    'many_subtitles': {'audio': [('eng', '', 2)], 'subtitles': ['eng', 'vie', 'vie', 'chi']},
+    'english_only': {'audio': [('eng', '', 2)], 'subtitles': []},
+}
+
+SUBTITLE_TEXT = "1\n00:00:00,000 --> 00:00:01,500\nBenchmark subtitle\n"
+
+SHIM = """#!/bin/sh
+echo {name} >> "$BENCH_SPAWN_LOG"
+exec "{real}" "$@"
+"""
+
+def git_revision():
+    """Commit hiện tại của repo và cờ có thay đổi chưa commit."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def tool_version(binary):
+    try:
+        output = subprocess.run([binary, '-version'], capture_output=True, text=True).stdout
+        return output.splitlines()[0] if output else None
+    except OSError:
+        return None
+
+def template_command(ffmpeg, layout, width, height, subtitle_file, output_path):
+    """Lệnh ffmpeg tạo một file mẫu với layout và độ phân giải cho trước."""
+    spec = LAYOUTS[layout]
+    cmd = [ffmpeg, '-hide_banner', '-v', 'error', '-y',
+           '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate=5:duration={TEMPLATE_DURATION}']
+    for index, (_, _, channels) in enumerate(spec['audio']):
+        layout_name = '5.1' if channels == 6 else 'stereo'
+        cmd += ['-f', 'lavfi', '-i',
+                f'sine=frequency={440 + 110 * index}:duration={TEMPLATE_DURATION},'
+                f'aformat=channel_layouts={layout_name}']
+    for _ in spec['subtitles']:
+        cmd += ['-i', subtitle_file]
+    cmd += ['-map', '0:v']
+    for index in range(len(spec['audio'])):
+        cmd += ['-map', f'{index + 1}:a']
+    for index in range(len(spec['subtitles'])):
+        cmd += ['-map', f'{len(spec["audio"]) + index + 1}:s']
+    cmd += ['-c:v', 'mpeg4', '-q:v', '31', '-c:a', 'aac', '-b:a', '64k', '-c:s', 'srt']
+    for index, (language, title, _) in enumerate(spec['audio']):
+        cmd += [f'-metadata:s:a:{index}', f'language={language}']
+        if title:
+            cmd += [f'-metadata:s:a:{index}', f'title={title}']
+    for index, language in enumerate(spec['subtitles']):
+        cmd += [f'-metadata:s:s:{index}', f'language={language}']
+    cmd += ['-metadata', 'year=2020', output_path]
+    return cmd
+
+def build_templates(ffmpeg, template_dir):
+    """Tạo (hoặc dùng lại) các file mẫu, trả về danh sách đường dẫn theo thứ tự cố định."""
+    template_dir = os.path.join(template_dir, f'v{TEMPLATE_VERSION}')
+    os.makedirs(template_dir, exist_ok=True)
+    subtitle_file = os.path.join(template_dir, 'sample.srt')
+    with open(subtitle_file, 'w', encoding='utf-8') as f:
+        f.write(SUBTITLE_TEXT)
+    templates = []
+    for layout in LAYOUTS:
+        for width, height in RESOLUTIONS:
+            output_path = os.path.join(template_dir, f'{layout}_{height}p.mkv')
+            if not os.path.exists(output_path):
+                print(f"Generating template {os.path.basename(output_path)}...")
+                temp_path = output_path + '.tmp.mkv'
+                subprocess.run(template_command(ffmpeg, layout, width, height, subtitle_file, temp_path),
+                               check=True)
+                os.replace(temp_path, output_path)
+            templates.append(output_path)
+    return templates
+
+def populate(work_dir, templates, count):
+    """Tạo count file trong work_dir từ các file mẫu.
+
+    Mỗi bản sao được thêm vài byte ở cuối để có fingerprint khác nhau (không bị
+    coi là file trùng) mà ffmpeg vẫn đọc bình thường.
+    """
+    os.makedirs(work_dir)
+    total = 0
+    for i in range(count):
+        template = templates[i % len(templates)]
+        name = os.path.splitext(os.path.basename(template))[0]
+        path = os.path.join(work_dir, f'{i:05d}_{name}.mkv')
+        shutil.copyfile(template, path)
+        with open(path, 'ab') as f:
+            f.write(i.to_bytes(4, 'little'))
+        total += os.path.getsize(path)
+    return total
+
+def make_shims(shim_dir, ffmpeg, ffprobe):
+    os.makedirs(shim_dir, exist_ok=True)
+    for name, real in (('ffmpeg', ffmpeg), ('ffprobe', ffprobe)):
+        path = os.path.join(shim_dir, name)
+        with open(path, 'w') as f:
+            f.write(SHIM.format(name=name, real=real))
+        os.chmod(path, 0o755)
+
+def supports_metrics():
+    """script.py của commit đang đo có tham số --metrics không (commit cũ thì không)."""
+    try:
+        output = subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'script.py'), '--help'],
+                                cwd=REPO_ROOT, capture_output=True, text=True).stdout
+    except OSError:
+        return False
+    return '--metrics' in output
+
+def run_child(work_dir, shim_dir, script_args, metrics=True):
+    """Chạy script.main() trong process con, trả về số đo của lần chạy.
+
+    Không có metrics thì các số byte/file để None, chỉ còn thời gian, số spawn
+    (đếm bằng shim) và RSS.
+    """
+    spawn_log = os.path.join(work_dir, 'spawns.log')
+    metrics_file = os.path.join(work_dir, 'metrics.json')
+    rusage_file = os.path.join(work_dir, 'rusage.json')
+    open(spawn_log, 'w').close()
+    env = dict(os.environ, BENCH_SPAWN_LOG=spawn_log,
+               PATH=shim_dir + os.pathsep + os.environ.get('PATH', ''))
+    cmd = [sys.executable, os.path.abspath(__file__), 'child', rusage_file]
+    if metrics:
+        cmd += ['--metrics', metrics_file]
+    cmd += script_args
+    started = time.perf_counter()
+    with open(os.path.join(work_dir, 'output.log'), 'a', encoding='utf-8') as log:
+        process = subprocess.Popen(cmd, cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 trả về rusage của process con và các process nó đã chờ (ffmpeg, ffprobe)
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - started
+
+    with open(spawn_log) as f:
+        spawns = [line.strip() for line in f if line.strip()]
+    metrics = {}
+    if os.path.exists(metrics_file):
+        with open(metrics_file, encoding='utf-8') as f:
+            metrics = json.load(f)
+    script_rss = None
+    if os.path.exists(rusage_file):
+        with open(rusage_file) as f:
+            script_rss = json.load(f)['maxrss_kb']
+    return {
+        'exit_code': process.returncode,
+        'wall_seconds': round(wall, 3),
+        'cpu_seconds': round(rusage.ru_utime + rusage.ru_stime, 3),
+        'spawns': {'ffprobe': spawns.count('ffprobe'), 'ffmpeg': spawns.count('ffmpeg')},
+        'bytes_read': metrics.get('bytes_read'),
+        'bytes_written': metrics.get('bytes_written'),
+        'files_done': metrics.get('files_done'),
+        'files_failed': metrics.get('files_failed'),
+        'files_skipped': metrics.get('files_skipped'),
+        'stage_seconds': metrics.get('stage_seconds'),
+        'peak_rss_kb': rusage.ru_maxrss,
+        'script_peak_rss_kb': script_rss,
+    }
+
+def child_main(rusage_file, script_args):
+    """Điểm vào của process con: chạy script.main() rồi ghi RSS của chính process."""
+    import resource
+    sys.path.insert(0, REPO_ROOT)
+    import script
+    try:
+        script.main(script_args)
+    finally:
+        with open(rusage_file, 'w') as f:
+            json.dump({'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}, f)
+
+def run_benchmarks(args):
+    ffmpeg = args.ffmpeg or shutil.which('ffmpeg')
+    ffprobe = args.ffprobe or shutil.which('ffprobe')
+    if not ffmpeg or not ffprobe:
+        print("ffmpeg and ffprobe must be on PATH (or given with --ffmpeg/--ffprobe).")
+        return 1
+    templates = build_templates(ffmpeg, args.template_dir)
+    commit, dirty = git_revision()
+    metrics = supports_metrics()
+    if not metrics:
+        print("script.py has no --metrics option; recording only wall time, spawns and RSS.")
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'ffmpeg': tool_version(ffmpeg),
+        'script_args': args.script_args,
+        'metrics': metrics,
+        'runs': {},
+    }
+    base_dir = tempfile.mkdtemp(prefix='mkv-bench-', dir=args.work_dir)
+    shim_dir = os.path.join(base_dir, 'bin')
+    make_shims(shim_dir, ffmpeg, ffprobe)
+    try:
+        for size in args.sizes:
+            work_dir = os.path.join(base_dir, f'run_{size}')
+            total_bytes = populate(work_dir, templates, size)
+            print(f"Running {size} files ({total_bytes / (1024 * 1024):.1f} MB)...")
+            # Lần đầu xử lý toàn bộ, lần hai chạy lại trên cây đã xử lý (đường bỏ qua)
+            first = run_child(work_dir, shim_dir, args.script_args, metrics)
+            rerun = run_child(work_dir, shim_dir, args.script_args, metrics)
+            results['runs'][str(size)] = {'files': size, 'input_bytes': total_bytes,
+                                          'first': first, 'rerun': rerun}
+            for phase, run in (('first', first), ('rerun', rerun)):
+                read = (f"read {run['bytes_read'] / (1024 * 1024):.1f} MB, "
+                        if run['bytes_read'] is not None else "")
+                print(f"  {phase}: {run['wall_seconds']:.2f}s, "
+                      f"{run['spawns']['ffprobe']} ffprobe + {run['spawns']['ffmpeg']} ffmpeg spawns, {read}"
+                      f"peak RSS {run['peak_rss_kb'] / 1024:.1f} MB, exit {run['exit_code']}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        name = (commit or 'unknown')[:12] + ('-dirty' if dirty else '')
+        output = os.path.join(REPO_ROOT, 'benchmarks', 'results', f'{name}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+def compare(args):
+    """So sánh hai file kết quả, báo các chỉ số tăng quá threshold phần trăm.
+
+    Chỉ số thiếu ở một trong hai file (ví dụ bytes_read của commit chưa có
+    --metrics) được in là n/a và không tính là regression.
+    """
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"old: {(old.get('commit') or '?')[:12]}  new: {(new.get('commit') or '?')[:12]}")
+    regressions = 0
+    metrics = [('wall_seconds', lambda run: run['wall_seconds']),
+               ('ffprobe', lambda run: run['spawns']['ffprobe']),
+               ('ffmpeg', lambda run: run['spawns']['ffmpeg']),
+               ('bytes_read', lambda run: run['bytes_read']),
+               ('peak_rss_kb', lambda run: run['peak_rss_kb'])]
+    for size in sorted(set(old['runs']) & set(new['runs']), key=int):
+        for phase in ('first', 'rerun'):
+            old_run = old['runs'][size][phase]
+            new_run = new['runs'][size][phase]
+            for name, get in metrics:
+                before, after = get(old_run), get(new_run)
+                if before is None or after is None:
+                    print(f"{size:>6} {phase:<6} {name:<13} {before if before is not None else 'n/a':>14} -> "
+                          f"{after if after is not None else 'n/a':<14}     n/a")
+                    continue
+                change = (after - before) * 100 / before if before else (100.0 if after else 0.0)
+                flag = ''
+                if change > args.threshold:
+                    flag = '  REGRESSION'
+                    regressions += 1
+                print(f"{size:>6} {phase:<6} {name:<13} {before:>14} -> {after:<14} {change:+7.1f}%{flag}")
+    return 1 if regressions else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark script.py trên các file MKV tổng hợp.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help="Chạy benchmark và ghi kết quả JSON")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                            help="Số file của từng lần chạy, mặc định 10 100 1000")
+    run_parser.add_argument('--output', help="File kết quả, mặc định benchmarks/results/<commit>.json")
+    run_parser.add_argument('--template-dir', default=os.path.join(tempfile.gettempdir(), 'mkv-bench-templates'),
+                            help="Thư mục giữ các file mẫu (được dùng lại giữa các lần chạy)")
+    run_parser.add_argument('--work-dir', help="Thư mục tạo dữ liệu chạy, mặc định thư mục tạm")
+    run_parser.add_argument('--ffmpeg', help="Đường dẫn ffmpeg thật")
+    run_parser.add_argument('--ffprobe', help="Đường dẫn ffprobe thật")
+    run_parser.add_argument('--keep', action='store_true', help="Giữ lại thư mục chạy để xem output")
+    run_parser.add_argument('script_args', nargs='*',
+                            help="Tham số thêm cho script.py (đặt sau --), ví dụ -- -j 4")
+    compare_parser = subparsers.add_parser('compare', help="So sánh hai file kết quả")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                help="Phần trăm tăng được coi là regression, mặc định 10")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['child']:
+        child_main(argv[1], argv[2:])
+        return 0
+    args = parse_args(argv)
+    if args.command == 'run':
+        return run_benchmarks(args)
+    return compare(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
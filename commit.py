@@ -1,7 +1,15 @@
-import os
-import subprocess
 from datetime import datetime
+import os
+import sys
+import json
+import time
 import logging
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.git_utils import find_git_repo, find_git_repos, commit_all, pointer_files
+from utils.deadline import deadline
+from utils.blob_store import BlobStore
 
 logging.basicConfig(
     filename='auto_commit.log',
@@ -9,91 +17,178 @@ logging.basicConfig(
     format='%(asctime)s - %(message)s'
 )
 
-def find_git_repo():
-    """Tìm thư mục Git repository gần nhất."""
-    current = os.getcwd()
-    while current != os.path.dirname(current):  # Dừng khi lên tới thư mục gốc
-        if os.path.exists(os.path.join(current, '.git')):
-            return current
-        current = os.path.dirname(current)
-    return None
-
-def is_large_file(file_path, max_size_mb=100):
-    """Kiểm tra xem file có lớn hơn giới hạn không."""
-    try:
-        if not os.path.exists(file_path):
-            return False
-        max_size_bytes = max_size_mb * 1024 * 1024
-        return os.path.getsize(file_path) > max_size_bytes
-    except Exception as e:
-        logging.error(f"Lỗi kiểm tra kích thước file {file_path}: {e}")
-        return True
+MAX_FILE_SIZE_MB = 100
+DEFAULT_SWEEP_JOBS = 8
+DEFAULT_REPO_TIMEOUT = 300
 
-def auto_git_commit():
-    """Tự động commit và push code lên GitHub."""
+def auto_git_commit(use_blobs=False, blob_remote=None):
+    """Tự động commit và push code lên GitHub.
+
+    Với use_blobs, file lớn hơn MAX_FILE_SIZE_MB được lưu vào kho file lớn
+    (xem utils/blob_store.py) và commit file pointer thay vì bị bỏ qua.
+    """
     try:
-        # Tìm và chuyển đến thư mục Git repository
+        # Tìm Git repository (các lệnh git chạy với cwd, không chdir)
         git_repo = find_git_repo()
         if not git_repo:
             print("Không tìm thấy Git repository trong các thư mục cha.")
             return False
-        
-        os.chdir(git_repo)
         print(f"Đang làm việc trong repository: {git_repo}")
 
-        # Kiểm tra trạng thái git
-        status = subprocess.run(['git', 'status'], capture_output=True, text=True)
-        if 'nothing to commit' in status.stdout:
-            print("Không có thay đổi để commit")
+        blobs = BlobStore(git_repo, blob_remote) if use_blobs else None
+        result = commit_all(git_repo, MAX_FILE_SIZE_MB, blobs=blobs)
+        for file, size in result['large']:
+            print(f"Bỏ qua file lớn: {file} ({size / (1024 * 1024):.1f} MB)")
+        for pointer in result['stored']:
+            print(f"Đã lưu file lớn vào kho, commit pointer: {pointer}")
+        if not result['committed']:
+            print("Không có file phù hợp để commit" if result['large'] else "Không có thay đổi để commit")
             return False
 
-        # Lấy danh sách file thay đổi
-        changed_files = subprocess.run(['git', 'diff', '--name-only'], 
-                                     capture_output=True, text=True).stdout.splitlines()
-        
-        # Thêm các file chưa được track
-        untracked = subprocess.run(['git', 'ls-files', '--others', '--exclude-standard'],
-                                 capture_output=True, text=True).stdout.splitlines()
-        changed_files.extend(untracked)
-
-        # Kiểm tra và bỏ qua các file lớn
-        for file in changed_files:
-            try:
-                if not os.path.exists(file):
-                    print(f"Bỏ qua file không tồn tại: {file}")
-                    continue
-                if is_large_file(file):
-                    print(f"Bỏ qua file lớn: {file}")
-                    subprocess.run(['git', 'reset', file], capture_output=True)
-            except Exception as e:
-                print(f"Lỗi xử lý file {file}: {e}")
-                continue
-
-        # Add các file còn lại
-        subprocess.run(['git', 'add', '.'])
-        
-        # Kiểm tra lại xem còn gì để commit không
-        status = subprocess.run(['git', 'status'], capture_output=True, text=True)
-        if 'nothing to commit' in status.stdout:
-            print("Không có file phù hợp để commit")
-            return False
-        
-        # Commit và push
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        commit_message = f"Auto commit at {current_time}"
-        
-        subprocess.run(['git', 'commit', '-m', commit_message])
-        subprocess.run(['git', 'push'])
-        
-        print(f"Đã commit và push thành công lúc: {current_time}")
+        if result['push_code'] != 0:
+            print(f"Đã commit {result['files']} file nhưng push lỗi (mã {result['push_code']})")
+            logging.error(f"Push lỗi với mã {result['push_code']}")
+            return False
+        print(f"Đã commit {result['files']} file và push thành công lúc: {current_time}")
         logging.info("Đã commit và push thành công")
         return True
-        
+
     except Exception as e:
         error_msg = f"Lỗi khi commit code: {e}"
         print(error_msg)
         logging.error(error_msg)
         return False
 
+def restore_blobs(blob_remote=None, force=False):
+    """Dựng lại các file lớn từ file pointer (sau khi clone hoặc pull)."""
+    try:
+        git_repo = find_git_repo()
+        if not git_repo:
+            print("Không tìm thấy Git repository trong các thư mục cha.")
+            return False
+        blobs = BlobStore(git_repo, blob_remote)
+        pointers = pointer_files(git_repo)
+        restored = blobs.restore(pointers, force)
+        for path in restored:
+            print(f"Đã khôi phục: {path}")
+        print(f"Đã khôi phục {len(restored)}/{len(pointers)} file lớn")
+        return True
+
+    except Exception as e:
+        error_msg = f"Lỗi khi khôi phục file lớn: {e}"
+        print(error_msg)
+        logging.error(error_msg)
+        return False
+
+def commit_repo(git_repo, use_blobs=False, blob_remote=None, timeout=None):
+    """Commit và push một repo cho sweep, không in gì; trả về dict kết quả.
+
+    status là committed, clean, push failed, timeout hoặc error. Mọi lệnh git
+    của repo (kể cả push) và việc hash/chép file lớn khi có blobs phải xong
+    trong timeout giây.
+    """
+    started = time.monotonic()
+    report = {'repo': git_repo, 'status': 'clean', 'files': 0, 'large': 0, 'stored': 0,
+              'push_code': None, 'error': None}
+    try:
+        with deadline(timeout):
+            blobs = BlobStore(git_repo, blob_remote) if use_blobs else None
+            result = commit_all(git_repo, MAX_FILE_SIZE_MB, blobs=blobs)
+        report.update(files=result['files'] if result['committed'] else 0, large=len(result['large']),
+                      stored=len(result['stored']), push_code=result['push_code'])
+        if result['committed']:
+            report['status'] = 'committed' if result['push_code'] == 0 else 'push failed'
+    except subprocess.TimeoutExpired:
+        report.update(status='timeout', error=f"quá thời gian {timeout} giây")
+    except Exception as e:
+        report.update(status='error', error=str(e))
+    report['seconds'] = round(time.monotonic() - started, 3)
+    return report
+
+def sweep(repos, jobs=DEFAULT_SWEEP_JOBS, timeout=DEFAULT_REPO_TIMEOUT, use_blobs=False, blob_remote=None,
+          report_file=None):
+    """Commit và push nhiều repo song song (tối đa jobs repo cùng lúc), in một báo cáo tổng.
+
+    Phần lớn thời gian là chờ tiến trình git (đặc biệt là push qua mạng) nên
+    dùng thread; tổng thời gian xấp xỉ repo chậm nhất thay vì tổng của tất cả.
+    Trả về list kết quả theo thứ tự đường dẫn.
+    """
+    started = time.monotonic()
+    reports = []
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(repos) or 1))) as executor:
+        futures = [executor.submit(commit_repo, repo, use_blobs, blob_remote, timeout) for repo in repos]
+        for future in as_completed(futures):
+            report = future.result()
+            reports.append(report)
+            detail = report['error'] or (f"mã push {report['push_code']}" if report['status'] == 'push failed' else "")
+            print(f"[{len(reports)}/{len(repos)}] {report['status']:<12} {report['repo']} "
+                  f"({report['seconds']:.1f}s){' - ' + detail if detail else ''}")
+    reports.sort(key=lambda report: report['repo'])
+    elapsed = time.monotonic() - started
+
+    counts = {}
+    for report in reports:
+        counts[report['status']] = counts.get(report['status'], 0) + 1
+    slowest = max((report['seconds'] for report in reports), default=0)
+    print(f"Đã xử lý {len(reports)} repo trong {elapsed:.1f}s (repo chậm nhất {slowest:.1f}s): "
+          + ", ".join(f"{status} {count}" for status, count in sorted(counts.items())))
+    print(f"Tổng cộng {sum(report['files'] for report in reports)} file được commit, "
+          f"{sum(report['large'] for report in reports)} file lớn bị bỏ qua, "
+          f"{sum(report['stored'] for report in reports)} pointer file lớn")
+    for report in reports:
+        if report['status'] in ('error', 'timeout', 'push failed'):
+            logging.error(f"Sweep {report['repo']}: {report['status']} {report['error'] or report['push_code']}")
+    logging.info(f"Sweep {len(reports)} repo trong {elapsed:.1f}s: {counts}")
+    if report_file:
+        with open(report_file, "w", encoding='utf-8') as f:
+            json.dump({'created': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                       'elapsed_seconds': round(elapsed, 3), 'counts': counts, 'repos': reports},
+                      f, ensure_ascii=False, indent=2)
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description="Commit và push mọi thay đổi của repository.")
+    parser.add_argument("command", nargs="?", choices=["commit", "restore"], default="commit",
+                        help="commit (mặc định) hoặc restore: dựng lại file lớn từ file pointer")
+    parser.add_argument("--blobs", action="store_true",
+                        help=f"Lưu file lớn hơn {MAX_FILE_SIZE_MB}MB vào kho file lớn (.git/blobs) và commit file pointer")
+    parser.add_argument("--blob-remote", metavar="DIR",
+                        help="Thư mục dùng làm kho file lớn chung (object được chép sang khi push, lấy về khi restore)")
+    parser.add_argument("--force", action="store_true", help="restore: ghi lại cả file đang khớp pointer")
+    parser.add_argument("--sweep", metavar="ROOT",
+                        help="Commit và push song song mọi repository nằm dưới thư mục ROOT")
+    parser.add_argument("--repos", nargs="+", metavar="REPO",
+                        help="Commit và push song song các repository này (dùng thay hoặc cùng --sweep)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_SWEEP_JOBS,
+                        help=f"Số repository xử lý cùng lúc khi sweep (mặc định {DEFAULT_SWEEP_JOBS})")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_REPO_TIMEOUT,
+                        help=f"Thời gian tối đa (giây) cho mỗi repository khi sweep, 0 là không giới hạn "
+                             f"(mặc định {DEFAULT_REPO_TIMEOUT})")
+    parser.add_argument("--report", metavar="FILE", help="Ghi báo cáo sweep ra file JSON")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs phải lớn hơn 0")
+    if args.sweep or args.repos:
+        if args.command == "restore":
+            parser.error("restore không dùng được với --sweep/--repos")
+        repos = find_git_repos(args.sweep) if args.sweep else []
+        for repo in args.repos or []:
+            if not os.path.exists(os.path.join(repo, '.git')):
+                parser.error(f"{repo} không phải Git repository")
+            repos.append(os.path.abspath(repo))
+        repos = sorted(set(repos))
+        if not repos:
+            print("Không tìm thấy Git repository nào")
+            return
+        reports = sweep(repos, args.jobs, args.timeout or None, args.blobs or bool(args.blob_remote),
+                        args.blob_remote, args.report)
+        if any(report['status'] in ('error', 'timeout', 'push failed') for report in reports):
+            sys.exit(1)
+    elif args.command == "restore":
+        restore_blobs(args.blob_remote, args.force)
+    else:
+        auto_git_commit(args.blobs or bool(args.blob_remote), args.blob_remote)
+
 if __name__ == "__main__":
-    auto_git_commit() 
\ No newline at end of file
+    main()
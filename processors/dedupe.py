@@ -0,0 +1,116 @@
+import os
+import json
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from utils.ffmpeg_utils import probe_media
+from utils.file_utils import get_file_fingerprint
+
+DEDUPE_VERSION = 1
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_SIZE = 64 * 1024
+# Bỏ qua phần đầu/cuối file khi lấy mẫu: header, tag và cue thay đổi khi sửa
+# metadata tại chỗ (mkvpropedit) nhưng dữ liệu video/audio ở giữa vẫn giữ nguyên
+SAMPLE_SKIP = 1024 * 1024
+
+def layout_key(media):
+    """Khóa nhóm ứng viên trùng: thời lượng (giây), độ phân giải và bố cục track.
+
+    Chỉ dùng thông tin đã probe (thường có sẵn trong cache) nên không đọc thêm dữ liệu.
+    """
+    try:
+        duration = round(float(media.duration))
+    except (TypeError, ValueError):
+        duration = None
+    audio = tuple((track[1], track[2], track[4]) for track in media.audio_tracks)
+    subtitles = tuple((track[1], track[3]) for track in media.subtitle_tracks)
+    return duration, media.resolution_label, audio, subtitles
+
+def sample_hash(file_path):
+    """Fingerprint lấy mẫu SAMPLE_BLOCKS block ở phần giữa file (bỏ qua header và phần cuối)."""
+    return get_file_fingerprint(file_path, SAMPLE_BLOCK_SIZE, SAMPLE_BLOCKS - 2, SAMPLE_SKIP)
+
+def _keep_order(path, state):
+    """Thứ tự chọn bản giữ lại: file đã xử lý (có trong state) trước, rồi theo đường dẫn."""
+    processed = state.find_by_name(os.path.basename(path)) if state is not None else None
+    return (processed is None, path)
+
+def find_duplicates(file_paths, cache=None, state=None, jobs=4, ebml=True):
+    """Tìm file trùng trong toàn bộ thư viện, trả về (số file đã probe, các nhóm).
+
+    Bước 1 nhóm ứng viên theo layout_key từ kết quả probe; bước 2 chỉ đọc mẫu
+    các file nằm trong nhóm có từ hai file trở lên (cùng size) để xác nhận bản
+    copy. Mỗi nhóm gồm: files (mọi file cùng layout) và copies (các bộ file có
+    cùng nội dung, mỗi bộ có keep và duplicates).
+    """
+    file_paths = [os.path.abspath(file_path) for file_path in file_paths]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        medias = [media for media in executor.map(
+            lambda file_path: probe_media(file_path, cache, False, ebml), file_paths) if media is not None]
+
+        candidates = {}
+        for media in medias:
+            candidates.setdefault(layout_key(media), []).append(media)
+        candidates = [group for group in candidates.values() if len(group) > 1]
+
+        # Chỉ file có cùng size với một file khác trong nhóm mới có thể là bản copy
+        to_hash = []
+        for group in candidates:
+            sizes = {}
+            for media in group:
+                sizes.setdefault(media.size, []).append(media.path)
+            to_hash += [path for paths in sizes.values() if len(paths) > 1 for path in paths]
+        hashes = dict(zip(to_hash, executor.map(sample_hash, to_hash)))
+
+    groups = []
+    for group in candidates:
+        by_hash = {}
+        for media in group:
+            if media.path in hashes:
+                by_hash.setdefault(hashes[media.path], []).append(media)
+        copies = []
+        for same in by_hash.values():
+            if len(same) > 1:
+                paths = sorted((media.path for media in same), key=lambda path: _keep_order(path, state))
+                copies.append({'keep': paths[0], 'duplicates': paths[1:], 'size': same[0].size})
+        duration, resolution, audio, subtitles = layout_key(group[0])
+        groups.append({
+            'duration': duration,
+            'resolution': resolution,
+            'audio': [list(track) for track in audio],
+            'subtitles': [list(track) for track in subtitles],
+            'files': sorted(media.path for media in group),
+            'copies': copies,
+        })
+    groups.sort(key=lambda group: group['files'][0])
+    return len(medias), groups
+
+def write_report(report_file, scanned, groups):
+    """Ghi kết quả dedupe ra file JSON, kèm tổng số file và dung lượng trùng."""
+    duplicates = [(path, copy['size']) for group in groups for copy in group['copies']
+                  for path in copy['duplicates']]
+    report = {
+        'version': DEDUPE_VERSION,
+        'created': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'scanned': scanned,
+        'totals': {
+            'candidate_groups': len(groups),
+            'candidate_files': sum(len(group['files']) for group in groups),
+            'duplicates': len(duplicates),
+            'duplicate_bytes': sum(size for _, size in duplicates),
+        },
+        'groups': groups,
+    }
+    temp_file = report_file + ".tmp"
+    with open(temp_file, "w", encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file, report_file)
+    return report
+
+def load_duplicates(report_file):
+    """Đọc file dedupe, trả về dict {đường dẫn file trùng: đường dẫn bản giữ lại}."""
+    with open(report_file, "r", encoding='utf-8') as f:
+        report = json.load(f)
+    if report.get('version') != DEDUPE_VERSION:
+        raise ValueError(f"Unsupported dedupe report version {report.get('version')} in {report_file}")
+    return {path: copy['keep'] for group in report['groups'] for copy in group['copies']
+            for path in copy['duplicates']}
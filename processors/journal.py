@@ -0,0 +1,62 @@
+import os
+from utils.file_utils import partial_path, get_file_fingerprint
+from utils.mkv_utils import write_region
+
+def restore_header(source, in_place):
+    """Ghi lại byte gốc của header đã lưu trong journal trước khi sửa tại chỗ."""
+    try:
+        if os.path.getsize(source) != in_place['size']:
+            print(f"Not restoring the header of {source}: file size changed since the interrupted edit.")
+            return
+        write_region(source, in_place['offset'], bytes.fromhex(in_place['original']))
+        print(f"Restored the original header of {source} (interrupted in-place edit).")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Error restoring the original header of {source}: {e}")
+
+def recover(state):
+    """Xử lý các job bị ngắt giữa chừng ở lần chạy trước (mất điện, kill...).
+
+    File output chỉ xuất hiện khi ffmpeg đã chạy xong (xem run_single_pass), nên
+    chỉ cần xóa các file .partial còn sót. Nếu file gốc đã được đổi tên nhưng
+    bản ghi chưa kịp lưu thì ghi bù (roll forward); còn lại job được đóng và
+    file gốc sẽ được xử lý lại ở lần quét này. Header bị sửa tại chỗ (--in-place)
+    của job chưa đổi tên được ghi lại byte gốc, kể cả khi lần ghi bị ngắt giữa
+    chừng. Trả về số job đã xử lý.
+    """
+    jobs = state.pending_jobs()
+    for job in jobs:
+        source = job['source']
+        name = os.path.basename(source)
+        outputs = list(job['outputs']['subtitles'])
+        if job['outputs']['remux']:
+            outputs.append(job['outputs']['remux'])
+        for output_path in outputs:
+            temp_path = partial_path(output_path)
+            try:
+                os.remove(temp_path)
+                print(f"Removed incomplete output {temp_path}.")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error removing incomplete output {temp_path}: {e}")
+
+        records = []
+        signature = job['signature']
+        in_place = job['outputs'].get('in_place')
+        renamed_path = job['rename_to'] and os.path.join(os.path.dirname(source), job['rename_to'])
+        if renamed_path and os.path.exists(renamed_path) and not os.path.exists(source):
+            records = [(name, os.path.basename(output_path)) for output_path in job['outputs']['subtitles']
+                       if os.path.exists(output_path)]
+            records.append((name, job['rename_to']))
+            if in_place and signature.startswith('fp1:'):
+                # File chỉ được đổi tên sau khi sửa header xong: fingerprint đã khác lúc ghi journal
+                signature = get_file_fingerprint(renamed_path)
+            print(f"Recovered interrupted job: {name} was already renamed to {job['rename_to']}.")
+        else:
+            if in_place:
+                restore_header(source, in_place)
+            print(f"Interrupted job for {source} (started {job['started']}) will be processed again.")
+        state.finish_job(job['id'], records, signature)
+    return len(jobs)
@@ -0,0 +1,440 @@
+import os
+import sys
+import time
+import heapq
+import asyncio
+from processors.video import decide, run_single_pass, rename_source, prepare_default_audio, apply_default_audio
+from processors.plan import has_work, plan_entry, pending_steps
+from utils.ffmpeg_utils import probe_media_async
+from utils.file_utils import CapturedOutput, get_file_fingerprint
+from utils.progress import Progress
+from utils.profiling import new_record, attach, add_time, timed
+
+class Job:
+    """Một file đi qua pipeline, kèm kết quả của từng bước và output cần in.
+
+    pending chỉ dùng khi chạy từ plan: (action còn phải làm, kết quả đã có sẵn).
+    journal là id của job trong journal của StateStore (None nếu chưa ghi).
+    record là bản ghi profiling của file (thời gian từng bước, số tiến trình con).
+    """
+    __slots__ = ('seq', 'path', 'media', 'action', 'pending', 'results', 'report', 'journal', 'record')
+
+    def __init__(self, seq, path):
+        self.seq = seq
+        self.path = path
+        self.media = None
+        self.action = None
+        self.pending = None
+        self.results = None
+        self.report = []
+        self.journal = None
+        self.record = new_record(path)
+
+    def __lt__(self, other):
+        return self.seq < other.seq
+
+class Pipeline:
+    """Pipeline nhiều bước: discover -> probe -> decide -> process -> finalize.
+
+    Mỗi bước có queue giới hạn kích thước và số worker riêng, nên probe của các
+    file sau chạy chồng lên remux của các file trước, còn bộ nhớ không tăng theo
+    số file trong folder (discover bị chặn lại khi queue phía sau đã đầy).
+    decide và finalize chạy một worker, xử lý file theo đúng thứ tự discover để
+    kết quả kiểm tra trùng lặp và output luôn cố định; số file đang nằm trong
+    pipeline bị giới hạn bởi window nên phần chờ sắp xếp lại cũng không phình ra.
+    plan() chỉ chạy tới bước decide và trả về các việc sẽ làm; apply() chạy
+    process -> finalize cho các việc đó.
+    """
+
+    def __init__(self, state, cache=None, vn_folder="Lồng Tiếng - Thuyết Minh",
+                 original_folder="Original", jobs=1, probe_jobs=4, fingerprint=True,
+                 queue_size=None, window=1024, progress=None, ebml=True, scheduler=None,
+                 duplicates=None, verify=False, transcode_rules=None, cpu_budget=None, in_place=False,
+                 profiler=None):
+        self.state = state
+        self.cache = cache
+        self.vn_folder = vn_folder
+        self.original_folder = original_folder
+        self.jobs = max(1, jobs)
+        self.probe_jobs = max(1, probe_jobs)
+        self.fingerprint = fingerprint
+        self.ebml = ebml
+        self.queue_size = queue_size or 2 * max(self.jobs, self.probe_jobs)
+        self.scheduler = scheduler
+        # {file trùng: bản giữ lại} từ file dedupe, các file này được bỏ qua ngay từ đầu
+        self.duplicates = duplicates or {}
+        self.verify = verify
+        self.transcode_rules = transcode_rules
+        self.cpu_budget = cpu_budget
+        self.in_place = in_place
+        self.profiler = profiler
+        # Có scheduler thì bước process nhận thêm job để chờ sẵn: job của ổ đang bận
+        # không chặn job của ổ khác, còn số ffmpeg chạy thật do scheduler giới hạn
+        self.process_workers = self.jobs if scheduler is None else self.jobs + self.queue_size
+        self.window = max(window, self.queue_size * 4 + self.process_workers + self.probe_jobs)
+        self._in_flight = None
+        self.claimed = {}
+        self.output = None
+        self.progress = progress
+        self.discovered_count = 0
+        self.processed_count = 0
+        self.bytes_read = 0
+
+    def _print(self, job, func, *args):
+        result, text = self.output.capture(func, *args)
+        job.report.append(text)
+        return result
+
+    async def _print_async(self, job, func, *args):
+        result, text = await self.output.capture_async(func, *args)
+        job.report.append(text)
+        return result
+
+    async def _stage(self, worker, in_queue, out_queue, concurrency):
+        """Chạy một bước với concurrency worker, đọc in_queue và ghi ra out_queue.
+
+        Mỗi worker kết thúc khi nhận None và chuyển tiếp một None cho bước sau.
+        """
+        async def run():
+            while True:
+                job = await in_queue.get()
+                if job is None:
+                    await out_queue.put(None)
+                    return
+                try:
+                    await worker(job)
+                except Exception as e:
+                    job.report.append(f"Exception while processing {job.path}: {e}\n")
+                    job.action = None
+                    job.results = None
+                    self.progress.count('files_failed')
+                await out_queue.put(job)
+        await asyncio.gather(*(run() for _ in range(concurrency)))
+
+    async def _ordered(self, in_queue, producers):
+        """Đọc job từ in_queue và trả về theo đúng thứ tự seq."""
+        pending = []
+        next_seq = 0
+        finished = 0
+        while finished < producers:
+            job = await in_queue.get()
+            if job is None:
+                finished += 1
+                continue
+            heapq.heappush(pending, job)
+            while pending and pending[0].seq == next_seq:
+                next_seq += 1
+                yield heapq.heappop(pending)
+
+    async def _probe(self, job):
+        mkv_file = os.path.basename(job.path)
+        print(f"Processing file: {job.path}")
+
+        keep = self.duplicates.get(os.path.abspath(job.path))
+        if keep is not None:
+            print(f"File {mkv_file} is a duplicate of {keep}. Skipping.")
+            self.progress.count('files_skipped')
+            return
+
+        # Kiểm tra tên trước để file đã xử lý không tốn lần probe nào
+        processed = self.state.find_by_name(mkv_file)
+        if processed:
+            print(f"File {mkv_file} was processed as {processed['new_name']} on {processed['time']}. Skipping.")
+            self.progress.count('files_skipped')
+            return
+
+        # Đọc thông tin file một lần duy nhất, các bước sau chỉ dùng MediaInfo
+        job.media = await probe_media_async(job.path, self.cache, self.fingerprint, self.ebml)
+
+    def _decide(self, job):
+        media = job.media
+        # So cả fingerprint lẫn chữ ký cũ để bản ghi trong log cũ vẫn khớp
+        processed = self.state.find_by_signature(media.fingerprint) or self.state.find_by_signature(media.signature)
+        if processed:
+            print(f"File {media.name} has same content as processed file {processed['new_name']}. Skipping.")
+            self.progress.count('files_skipped')
+            return
+        signature = media.content_signature
+        if signature in self.claimed:
+            print(f"File {media.name} has same content as {self.claimed[signature]} in this run. Skipping.")
+            self.progress.count('files_skipped')
+            return
+        self.claimed[signature] = media.name
+        job.action = decide(media, self.vn_folder, self.original_folder, self.transcode_rules)
+
+    async def _process(self, job):
+        """Tách subtitle và remux trong một lần ffmpeg, chưa đổi tên hay ghi log."""
+        action, done = job.pending or (job.action, None)
+        in_place = None
+        if self.in_place and action['remux'] and not action['remux'].get('transcode'):
+            # Chỉ đặt track tiếng Việt làm mặc định trong header, không ghi file video mới
+            with timed('in_place'):
+                in_place = await asyncio.to_thread(prepare_default_audio, job.media)
+            if in_place is not None:
+                action = dict(action, remux=None)
+        edit = in_place[1] if in_place else None
+        outputs = [output_path for _, output_path in action['subtitles']]
+        if action['remux']:
+            outputs.append(action['remux']['output_path'])
+        if outputs or edit:
+            # Ghi journal trước khi chạy ffmpeg hay sửa header để lần chạy sau biết job bị
+            # ngắt giữa chừng (và ghi lại được byte gốc của header)
+            job.journal = await asyncio.to_thread(self._begin_job, job, action, edit)
+        transcode = action['remux'] and action['remux'].get('transcode')
+        if self.cpu_budget is not None and transcode:
+            # Chờ CPU trước khi giữ slot của ổ đĩa để job copy trên cùng ổ không phải chờ theo
+            async with self.cpu_budget.slot(transcode['threads']):
+                results = await self._run_on_device(job, action, outputs, in_place)
+        else:
+            results = await self._run_on_device(job, action, outputs, in_place)
+        if done is not None:
+            # Gộp các bước đã làm từ lần apply trước để finalize ghi log và đổi tên như bình thường
+            results['subtitles'] = done['subtitles'] + results['subtitles']
+            if done['remux']:
+                results['remux'] = True
+        job.results = results
+        if results['bytes_read']:
+            self.bytes_read += results['bytes_read']
+
+    async def _run_on_device(self, job, action, outputs, in_place=None):
+        """Chạy phần ghi đĩa của job (sửa header tại chỗ, ffmpeg) trong slot của scheduler."""
+        if in_place and in_place[1]:
+            # Sửa header là ghi vào chính file gốc
+            outputs = outputs + [job.media.path]
+        if self.scheduler is not None and outputs:
+            async with self.scheduler.slot(job.media.path, outputs):
+                return await self._run_device_work(job, action, in_place)
+        return await self._run_device_work(job, action, in_place)
+
+    async def _run_device_work(self, job, action, in_place):
+        edited = None
+        if in_place:
+            edited = True
+            if in_place[1]:
+                with timed('in_place'):
+                    edited = await asyncio.to_thread(self._apply_in_place, job.media, *in_place)
+        results = await self._run_single_pass(job, action)
+        if edited is not None:
+            results['remux'] = edited
+        return results
+
+    def _apply_in_place(self, media, track, edit):
+        """Sửa header file gốc, rồi tính lại fingerprint và bỏ cache probe cũ của file."""
+        if not apply_default_audio(media, track, edit):
+            return False
+        if self.cache is not None:
+            self.cache.invalidate([media.path])
+        if media.fingerprint:
+            # Header nằm trong block đầu mà fingerprint lấy mẫu, bản ghi phải dùng fingerprint mới
+            media.fingerprint = get_file_fingerprint(media.path)
+        return True
+
+    async def _run_single_pass(self, job, action):
+        progress = self.progress
+        progress.start(job.seq, job.media)
+        results = None
+        try:
+            results = await run_single_pass(job.media, action,
+                                            lambda block: progress.update(job.seq, block), self.verify)
+        finally:
+            # Exception đã được _stage tính là lỗi, ở đây chỉ tính ffmpeg chạy lỗi
+            failed = results is not None and (results['remux'] is False or (
+                len(results['subtitles']) < len(action['subtitles'])))
+            progress.finish(job.seq, results and results['bytes_read'],
+                            results and results['bytes_written'], failed)
+        return results
+
+    def _begin_job(self, job, action=None, edit=None):
+        """Ghi job vào journal với các output của action (mặc định job.action).
+
+        edit là việc sửa header tại chỗ (vị trí, byte gốc, byte mới): byte gốc
+        được lưu để journal.recover ghi lại nếu job bị ngắt.
+        """
+        action = action or job.action
+        outputs = {'subtitles': [output_path for _, output_path in action['subtitles']],
+                   'remux': action['remux']['output_path'] if action['remux'] else None}
+        if edit is not None:
+            offset, original, _ = edit
+            outputs['in_place'] = {'offset': offset, 'original': original.hex(), 'size': job.media.size}
+        return self.state.begin_job(job.media.path, action['rename'], job.media.content_signature, outputs)
+
+    def _finalize(self, job):
+        """Đổi tên file gốc và ghi trạng thái, luôn chạy tuần tự.
+
+        Các bản ghi của một file được ghi cùng lúc với việc đóng job trong
+        journal (một commit), sau khi đã đổi tên file gốc.
+        """
+        media = job.media
+        records = [(media.name, os.path.basename(output_path)) for output_path in job.results['subtitles']]
+        action = job.action
+        new_name = None
+        if action['remux'] is None and action['rename']:
+            print(f"No Vietnamese subtitle and audio found. Renaming file...")
+            new_name = action['rename']
+        elif job.results['remux'] and action['rename']:
+            new_name = action['rename']
+        if new_name:
+            if job.journal is None:
+                job.journal = self._begin_job(job)
+            with timed('rename'):
+                new_path = rename_source(media, new_name)
+            # Không có gì để tách thì vẫn ghi lại (kể cả khi đổi tên lỗi) để lần sau không probe lại
+            if new_path != media.path or action['remux'] is None:
+                records.append((media.name, os.path.basename(new_path)))
+        with timed('state'):
+            if job.journal is not None:
+                self.state.finish_job(job.journal, records, media.content_signature)
+            else:
+                for old_name, new_name in records:
+                    self.state.record(old_name, new_name, media.content_signature)
+        self.processed_count += 1
+        self.progress.count('files_done')
+
+    async def _discover(self, file_paths, out_queue):
+        # Việc duyệt thư mục (stat/scandir trên NAS) chạy trong thread để không chặn event loop.
+        # file_paths cũng có thể là async iterator (chế độ watch), khi đó đọc trực tiếp.
+        is_async = hasattr(file_paths, '__aiter__')
+        iterator = aiter(file_paths) if is_async else iter(file_paths)
+        seq = 0
+        while True:
+            await self._in_flight.acquire()
+            if is_async:
+                file_path = await anext(iterator, None)
+            else:
+                file_path = await asyncio.to_thread(next, iterator, None)
+            if file_path is None:
+                self._in_flight.release()
+                break
+            await out_queue.put(Job(seq, file_path))
+            seq += 1
+        self.discovered_count = seq
+        for _ in range(self.probe_jobs):
+            await out_queue.put(None)
+
+    async def _timed(self, job, stage, func, *args):
+        """Chạy func, cộng thời gian vào stage (của cả lần chạy và của file job)."""
+        started = time.perf_counter()
+        with attach(job.record):
+            try:
+                return await func(*args)
+            finally:
+                seconds = time.perf_counter() - started
+                self.progress.add_stage_time(stage, seconds)
+                add_time(stage, seconds)
+
+    def _done(self, job):
+        """In output của job và trả lại chỗ trong window khi job ra khỏi pipeline."""
+        self.progress.write(''.join(job.report))
+        if self.profiler is not None:
+            self.profiler.finish(job.record, job.results)
+        self._in_flight.release()
+
+    async def _probe_worker(self, job):
+        await self._timed(job, 'probe', self._print_async, job, self._probe, job)
+
+    async def _decide_stage(self, in_queue, out_queue):
+        async for job in self._ordered(in_queue, self.probe_jobs):
+            if job.media is not None:
+                started = time.perf_counter()
+                with attach(job.record):
+                    self._print(job, self._decide, job)
+                    seconds = time.perf_counter() - started
+                    self.progress.add_stage_time('decide', seconds)
+                    add_time('decide', seconds)
+            await out_queue.put(job)
+        for _ in range(self.process_workers):
+            await out_queue.put(None)
+
+    async def _process_worker(self, job):
+        if job.action is not None:
+            await self._timed(job, 'process', self._print_async, job, self._process, job)
+
+    async def _finalize_stage(self, in_queue):
+        async for job in self._ordered(in_queue, self.process_workers):
+            if job.results is not None:
+                await self._timed(job, 'finalize', self._print_async, job, asyncio.to_thread, self._finalize, job)
+            self._done(job)
+
+    async def _collect_stage(self, in_queue, entries):
+        """Bước cuối của plan: gom các file có việc cần làm thành mục của plan."""
+        finished = 0
+        while finished < self.process_workers:
+            job = await in_queue.get()
+            if job is None:
+                finished += 1
+                continue
+            if has_work(job.action):
+                entries.append(await asyncio.to_thread(plan_entry, job.media, job.action))
+            self._done(job)
+
+    async def _feed_plan(self, entries, out_queue):
+        """Đưa các mục của plan vào bước process, bỏ qua các bước đã làm."""
+        for seq, entry in enumerate(entries):
+            await self._in_flight.acquire()
+            job = Job(seq, entry['path'])
+            prepared = await self._print_async(job, asyncio.to_thread, pending_steps, entry, self.state)
+            if prepared is not None:
+                job.media, job.action, todo, done = prepared
+                job.pending = (todo, done)
+            await out_queue.put(job)
+        self.discovered_count = len(entries)
+        for _ in range(self.process_workers):
+            await out_queue.put(None)
+
+    async def _execute(self, make_stages):
+        """Chạy các bước do make_stages() tạo ra, output được gom theo từng file."""
+        previous_stdout = sys.stdout
+        if not isinstance(sys.stdout, CapturedOutput):
+            sys.stdout = CapturedOutput(sys.stdout)
+        self.output = sys.stdout
+        if self.progress is None:
+            self.progress = Progress(self.output.stream)
+        self._in_flight = asyncio.Semaphore(self.window)
+        try:
+            await asyncio.gather(*make_stages())
+        finally:
+            self.progress.close()
+            sys.stdout = previous_stdout
+
+    def _front_stages(self, file_paths, out_queue):
+        """discover -> probe -> decide, kết quả của decide được đưa vào out_queue."""
+        probe_queue = asyncio.Queue(self.queue_size)
+        decide_queue = asyncio.Queue(self.queue_size)
+        return [self._discover(file_paths, probe_queue),
+                self._stage(self._probe_worker, probe_queue, decide_queue, self.probe_jobs),
+                self._decide_stage(decide_queue, out_queue)]
+
+    def _back_stages(self, in_queue):
+        """process -> finalize cho các job đọc từ in_queue."""
+        finalize_queue = asyncio.Queue(self.queue_size)
+        return [self._stage(self._process_worker, in_queue, finalize_queue, self.process_workers),
+                self._finalize_stage(finalize_queue)]
+
+    async def run(self, file_paths):
+        """Chạy toàn bộ pipeline cho các file trong file_paths (iterator hoặc async iterator)."""
+        def stages():
+            process_queue = asyncio.Queue(self.queue_size)
+            return self._front_stages(file_paths, process_queue) + self._back_stages(process_queue)
+        await self._execute(stages)
+        return self.processed_count
+
+    async def plan(self, file_paths):
+        """Chỉ probe và quyết định (không chạy ffmpeg, không đổi tên), trả về các mục của plan."""
+        entries = []
+        def stages():
+            collect_queue = asyncio.Queue(self.queue_size)
+            return self._front_stages(file_paths, collect_queue) + [self._collect_stage(collect_queue, entries)]
+        await self._execute(stages)
+        return entries
+
+    async def apply(self, entries):
+        """Thực hiện các mục của plan với self.jobs file song song.
+
+        File lớn được chạy trước để các worker kết thúc gần cùng lúc.
+        """
+        entries = sorted(entries, key=lambda entry: entry['estimated_bytes_read'], reverse=True)
+        def stages():
+            process_queue = asyncio.Queue(self.queue_size)
+            return [self._feed_plan(entries, process_queue)] + self._back_stages(process_queue)
+        await self._execute(stages)
+        return self.processed_count
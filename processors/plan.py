@@ -0,0 +1,127 @@
+import os
+import json
+import datetime
+from utils.ffmpeg_utils import MediaInfo
+
+PLAN_VERSION = 1
+
+def estimate_bytes(media, action):
+    """Ước tính số byte sẽ đọc và ghi cho action, trả về (bytes_read, bytes_written).
+
+    ffmpeg đọc toàn bộ file nguồn một lần nếu có subtitle hoặc remux. Số byte
+    ghi của remux lấy bằng kích thước file nguồn (cận trên: video + một audio),
+    subtitle được coi là không đáng kể; đổi tên không đọc/ghi dữ liệu.
+    """
+    if not action['subtitles'] and not action['remux']:
+        return 0, 0
+    return media.size, media.size if action['remux'] else 0
+
+def has_work(action):
+    return action is not None and bool(action['subtitles'] or action['remux'] or action['rename'])
+
+def plan_entry(media, action, st=None):
+    """Chuyển (MediaInfo, action) thành một mục JSON của plan."""
+    if st is None:
+        st = os.stat(media.path)
+    bytes_read, bytes_written = estimate_bytes(media, action)
+    remux = None
+    if action['remux']:
+        remux = {'track': list(action['remux']['track']), 'output': action['remux']['output_path'],
+                 'transcode': action['remux'].get('transcode')}
+    return {
+        'path': media.path,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'media': json.loads(media.to_json()),
+        'subtitles': [{'track': list(subtitle_info), 'output': output_path}
+                      for subtitle_info, output_path in action['subtitles']],
+        'remux': remux,
+        'rename': action['rename'],
+        'estimated_bytes_read': bytes_read,
+        'estimated_bytes_written': bytes_written,
+    }
+
+def entry_action(entry):
+    """Tạo lại (MediaInfo, action) từ một mục của plan."""
+    media = MediaInfo.from_json(entry['path'], json.dumps(entry['media']))
+    action = {'subtitles': [(tuple(subtitle['track']), subtitle['output']) for subtitle in entry['subtitles']],
+              'remux': None, 'rename': entry['rename']}
+    if entry['remux']:
+        action['remux'] = {'track': tuple(entry['remux']['track']), 'output_path': entry['remux']['output'],
+                           'transcode': entry['remux'].get('transcode')}
+    return media, action
+
+def write_plan(plan_file, entries, discovered_count, settings):
+    """Ghi plan ra file JSON, kèm tổng số byte ước tính."""
+    plan = {
+        'version': PLAN_VERSION,
+        'created': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'settings': settings,
+        'discovered': discovered_count,
+        'totals': {
+            'files': len(entries),
+            'subtitles': sum(len(entry['subtitles']) for entry in entries),
+            'remux': sum(1 for entry in entries if entry['remux']),
+            'renames': sum(1 for entry in entries if entry['rename']),
+            'estimated_bytes_read': sum(entry['estimated_bytes_read'] for entry in entries),
+            'estimated_bytes_written': sum(entry['estimated_bytes_written'] for entry in entries),
+        },
+        'files': entries,
+    }
+    temp_file = plan_file + ".tmp"
+    with open(temp_file, "w", encoding='utf-8') as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(temp_file, plan_file)
+    return plan
+
+def load_plan(plan_file):
+    with open(plan_file, "r", encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan version {plan.get('version')} in {plan_file}")
+    return plan
+
+def _output_done(path):
+    try:
+        return os.path.getsize(path) > 0
+    except OSError:
+        return False
+
+def pending_steps(entry, state):
+    """Kiểm tra các bước của một mục plan đã làm chưa.
+
+    Trả về (media, action, action_cần_làm, kết_quả_đã_có) hoặc None nếu bỏ qua
+    cả mục (đã xử lý xong, hoặc file nguồn đã thay đổi/mất từ lúc lập plan).
+    """
+    path = entry['path']
+    name = os.path.basename(path)
+    print(f"Processing file: {path}")
+    if not os.path.exists(path):
+        if entry['rename'] and os.path.exists(os.path.join(os.path.dirname(path), entry['rename'])):
+            print(f"File {name} was already renamed to {entry['rename']}. Skipping.")
+        else:
+            print(f"File {path} no longer exists. Skipping.")
+        return None
+    st = os.stat(path)
+    if st.st_size != entry['size'] or st.st_mtime_ns != entry['mtime_ns']:
+        print(f"File {path} changed since the plan was created. Skipping (run plan again).")
+        return None
+    processed = state.find_by_name(name)
+    if processed:
+        print(f"File {name} was processed as {processed['new_name']} on {processed['time']}. Skipping.")
+        return None
+
+    media, action = entry_action(entry)
+    done = {'subtitles': [], 'remux': None}
+    todo = {'subtitles': [], 'remux': action['remux'], 'rename': action['rename']}
+    for subtitle_info, output_path in action['subtitles']:
+        if _output_done(output_path):
+            print(f"Subtitle {output_path} already exists. Skipping extraction.")
+            done['subtitles'].append(output_path)
+        else:
+            todo['subtitles'].append((subtitle_info, output_path))
+    if action['remux'] and _output_done(action['remux']['output_path']):
+        print(f"Video {action['remux']['output_path']} already exists. Skipping remux.")
+        done['remux'] = True
+        todo['remux'] = None
+    return media, action, todo, done
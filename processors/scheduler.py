@@ -0,0 +1,156 @@
+import os
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+def existing_path(path):
+    """Thư mục cha gần nhất đã tồn tại của path (dùng để biết output sẽ nằm trên ổ nào)."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+def is_rotational(device):
+    """Ổ đĩa có phải HDD không: True/False, None nếu không xác định được (Windows, ổ mạng...)."""
+    if not hasattr(os, 'major'):
+        return None
+    sys_path = f"/sys/dev/block/{os.major(device)}:{os.minor(device)}"
+    if not os.path.exists(sys_path):
+        return None
+    real_path = os.path.realpath(sys_path)
+    # Với phân vùng (sda1), thông tin queue nằm ở thiết bị cha (sda)
+    for candidate in (real_path, os.path.dirname(real_path)):
+        try:
+            with open(os.path.join(candidate, 'queue', 'rotational')) as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return None
+
+class _Device:
+    __slots__ = ('limit', 'active', 'waiting')
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = []
+
+class DeviceScheduler:
+    """Giới hạn số job ffmpeg chạy đồng thời trên mỗi ổ đĩa (theo st_dev).
+
+    Mỗi job giữ một slot trên ổ chứa file nguồn và một slot trên mỗi ổ chứa
+    output (cùng ổ thì chỉ tính một lần). HDD mặc định chỉ chạy hdd_jobs job
+    để đầu đọc không phải nhảy qua lại giữa nhiều file, SSD (và ổ không xác
+    định được) chạy ssd_jobs job; device_limits cho phép đặt riêng theo đường dẫn.
+    Các job đang chờ cùng một ổ được chạy theo thứ tự (thư mục, inode), còn
+    tổng số job chạy cùng lúc trên mọi ổ không vượt quá total_jobs.
+    """
+
+    def __init__(self, total_jobs, hdd_jobs=1, ssd_jobs=None, device_limits=None):
+        self.total = asyncio.Semaphore(max(1, total_jobs))
+        self.hdd_jobs = max(1, hdd_jobs)
+        self.ssd_jobs = max(1, ssd_jobs or total_jobs)
+        self.overrides = {}
+        for path, limit in (device_limits or {}).items():
+            self.overrides[os.stat(existing_path(path)).st_dev] = max(1, limit)
+        self.devices = {}
+        self._counter = itertools.count()
+
+    def limit_for(self, device):
+        if device in self.overrides:
+            return self.overrides[device]
+        return self.hdd_jobs if is_rotational(device) else self.ssd_jobs
+
+    def describe(self, path):
+        """Mô tả ngắn về ổ chứa path, dùng khi in thông tin lúc khởi động."""
+        device = os.stat(existing_path(path)).st_dev
+        rotational = is_rotational(device)
+        kind = {True: 'HDD', False: 'SSD', None: 'unknown'}[rotational]
+        return f"{path}: device {device} ({kind}), {self.limit_for(device)} concurrent jobs"
+
+    def _device(self, device):
+        state = self.devices.get(device)
+        if state is None:
+            state = self.devices[device] = _Device(self.limit_for(device))
+        return state
+
+    async def _acquire_device(self, device, order_key):
+        state = self._device(device)
+        if state.active < state.limit and not state.waiting:
+            state.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(state.waiting, (order_key, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_device(device)
+            raise
+
+    def _release_device(self, device):
+        state = self.devices[device]
+        state.active -= 1
+        while state.waiting and state.active < state.limit:
+            _, _, future = heapq.heappop(state.waiting)
+            if future.cancelled():
+                continue
+            state.active += 1
+            future.set_result(None)
+
+    def devices_for(self, source_path, output_paths):
+        devices = {os.stat(source_path).st_dev}
+        for output_path in output_paths:
+            devices.add(os.stat(existing_path(os.path.dirname(output_path))).st_dev)
+        # Luôn lấy slot theo cùng một thứ tự để hai job không giữ slot chéo nhau
+        return sorted(devices)
+
+    @asynccontextmanager
+    async def slot(self, source_path, output_paths):
+        """Chờ tới lượt chạy job đọc source_path và ghi output_paths."""
+        st = os.stat(source_path)
+        order_key = (os.path.dirname(os.path.abspath(source_path)), st.st_ino)
+        devices = self.devices_for(source_path, output_paths)
+        acquired = []
+        try:
+            for device in devices:
+                await self._acquire_device(device, order_key)
+                acquired.append(device)
+            async with self.total:
+                yield
+        finally:
+            for device in reversed(acquired):
+                self._release_device(device)
+
+class CpuBudget:
+    """Giới hạn tổng số thread encoder của các job chuyển mã chạy cùng lúc.
+
+    Job chỉ copy stream (weight 0) không phải chờ, nên remux thường không bị
+    các job chuyển mã chiếm hết CPU. Job có weight lớn hơn tổng vẫn chạy được
+    (khi không còn job nào khác giữ budget).
+    """
+
+    def __init__(self, total_threads):
+        self.total = max(1, total_threads)
+        self.used = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self, weight):
+        weight = min(weight, self.total)
+        if weight <= 0:
+            yield
+            return
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.used + weight <= self.total)
+            self.used += weight
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.used -= weight
+                self._condition.notify_all()
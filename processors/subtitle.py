@@ -1 +1,41 @@
- 
\ No newline at end of file
+import os
+
+SUBTITLE_FOLDER = r"C:\Subtitles"
+
+# Subtitle dạng text, ffmpeg chuyển được sang SRT. Subtitle dạng ảnh (PGS,
+# VobSub, DVB) không chuyển được nên được copy nguyên sang .sup/.mks
+TEXT_SUBTITLE_CODECS = {'subrip', 'srt', 'ass', 'ssa', 'webvtt', 'text', 'mov_text'}
+
+def subtitle_format(subtitle_info):
+    """Đuôi file và tham số codec/format ffmpeg của output cho một subtitle.
+
+    Codec lấy từ MediaInfo (subtitle_info[3]); không rõ codec thì coi như text.
+    """
+    codec = subtitle_info[3] if len(subtitle_info) > 3 else ''
+    if not codec or codec in TEXT_SUBTITLE_CODECS:
+        return '.srt', ['-c:s', 'srt']
+    if codec == 'hdmv_pgs_subtitle':
+        return '.sup', ['-c:s', 'copy']
+    return '.mks', ['-c:s', 'copy', '-f', 'matroska']
+
+def select_subtitles(media, sub_root_folder=SUBTITLE_FOLDER):
+    """Chọn các subtitle tiếng Việt cần trích xuất, trả về list (subtitle_info, output_path)."""
+    selected = []
+    for subtitle_info in media.subtitle_tracks:
+        # Chỉ xử lý subtitle tiếng Việt
+        if subtitle_info[1] != 'vie':
+            continue
+        # Đặt tên file subtitle giữ nguyên tên gốc, các subtitle sau thêm index của stream
+        # để không ghi đè lên nhau khi cùng được xuất trong một lệnh ffmpeg
+        extension = subtitle_format(subtitle_info)[0]
+        if selected:
+            sub_filename = f"{media.base_name}.{subtitle_info[0]}{extension}"
+        else:
+            sub_filename = media.base_name + extension
+        selected.append((subtitle_info, os.path.join(sub_root_folder, sub_filename)))
+    return selected
+
+def subtitle_output_args(subtitle_info, output_path):
+    """Các tham số ffmpeg cho một output subtitle (dùng trong lệnh ffmpeg nhiều output)."""
+    index = subtitle_info[0]
+    return ['-map', f'0:{index}'] + subtitle_format(subtitle_info)[1] + [output_path]
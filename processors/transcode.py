@@ -0,0 +1,72 @@
+import os
+import json
+
+# Codec âm thanh lossless/dung lượng lớn mà các profile có sẵn sẽ chuyển mã
+LARGE_AUDIO_CODECS = ['truehd', 'mlp', 'dts', 'flac', 'pcm_s16le', 'pcm_s24le', 'pcm_s32le', 'pcm_f32le']
+
+# Profile có sẵn, dùng được bằng tên trong --transcode
+PROFILES = {
+    'aac-5.1': {'codecs': LARGE_AUDIO_CODECS, 'codec': 'aac', 'channels': 6, 'bitrate': '512k'},
+    'aac-2.0': {'codecs': LARGE_AUDIO_CODECS, 'codec': 'aac', 'channels': 2, 'bitrate': '192k'},
+    'opus-5.1': {'codecs': LARGE_AUDIO_CODECS, 'codec': 'libopus', 'channels': 6, 'bitrate': '384k'},
+    'opus-2.0': {'codecs': LARGE_AUDIO_CODECS, 'codec': 'libopus', 'channels': 2, 'bitrate': '128k'},
+}
+
+RULE_KEYS = {'codecs', 'min_channels', 'min_size_mb', 'codec', 'channels', 'bitrate', 'threads'}
+
+def _check_rule(rule, source):
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown transcode option(s) {', '.join(sorted(unknown))} in {source}")
+    if 'codec' not in rule:
+        raise ValueError(f"Transcode rule in {source} has no 'codec'")
+    return rule
+
+def load_rules(specs):
+    """Đọc các luật chuyển mã từ --transcode: tên profile có sẵn hoặc file JSON.
+
+    File JSON là một luật hoặc list các luật, mỗi luật gồm điều kiện (codecs:
+    list codec nguồn, min_channels, min_size_mb: kích thước file nguồn) và
+    cách chuyển mã (codec, channels, bitrate, threads). Luật khớp đầu tiên được dùng.
+    """
+    rules = []
+    for spec in specs or []:
+        if spec in PROFILES:
+            rules.append(dict(PROFILES[spec]))
+            continue
+        if not os.path.isfile(spec):
+            raise ValueError(f"Unknown transcode profile '{spec}' (choose from {', '.join(PROFILES)} or a JSON file)")
+        with open(spec, "r", encoding='utf-8') as f:
+            loaded = json.load(f)
+        for rule in loaded if isinstance(loaded, list) else [loaded]:
+            rules.append(_check_rule(rule, spec))
+    return rules
+
+def select_profile(track, media, rules):
+    """Chọn cách chuyển mã cho track audio (index, channels, language, title, codec), None nếu giữ nguyên."""
+    channels = track[1] or 0
+    for rule in rules or []:
+        if rule.get('codecs') and track[4] not in rule['codecs']:
+            continue
+        if channels < rule.get('min_channels', 0):
+            continue
+        if media.size < rule.get('min_size_mb', 0) * 1024 * 1024:
+            continue
+        target_channels = rule.get('channels')
+        if target_channels and channels:
+            # Chỉ downmix, không bao giờ tăng số kênh
+            target_channels = min(target_channels, channels)
+        if rule['codec'] == track[4] and target_channels in (None, channels):
+            return None
+        return {'codec': rule['codec'], 'channels': target_channels,
+                'bitrate': rule.get('bitrate'), 'threads': max(1, rule.get('threads', 1))}
+    return None
+
+def transcode_args(transcode):
+    """Tham số ffmpeg chuyển mã audio của output remux (video vẫn -c copy)."""
+    args = ['-c:a', transcode['codec']]
+    if transcode['channels']:
+        args += ['-ac', str(transcode['channels'])]
+    if transcode['bitrate']:
+        args += ['-b:a', transcode['bitrate']]
+    return args + ['-threads', str(transcode['threads'])]
@@ -0,0 +1,97 @@
+import re
+from utils.mkv_utils import read_segment_status, MkvError
+
+# Thống kê ffmpeg in ở cuối khi chạy với -v verbose
+INPUT_STREAM_RE = re.compile(r'Input stream #0:(\d+) \((\w+)\): (\d+) packets read \((\d+) bytes\)')
+OUTPUT_STREAM_RE = re.compile(r'Output stream #(\d+):\d+ \((\w+)\): (?:.*?; )?(\d+) packets muxed \((\d+) bytes\)')
+# Độ lệch thời lượng cho phép giữa output và file nguồn (giây, hoặc tỉ lệ thời lượng)
+DURATION_TOLERANCE = 2.0
+DURATION_TOLERANCE_RATIO = 0.005
+
+def parse_stream_stats(stderr_text):
+    """Đọc số packet/byte của từng stream từ thống kê cuối của ffmpeg.
+
+    Trả về (inputs, outputs): inputs là {index stream nguồn: (loại, packets, bytes)},
+    outputs là {số thứ tự output: {loại: [packets, bytes]}} (cộng các stream cùng loại).
+    """
+    inputs = {}
+    outputs = {}
+    for match in INPUT_STREAM_RE.finditer(stderr_text):
+        inputs[int(match.group(1))] = (match.group(2), int(match.group(3)), int(match.group(4)))
+    for match in OUTPUT_STREAM_RE.finditer(stderr_text):
+        totals = outputs.setdefault(int(match.group(1)), {}).setdefault(match.group(2), [0, 0])
+        totals[0] += int(match.group(3))
+        totals[1] += int(match.group(4))
+    return inputs, outputs
+
+def _check_duration(media, duration):
+    try:
+        expected = float(media.duration)
+    except (TypeError, ValueError):
+        return None
+    if duration is None:
+        return "output has no duration"
+    difference = expected - float(duration)
+    if difference > max(DURATION_TOLERANCE, expected * DURATION_TOLERANCE_RATIO):
+        return f"duration {float(duration):.3f}s is shorter than source {expected:.3f}s"
+    return None
+
+def verify_outputs(media, action, stderr_text):
+    """Kiểm tra các output vừa ghi của action (file tạm) mà không đọc lại dữ liệu.
+
+    Dùng thống kê của chính lần chạy ffmpeg: mỗi output phải có đúng số packet
+    (và số byte với stream -c copy) mà ffmpeg đã đọc từ các stream nguồn
+    tương ứng; audio được chuyển mã thì chỉ cần có packet. Output MKV còn phải có Segment đã đóng đúng kích thước file và
+    thời lượng khớp với file nguồn. Trả về tập đường dẫn output hợp lệ.
+    """
+    inputs, outputs = parse_stream_stats(stderr_text)
+    verified = set()
+    if not inputs or not outputs:
+        print("Verification failed: ffmpeg did not report stream statistics.")
+        return verified
+
+    for output_index, (subtitle_info, output_path) in enumerate(action['subtitles']):
+        source = inputs.get(subtitle_info[0])
+        muxed = outputs.get(output_index, {}).get('subtitle')
+        if source is None or muxed is None or muxed[0] != source[1]:
+            print(f"Verification failed for {output_path}: "
+                  f"{muxed[0] if muxed else 0} of {source[1] if source else '?'} subtitle packets written.")
+        else:
+            verified.add(output_path)
+
+    if action['remux']:
+        output_path = action['remux']['output_path']
+        track_index = action['remux']['track'][0]
+        transcoded = bool(action['remux'].get('transcode'))
+        expected = {'video': [0, 0], 'audio': [0, 0]}
+        for index, (stream_type, packets, size) in inputs.items():
+            if stream_type == 'video' or index == track_index:
+                expected[stream_type][0] += packets
+                expected[stream_type][1] += size
+        written = outputs.get(len(action['subtitles']), {})
+        muxed = [sum(totals[0] for totals in written.values()), sum(totals[1] for totals in written.values())]
+        problem = None
+        for stream_type, (packets, size) in expected.items():
+            got = written.get(stream_type, [0, 0])
+            if stream_type == 'audio' and transcoded:
+                if packets and not got[0]:
+                    problem = "no audio packets written by the encoder"
+            elif got != [packets, size]:
+                problem = (f"{got[0]} {stream_type} packets ({got[1]} bytes) written, "
+                           f"expected {packets} ({size} bytes)")
+        if problem is None:
+            try:
+                complete, duration = read_segment_status(output_path)
+            except (MkvError, OSError) as e:
+                complete, duration = False, None
+                problem = f"cannot read output header: {e}"
+            if problem is None and not complete:
+                problem = "Matroska segment is not finalized (truncated output)"
+            if problem is None:
+                problem = _check_duration(media, duration)
+        if problem:
+            print(f"Verification failed for {output_path}: {problem}.")
+        else:
+            print(f"Verified {muxed[0]} packets ({muxed[1]} bytes) in remux output.")
+            verified.add(output_path)
+    return verified
@@ -1 +1,316 @@
- 
\ No newline at end of file
+import os
+import asyncio
+from processors.subtitle import select_subtitles, subtitle_output_args
+from processors.verify import verify_outputs
+from processors.transcode import select_profile, transcode_args
+from utils.ffmpeg_utils import get_language_abbreviation, run_ffmpeg_async
+from utils.file_utils import create_folder, sanitize_filename, rename_no_overwrite, partial_path
+from utils.mkv_utils import read_track_flags, plan_track_edit, write_region, MkvError
+from utils.profiling import timed
+
+def simple_name(media):
+    """Tên file đơn giản cho trường hợp không có audio để tách."""
+    # Lấy ngôn ngữ từ audio stream đầu tiên
+    first_audio = media.first_audio
+    language = first_audio[2] if first_audio else 'und'  # mặc định là undefined
+    language_abbr = get_language_abbreviation(language)
+    return sanitize_filename(f"{media.resolution_label}_{language_abbr}_{media.base_name}.mkv")
+
+def select_audio_track(media, vn_folder, original_folder):
+    """Chọn track audio cần tách và folder output, trả về (track, folder) hoặc None."""
+    if not media.audio_tracks:
+        return None
+
+    # Lấy thông tin audio đầu tiên để xác định trường hợp
+    first_audio_language = media.first_audio[2]
+
+    # Sắp xếp theo số kênh giảm dần
+    audio_tracks = sorted(media.audio_tracks, key=lambda x: x[1], reverse=True)
+
+    vietnamese_tracks = [track for track in audio_tracks if track[2] == 'vie']
+    non_vietnamese_tracks = [track for track in audio_tracks if track[2] != 'vie']
+
+    if first_audio_language == 'vie':
+        # Trường hợp 1: Audio đầu tiên là tiếng Việt
+        if non_vietnamese_tracks:
+            # Chọn audio không phải tiếng Việt có nhiều kênh nhất
+            return non_vietnamese_tracks[0], original_folder
+    else:
+        # Trường hợp 2: Audio đầu tiên không phải tiếng Việt
+        if vietnamese_tracks:
+            # Chọn audio tiếng Việt có nhiều kênh nhất
+            return vietnamese_tracks[0], vn_folder
+    return None
+
+def output_names(media, selected_track):
+    """Tên mới của file gốc và tên file output sau khi tách audio."""
+    resolution_label = media.resolution_label
+    first_audio_lang = media.first_audio[2]
+    first_audio_title = media.first_audio[3]
+
+    # Format tên file dựa vào điều kiện
+    if first_audio_lang == 'vie':
+        # Trường hợp audio đầu tiên là tiếng Việt
+        source_name = f"{resolution_label}_{get_language_abbreviation(first_audio_lang)}_{first_audio_title}"
+        output_name = f"{resolution_label}_{get_language_abbreviation(selected_track[2])}"
+    else:
+        # Trường hợp audio đầu tiên không phải tiếng Việt
+        source_name = f"{resolution_label}_{get_language_abbreviation(first_audio_lang)}"
+        output_name = f"{resolution_label}_{get_language_abbreviation(selected_track[2])}_{selected_track[3]}"
+
+    # Thêm năm và tên gốc
+    if media.year:
+        source_name += f"_{media.year}"
+        output_name += f"_{media.year}"
+    source_name += f"_{media.base_name}.mkv"
+    output_name += f"_{media.base_name}.mkv"
+    return sanitize_filename(source_name), sanitize_filename(output_name)
+
+def decide(media, vn_folder, original_folder, transcode_rules=None):
+    """Quyết định các việc cần làm với một file, chỉ dựa trên MediaInfo.
+
+    Trả về dict gồm:
+      subtitles: list (subtitle_info, output_path) cần trích xuất
+      remux: None hoặc dict (track, output_path, transcode) cần tách, transcode là
+             cách chuyển mã audio theo transcode_rules (None nếu chỉ copy)
+      rename: tên mới của file gốc (khi remux thì chỉ đổi tên nếu remux thành công)
+    """
+    action = {'subtitles': [], 'remux': None, 'rename': None}
+
+    # Kiểm tra subtitle và audio tiếng Việt
+    has_vie_subtitle = media.has_subtitle_language('vie')
+    has_vie_audio = media.has_audio_language('vie')
+
+    # Xử lý subtitle tiếng Việt
+    if has_vie_subtitle:
+        action['subtitles'] = select_subtitles(media)
+
+    # Nếu không có cả subtitle và audio tiếng Việt thì chỉ đổi tên
+    if not has_vie_subtitle and not has_vie_audio:
+        if media.first_audio:
+            action['rename'] = simple_name(media)
+        return action
+
+    # Xử lý video nếu có audio tiếng Việt
+    if has_vie_audio:
+        selection = select_audio_track(media, vn_folder, original_folder)
+        if selection:
+            selected_track, output_folder = selection
+            source_name, output_name = output_names(media, selected_track)
+            # Folder output nằm cạnh file gốc (hỗ trợ quét thư viện nhiều thư mục)
+            output_folder = os.path.join(os.path.dirname(media.path), output_folder)
+            action['remux'] = {'track': selected_track,
+                               'output_path': os.path.join(output_folder, output_name),
+                               'transcode': select_profile(selected_track, media, transcode_rules)}
+            action['rename'] = source_name
+    return action
+
+def remux_output_args(selected_track, output_path, transcode=None):
+    """Các tham số ffmpeg cho output video + track audio đã chọn (chuyển mã audio nếu có transcode)."""
+    args = ['-map', '0:v', '-map', f'0:{selected_track[0]}', '-c', 'copy']
+    if transcode:
+        args += transcode_args(transcode)
+    return args + [output_path]
+
+def ffmpeg_output(path):
+    """Đường dẫn output cho ffmpeg qua protocol file: (để "C:" không bị hiểu là tên protocol)."""
+    return 'file:' + path
+
+def build_command(media, action):
+    """Tạo một lệnh ffmpeg duy nhất cho mọi output của file (remux và các subtitle).
+
+    ffmpeg chỉ đọc file nguồn một lần và ghi ra tất cả output cùng lúc.
+    """
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-v', 'verbose', '-y', '-i', media.path]
+    for subtitle_info, output_path in action['subtitles']:
+        cmd += subtitle_output_args(subtitle_info, ffmpeg_output(output_path))
+    if action['remux']:
+        cmd += remux_output_args(action['remux']['track'], ffmpeg_output(action['remux']['output_path']),
+                                 action['remux'].get('transcode'))
+    return cmd
+
+def partial_action(action):
+    """Bản sao của action với mọi output đổi sang file tạm .partial.
+
+    Trả về (action_tạm, [(file_tạm, file_đích), ...]). ffmpeg ghi vào file tạm,
+    chỉ khi chạy xong mới đổi tên sang file đích, nên file đích hoặc không có,
+    hoặc đã đầy đủ, kể cả khi tiến trình bị kill giữa chừng.
+    """
+    moves = []
+    subtitles = []
+    for subtitle_info, output_path in action['subtitles']:
+        temp_path = partial_path(output_path)
+        subtitles.append((subtitle_info, temp_path))
+        moves.append((temp_path, output_path))
+    remux = None
+    if action['remux']:
+        temp_path = partial_path(action['remux']['output_path'])
+        remux = dict(action['remux'], output_path=temp_path)
+        moves.append((temp_path, action['remux']['output_path']))
+    return {'subtitles': subtitles, 'remux': remux, 'rename': action['rename']}, moves
+
+def remove_partials(moves):
+    """Xóa các file tạm còn sót lại."""
+    for temp_path, _ in moves:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing temporary file {temp_path}: {e}")
+
+def output_size(paths):
+    """Tổng kích thước các file output đã tạo."""
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+async def run_single_pass(media, action, on_progress=None, verify=False):
+    """Chạy tách subtitle và remux trong một lần ffmpeg, trả về dict kết quả.
+
+    Kết quả gồm: subtitles (các file subtitle đã tạo), remux (True/False/None),
+    bytes_read (số byte đã đọc từ file nguồn, None nếu ffmpeg không báo) và
+    bytes_written (tổng kích thước các output). on_progress nhận từng khối
+    tiến độ của ffmpeg trong lúc chạy. Output được ghi vào file .partial rồi
+    mới đổi tên khi ffmpeg kết thúc thành công; với verify=True, chỉ output
+    qua được verify_outputs mới được đổi tên (output lỗi coi như chưa tạo).
+    """
+    file_path = media.path
+    results = {'subtitles': [], 'remux': None, 'bytes_read': None, 'bytes_written': 0}
+    if not action['subtitles'] and not action['remux']:
+        return results
+    try:
+        for _, output_path in action['subtitles']:
+            create_folder(os.path.dirname(output_path))
+        if action['remux']:
+            create_folder(os.path.dirname(action['remux']['output_path']))
+
+        transcode = action['remux'] and action['remux'].get('transcode')
+        if transcode:
+            track = action['remux']['track']
+            print(f"Transcoding audio track {track[0]} ({track[4]}, {track[1]} channels) to "
+                  f"{transcode['codec']} {transcode['channels'] or track[1]} channels"
+                  f"{' ' + transcode['bitrate'] if transcode['bitrate'] else ''}.")
+
+        temp_action, moves = partial_action(action)
+        created = set()
+        try:
+            with timed('ffmpeg'):
+                returncode, stderr_text, results['bytes_read'] = await run_ffmpeg_async(
+                    build_command(media, temp_action), on_progress)
+            if returncode == 0:
+                verified = None
+                if verify:
+                    with timed('verify'):
+                        verified = await asyncio.to_thread(verify_outputs, media, temp_action, stderr_text)
+                for temp_path, output_path in moves:
+                    if os.path.exists(temp_path) and (verified is None or temp_path in verified):
+                        os.replace(temp_path, output_path)
+                        created.add(output_path)
+        finally:
+            remove_partials(moves)
+
+        if returncode == 0:
+            for _, output_path in action['subtitles']:
+                if output_path in created:
+                    print(f"Extracted Vietnamese subtitle to: {output_path}")
+                    results['subtitles'].append(output_path)
+                else:
+                    print(f"Failed to extract subtitle to: {output_path}")
+            if action['remux']:
+                output_path = action['remux']['output_path']
+                results['remux'] = output_path in created
+                if results['remux']:
+                    print(f"Video saved to {output_path}.")
+                else:
+                    print(f"Failed to process {file_path}.")
+            results['bytes_written'] = output_size(
+                results['subtitles'] + ([action['remux']['output_path']] if results['remux'] else []))
+        else:
+            print(f"Failed to process {file_path}.")
+            if action['remux']:
+                results['remux'] = False
+            if stderr_text:
+                # stderr_text chỉ gồm các dòng cuối của stderr (phần có thông báo lỗi)
+                print(f"Error: {stderr_text}")
+
+        if results['bytes_read'] is not None:
+            print(f"Read {results['bytes_read'] / (1024 * 1024):.1f} MB from source "
+                  f"({results['bytes_read'] / max(media.size, 1):.2f}x file size, one ffmpeg pass).")
+        return results
+
+    except Exception as e:
+        print(f"Exception while processing {file_path}: {e}")
+        if action['remux']:
+            results['remux'] = False
+        return results
+
+def select_default_audio(media):
+    """Track audio tiếng Việt nên là mặc định: track 'vie' nhiều kênh nhất, None nếu không có."""
+    vietnamese_tracks = [track for track in media.audio_tracks if track[2] == 'vie']
+    if not vietnamese_tracks:
+        return None
+    return max(vietnamese_tracks, key=lambda track: track[1] or 0)
+
+def prepare_default_audio(media):
+    """Chuẩn bị đặt track tiếng Việt làm mặc định ngay trong header file gốc, thay cho remux.
+
+    Chỉ sửa cờ FlagDefault của các track audio (vài byte trong element Tracks),
+    chưa ghi gì vào file. Trả về (track, edit): edit là (vị trí, byte gốc, byte
+    mới) cho apply_default_audio, None nếu track đã là track đầu tiên và mặc
+    định (không cần sửa). Trả về None nếu không sửa tại chỗ được, khi đó vẫn
+    remux như bình thường.
+    """
+    track = select_default_audio(media)
+    if track is None:
+        return None
+    index = track[0]
+    try:
+        tracks = read_track_flags(media.path)
+        # Index của stream phải trùng thứ tự TrackEntry (ffprobe có thể bỏ qua track lạ)
+        if index >= len(tracks) or tracks[index]['type'] != 'audio' or tracks[index]['language'] != track[2]:
+            raise MkvError("track order in the header differs from the probe result")
+        changes = {position: {'default': position == index}
+                   for position, entry in enumerate(tracks)
+                   if entry['type'] == 'audio' and entry['default'] != (position == index)}
+        if not changes or (track == media.first_audio and tracks[index]['default']):
+            print(f"Audio track {index} ({track[2]}) is already the default in {media.name}. Nothing to edit.")
+            return track, None
+        return track, plan_track_edit(media.path, changes)
+    except (MkvError, OSError) as e:
+        print(f"Cannot edit {media.name} in place ({e}). Remuxing instead.")
+        return None
+
+def apply_default_audio(media, track, edit):
+    """Ghi phần header đã chuẩn bị bởi prepare_default_audio, trả về True nếu thành công.
+
+    Nếu ghi lỗi thì thử ghi lại byte gốc để file không bị hỏng.
+    """
+    offset, original, data = edit
+    try:
+        write_region(media.path, offset, data)
+    except OSError as e:
+        print(f"Error editing {media.name} in place: {e}")
+        try:
+            write_region(media.path, offset, original)
+        except OSError as e:
+            print(f"Error restoring the original header of {media.name}: {e}")
+        return False
+    print(f"Set audio track {track[0]} ({track[2]}) as default in {media.name} (edited in place).")
+    return True
+
+def rename_source(media, new_name):
+    """Đổi tên file gốc sau khi xử lý, trả về đường dẫn mới (giữ nguyên nếu lỗi)."""
+    file_path = media.path
+    new_path = os.path.join(os.path.dirname(file_path), new_name)
+    try:
+        rename_no_overwrite(file_path, new_path)
+        print(f"Renamed source file to: {new_name}")
+        return new_path
+    except Exception as e:
+        print(f"Error renaming file {file_path}: {e}")
+        return file_path
@@ -1,6 +1,7 @@
 @echo off
-:: Thêm vào startup registry
-reg add "HKEY_CURRENT_USER\Software\Microsoft\Windows\CurrentVersion\Run" /v "AutoGitCommit" /t REG_SZ /d "\"%~dp0auto_commit.py\"" /f
+:: Thêm vào startup registry (chạy daemon, chỉ commit khi có thay đổi)
+reg add "HKEY_CURRENT_USER\Software\Microsoft\Windows\CurrentVersion\Run" /v "AutoGitCommit" /t REG_SZ /d "\"C:\Users\Admin\AppData\Local\Programs\Python\Python312\pythonw.exe\" \"%~dp0auto_commit.py\" --daemon --interval 60" /f
 
-:: Chạy script
-start /min "" "C:\Users\Admin\AppData\Local\Programs\Python\Python312\pythonw.exe" auto_commit.py 
\ No newline at end of file
+:: Chạy script ở chế độ daemon
+cd /d "%~dp0"
+start /min "" "C:\Users\Admin\AppData\Local\Programs\Python\Python312\pythonw.exe" auto_commit.py --daemon --interval 60
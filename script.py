@@ -1,499 +1,281 @@
 import os
-import subprocess
-import ffmpeg
-import re
-import datetime
-
-def create_folder(folder_name):
-    """Tạo folder nếu chưa tồn tại."""
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
-
-def log_processed_file(log_file, old_name, new_name):
-    """Ghi lại log file đã được xử lý với tên cũ và mới."""
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    file_path = os.path.join(".", old_name)
-    signature = get_file_signature(file_path) if os.path.exists(file_path) else ""
-    with open(log_file, "a", encoding='utf-8') as f:
-        f.write(f"{old_name}|{new_name}|{current_time}|{signature}\n")
-
-def read_processed_files(log_file):
-    """Đọc danh sách các file đã xử lý từ log."""
-    processed_files = {}
-    processed_signatures = {}
-    if os.path.exists(log_file):
-        with open(log_file, "r", encoding='utf-8') as f:
-            for line in f:
-                parts = line.strip().split('|')
-                if len(parts) >= 2:
-                    old_name = parts[0]
-                    new_name = parts[1]
-                    time_processed = parts[2] if len(parts) > 2 else ""
-                    signature = parts[3] if len(parts) > 3 else ""
-                    
-                    info = {"new_name": new_name, "time": time_processed, "signature": signature}
-                    processed_files[old_name] = info
-                    processed_files[new_name] = info
-                    if signature:
-                        processed_signatures[signature] = info
-    return processed_files, processed_signatures
-
-def sanitize_filename(name):
-    """Loại bỏ các ký tự không hợp lệ trong tên tệp để tránh lỗi FFmpeg."""
-    # Thay thế các ký tự không hợp lệ bằng dấu gạch dưới
-    return re.sub(r'[<>:"/\\|?*\n\r\t]', '_', name)
-
-def get_video_resolution_label(file_path):
-    """Lấy tên độ phân giải video (FHD, 4K, 2K, HD)."""
-    try:
-        probe = ffmpeg.probe(file_path)
-        video_stream = next((stream for stream in probe['streams'] if stream['codec_type'] == 'video'), None)
-        if video_stream and 'width' in video_stream and 'height' in video_stream:
-            width = int(video_stream['width'])
-            height = int(video_stream['height'])
-            # 8k
-            if width >= 7680 or height >= 4320:
-                return "8K"
-            # 4k
-            elif width >= 3840 or height >= 2160:  # Bao gồm cả 3840x1608
-                return "4K"
-            # 2k
-            elif width >= 2560 or height >= 1440:
-                return "2K"
-            # FHD
-            elif width >= 1920 or height >= 1080:
-                return "FHD"
-            # HD
-            elif width >= 1280 or height >= 720:
-                return "HD"
-            # 480p
-            elif width >= 720 or height >= 480:
-                return "480p"
-            else:
-                return f"{width}p"
-    except Exception as e:
-        print(f"Error getting resolution for {file_path}: {e}")
-    return "unknown_resolution"
-
-def get_movie_year(file_path):
-    """Lấy năm của phim từ metadata."""
-    try:
-        probe = ffmpeg.probe(file_path)
-        format_tags = probe.get("format", {}).get("tags", {})
-        year = format_tags.get("year", "")
-        return year.strip()
-    except Exception as e:
-        print(f"Error getting year for {file_path}: {e}")
-    return ""
-
-def get_language_abbreviation(language_code):
-    """Trả về tên viết tắt của ngôn ngữ dựa trên mã ngôn ngữ."""
-    language_map = {
-        'eng': 'ENG',  # Tiếng Anh
-        'vie': 'VIE',  # Tiếng Việt
-        'und': 'UNK',  # Không xác định (Undefined)
-        'chi': 'CHI',  # Tiếng Trung
-        'zho': 'CHI',  # Tiếng Trung (mã khác)
-        'jpn': 'JPN',  # Tiếng Nhật
-        'kor': 'KOR',  # Tiếng Hàn
-        'fra': 'FRA',  # Tiếng Pháp
-        'deu': 'DEU',  # Tiếng Đức
-        'spa': 'SPA',  # Tiếng Tây Ban Nha
-        'ita': 'ITA',  # Tiếng Ý
-        'rus': 'RUS',  # Tiếng Nga
-        'tha': 'THA',  # Tiếng Thái
-        'ind': 'IND',  # Tiếng Indonesia
-        'msa': 'MSA',  # Tiếng Malaysia
-        'ara': 'ARA',  # Tiếng Ả Rập
-        'hin': 'HIN',  # Tiếng Hindi
-        'por': 'POR',  # Tiếng Bồ Đào Nha
-        'nld': 'NLD',  # Tiếng Hà Lan
-        'pol': 'POL',  # Tiếng Ba Lan
-        'tur': 'TUR',  # Tiếng Thổ Nhĩ Kỳ
-        'swe': 'SWE',  # Tiếng Thụy Điển
-        'nor': 'NOR',  # Tiếng Na Uy
-        'dan': 'DAN',  # Tiếng Đan Mạch
-        'fin': 'FIN',  # Tiếng Phần Lan
-        'ukr': 'UKR',  # Tiếng Ukraine
-        'ces': 'CES',  # Tiếng Séc
-        'hun': 'HUN',  # Tiếng Hungary
-        'ron': 'RON',  # Tiếng Romania
-        'bul': 'BUL',  # Tiếng Bulgaria
-        'hrv': 'HRV',  # Tiếng Croatia
-        'srp': 'SRP',  # Tiếng Serbia
-        'slv': 'SLV',  # Tiếng Slovenia
-        'ell': 'ELL',  # Tiếng Hy Lạp
-        'heb': 'HEB',  # Tiếng Do Thái
-        'kat': 'KAT',  # Tiếng Georgia
-        'lat': 'LAT',  # Tiếng Latin
-        'vie-Nom': 'NOM',  # Chữ Nôm
-        'cmn': 'CMN',  # Tiếng Trung (Phổ thông)
-        'yue': 'YUE',  # Tiếng Quảng Đông
-        'nan': 'NAN',  # Tiếng Mân Nam
-        'khm': 'KHM',  # Tiếng Khmer
-        'lao': 'LAO',  # Tiếng Lào
-        'mya': 'MYA',  # Tiếng Miến Điện
-        'ben': 'BEN',  # Tiếng Bengal
-        'tam': 'TAM',  # Tiếng Tamil
-        'tel': 'TEL',  # Tiếng Telugu
-        'mal': 'MAL',  # Tiếng Malayalam
-        'kan': 'KAN',  # Tiếng Kannada
-        'mar': 'MAR',  # Tiếng Marathi
-        'pan': 'PAN',  # Tiếng Punjab
-        'guj': 'GUJ',  # Tiếng Gujarat
-        'ori': 'ORI',  # Tiếng Oriya
-        'asm': 'ASM',  # Tiếng Assam
-        'urd': 'URD',  # Tiếng Urdu
-        'fas': 'FAS',  # Tiếng Ba Tư
-        'pus': 'PUS',  # Tiếng Pashto
-        'kur': 'KUR',  # Tiếng Kurdish
-    }
-    return language_map.get(language_code, language_code.upper()[:3])
-
-def rename_simple(file_path):
-    """Đổi tên file đơn giản cho trường hợp không có audio để tách."""
-    try:
-        resolution_label = get_video_resolution_label(file_path)
-        probe = ffmpeg.probe(file_path)
-        # Lấy ngôn ngữ từ audio stream đầu tiên
-        audio_stream = next((stream for stream in probe['streams'] 
-                           if stream['codec_type'] == 'audio'), None)
-        language = 'und'  # mặc định là undefined
-        if audio_stream:
-            language = audio_stream.get('tags', {}).get('language', 'und')
-        
-        language_abbr = get_language_abbreviation(language)
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        
-        new_name = f"{resolution_label}_{language_abbr}_{base_name}.mkv"
-        new_name = sanitize_filename(new_name)
-        
-        dir_path = os.path.dirname(file_path)
-        new_path = os.path.join(dir_path, new_name)
-        
-        os.rename(file_path, new_path)
-        print(f"Simple renamed file to: {new_name}")
-        return new_path
-    except Exception as e:
-        print(f"Error simple renaming file {file_path}: {e}")
-        return file_path
-
-def extract_video_with_audio(file_path, vn_folder, original_folder, log_file):
-    """Tách video với audio theo yêu cầu."""
-    try:
-        probe = ffmpeg.probe(file_path)
-        audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
-        
-        if not audio_streams:
-            print(f"No audio found in {file_path}. Performing simple rename.")
-            new_path = rename_simple(file_path)
-            log_processed_file(log_file, os.path.basename(file_path), os.path.basename(new_path))
-            return
-
-        # Lấy thông tin audio đầu tiên để xác định trường hợp
-        first_audio = audio_streams[0]
-        first_audio_language = first_audio.get('tags', {}).get('language', 'und')
-
-        # Tạo danh sách audio tracks với thông tin cần thiết
-        audio_tracks = []
-        for stream in audio_streams:
-            index = stream.get('index', -1)
-            channels = stream.get('channels', 0)
-            language = stream.get('tags', {}).get('language', 'und')
-            title = stream.get('tags', {}).get('title', get_language_abbreviation(language))
-            audio_tracks.append((index, channels, language, title))
-
-        # Sắp xếp theo số kênh giảm dần
-        audio_tracks.sort(key=lambda x: x[1], reverse=True)
-        
-        vietnamese_tracks = [track for track in audio_tracks if track[2] == 'vie']
-        non_vietnamese_tracks = [track for track in audio_tracks if track[2] != 'vie']
-
-        if first_audio_language == 'vie':
-            # Trường hợp 1: Audio đầu tiên là tiếng Việt
-            if non_vietnamese_tracks:
-                # Chọn audio không phải tiếng Việt có nhiều kênh nhất
-                selected_track = non_vietnamese_tracks[0]
-                process_video(file_path, original_folder, selected_track, log_file)
-        else:
-            # Trường hợp 2: Audio đầu tiên không phải tiếng Việt
-            if vietnamese_tracks:
-                # Chọn audio tiếng Việt có nhiều kênh nhất
-                selected_track = vietnamese_tracks[0]
-                process_video(file_path, vn_folder, selected_track, log_file)
-
-    except Exception as e:
-        print(f"Exception while processing {file_path}: {e}")
-
-def rename_file(file_path, audio_info, is_output=False):
-    """Đổi tên file theo format yêu cầu."""
-    try:
-        resolution_label = get_video_resolution_label(file_path)
-        year = get_movie_year(file_path)
-        language = audio_info[2]  # Mã ngôn ngữ
-        audio_title = audio_info[3]  # Tiêu đề audio
-        
-        # Lấy tên gốc của file
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        
-        # Format chung cho cả file gốc và output:
-        # resolution_label + language_abbr + audio_title + year + base_name
-        language_abbr = get_language_abbreviation(language)
-        new_name = f"{resolution_label}_{language_abbr}_{audio_title}"
-        
-        if year:
-            new_name += f"_{year}"
-        new_name += f"_{base_name}.mkv"
-        
-        new_name = sanitize_filename(new_name)
-        
-        # Tạo đường dẫn mới
-        dir_path = os.path.dirname(file_path)
-        new_path = os.path.join(dir_path, new_name)
-        
-        # Đổi tên file
-        os.rename(file_path, new_path)
-        print(f"Renamed file to: {new_name}")
-        return new_path
-    except Exception as e:
-        print(f"Error renaming file {file_path}: {e}")
-        return file_path
-
-def process_video(file_path, output_folder, selected_track, log_file):
-    """Xử lý video với track audio đã chọn và trích xuất subtitle."""
-    try:
-        original_filename = os.path.basename(file_path)
-        
-        # Lấy thông tin cơ bản
-        resolution_label = get_video_resolution_label(file_path)
-        year = get_movie_year(file_path)
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        
-        # Lấy thông tin audio đầu tiên
-        probe = ffmpeg.probe(file_path)
-        first_audio = next((stream for stream in probe['streams'] 
-                          if stream['codec_type'] == 'audio'), None)
-        
-        if first_audio:
-            first_audio_lang = first_audio.get('tags', {}).get('language', 'und')
-            first_audio_title = first_audio.get('tags', {}).get('title', 
-                               get_language_abbreviation(first_audio_lang))
-            
-            # Format tên file dựa vào điều kiện
-            if first_audio_lang == 'vie':
-                # Trường hợp audio đầu tiên là tiếng Việt
-                source_name = f"{resolution_label}_{get_language_abbreviation(first_audio_lang)}_{first_audio_title}"
-                output_name = f"{resolution_label}_{get_language_abbreviation(selected_track[2])}"
-            else:
-                # Trường hợp audio đầu tiên không phải tiếng Việt
-                source_name = f"{resolution_label}_{get_language_abbreviation(first_audio_lang)}"
-                output_name = f"{resolution_label}_{get_language_abbreviation(selected_track[2])}_{selected_track[3]}"
-            
-            # Thêm năm và tên gốc
-            if year:
-                source_name += f"_{year}"
-                output_name += f"_{year}"
-            source_name += f"_{base_name}.mkv"
-            output_name += f"_{base_name}.mkv"
-            
-            # Tạo đường dẫn output
-            output_path = os.path.join(output_folder, sanitize_filename(output_name))
-
-            # Xử lý tách audio
-            cmd = [
-                'ffmpeg',
-                '-i', file_path,
-                '-map', '0:v',
-                '-map', f'0:{selected_track[0]}',
-                '-c', 'copy',
-                '-y',
-                output_path
-            ]
-
-            result = subprocess.run(cmd, capture_output=True)
-
-            if result.returncode == 0 and os.path.exists(output_path):
-                print(f"Video saved to {output_path}.")
-                
-                # Rename file gốc sau khi xử lý thành công
-                new_source_path = os.path.join(os.path.dirname(file_path), sanitize_filename(source_name))
-                os.rename(file_path, new_source_path)
-                print(f"Renamed source file to: {source_name}")
-                
-                # Ghi log
-                log_processed_file(log_file, original_filename, os.path.basename(new_source_path))
-                return True
-            else:
-                print(f"Failed to process {file_path}.")
-                if result.stderr:
-                    # Decode stderr với error handling
-                    stderr_text = result.stderr.decode('utf-8', errors='replace')
-                    print(f"Error: {stderr_text}")
-                return False
-        else:
-            print(f"No audio found in {file_path}")
-            return False
-            
-    except Exception as e:
-        print(f"Exception while processing {file_path}: {e}")
-        return False
-
-def extract_subtitle(file_path, subtitle_info, log_file):
-    """Trích xuất subtitle tiếng Việt từ file video."""
-    try:
-        # Tạo thư mục C:\Subtitles nếu chưa tồn tại
-        sub_root_folder = r"C:\Subtitles"
-        create_folder(sub_root_folder)
-        
-        index, language, title, codec = subtitle_info
-        
-        # Chỉ xử lý subtitle tiếng Việt
-        if language != 'vie':
-            print(f"Skipping subtitle for {file_path} as it's not Vietnamese.")
-            return False
-            
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        
-        # Đặt tên file subtitle giữ nguyên tên gốc
-        sub_filename = base_name + '.srt'
-        output_path = os.path.join(sub_root_folder, sub_filename)
-
-        # Lệnh ffmpeg để trích xuất subtitle
-        cmd = [
-            'ffmpeg',
-            '-i', file_path,
-            '-map', f'0:{index}',
-            '-c:s', 'srt',
-            '-y',
-            output_path
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"Extracted Vietnamese subtitle to: {output_path}")
-            # Ghi vào log chung
-            log_processed_file(log_file, os.path.basename(file_path), sub_filename)
-            return True
-        else:
-            print("Lỗi khi trích xuất subtitle")
-            return False
-            
-    except Exception as e:
-        print(f"Lỗi khi trích xuất subtitle: {e}")
-        return False
-
-def get_subtitle_info(file_path):
-    """Lấy thông tin về các track subtitle trong file video."""
+import sys
+import asyncio
+import argparse
+import cProfile
+from processors.pipeline import Pipeline
+from processors.plan import write_plan, load_plan
+from processors.journal import recover
+from processors.dedupe import find_duplicates, write_report, load_duplicates
+from processors.scheduler import DeviceScheduler, CpuBudget
+from processors.transcode import PROFILES, load_rules
+from utils.file_utils import create_folder, iter_mkv_files
+from utils.probe_cache import ProbeCache
+from utils.progress import Progress
+from utils.profiling import Profiler
+from utils.state_store import StateStore
+from utils.watcher import watch_mkv_files
+
+def parse_args(argv=None):
+    """Đọc tham số dòng lệnh."""
+    parser = argparse.ArgumentParser(description="Tách audio và subtitle tiếng Việt từ các file MKV.")
+    parser.add_argument('--cache-size', type=int, default=50000,
+                        help="Số file tối đa giữ trong cache probe (mặc định 50000)")
+    parser.add_argument('--no-cache', action='store_true', help="Không dùng cache probe")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Số file tách subtitle/remux song song, mặc định 1")
+    parser.add_argument('--probe-jobs', type=int, default=4,
+                        help="Số file probe song song, mặc định 4")
+    parser.add_argument('--hdd-jobs', type=int, default=1,
+                        help="Số file xử lý cùng lúc trên mỗi HDD, mặc định 1")
+    parser.add_argument('--ssd-jobs', type=int,
+                        help="Số file xử lý cùng lúc trên mỗi SSD/ổ không xác định, mặc định bằng --jobs")
+    parser.add_argument('--device-limit', action='append', default=[], metavar='PATH=N',
+                        help="Đặt số file xử lý cùng lúc cho ổ chứa PATH (ví dụ ổ mạng), dùng được nhiều lần")
+    parser.add_argument('--no-device-scheduler', action='store_true',
+                        help="Không giới hạn theo ổ đĩa, chỉ giới hạn tổng bằng --jobs")
+    parser.add_argument('--root', action='append',
+                        help="Thư mục thư viện cần quét (có thể dùng nhiều lần), mặc định là folder hiện tại")
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help="Quét đệ quy cả các thư mục con")
+    parser.add_argument('--full-scan', action='store_true',
+                        help="Liệt kê lại mọi thư mục, bỏ qua snapshot của lần quét trước")
+    parser.add_argument('--signature', choices=['fingerprint', 'legacy'], default='fingerprint',
+                        help="Cách nhận diện file trùng: fingerprint lấy mẫu nội dung (mặc định) "
+                             "hoặc size_duration cũ")
+    parser.add_argument('--probe', choices=['ebml', 'ffprobe'], default='ebml',
+                        help="Cách đọc metadata: đọc header MKV trực tiếp (mặc định, lỗi thì dùng ffprobe) "
+                             "hoặc luôn dùng ffprobe")
+    parser.add_argument('--transcode', action='append', default=[], metavar='PROFILE',
+                        help=f"Chuyển mã track audio được tách: profile có sẵn ({', '.join(PROFILES)}) "
+                             "hoặc file JSON chứa các luật, dùng được nhiều lần")
+    parser.add_argument('--encoder-threads', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Tổng số thread encoder cho các job chuyển mã chạy cùng lúc, mặc định nửa số CPU")
+    parser.add_argument('--in-place', action='store_true',
+                        help="Đặt track audio được chọn làm mặc định ngay trong header file gốc thay vì remux "
+                             "(tự remux nếu không sửa tại chỗ được)")
+    parser.add_argument('--verify', action='store_true',
+                        help="Kiểm tra output ngay trong lần chạy ffmpeg (số packet, thời lượng, header MKV) "
+                             "trước khi đổi tên file gốc")
+    parser.add_argument('--skip-duplicates', metavar='REPORT',
+                        help="Bỏ qua các file trùng được liệt kê trong file do lệnh dedupe tạo ra")
+    parser.add_argument('--profile', action='store_true',
+                        help="In bảng thời gian từng bước, số tiến trình con và số byte đọc/ghi khi kết thúc")
+    parser.add_argument('--profile-output', metavar='PATH',
+                        help="Ghi profile chi tiết: cProfile nếu đuôi .prof, ngược lại JSON theo từng file")
+    parser.add_argument('--max-spawns-per-file', type=int, metavar='N',
+                        help="Thoát với mã lỗi 1 nếu có file tạo quá N tiến trình con (ffprobe/ffmpeg)")
+    parser.add_argument('--metrics',
+                        help="Ghi bộ đếm ra file: textfile Prometheus nếu đuôi .prom, ngược lại JSON")
+    subparsers = parser.add_subparsers(dest='command')
+    clear_parser = subparsers.add_parser('cache-clear', help="Xóa cache probe (toàn bộ hoặc theo file)")
+    clear_parser.add_argument('paths', nargs='*', help="Các file cần xóa khỏi cache")
+    plan_parser = subparsers.add_parser('plan', help="Chỉ probe và ghi các việc sẽ làm ra file plan JSON")
+    plan_parser.add_argument('output', help="File plan đầu ra")
+    apply_parser = subparsers.add_parser('apply', help="Thực hiện file plan, bỏ qua các bước đã làm")
+    apply_parser.add_argument('plan', help="File plan do lệnh plan tạo ra")
+    dedupe_parser = subparsers.add_parser('dedupe', help="Tìm file trùng trong toàn bộ thư viện và ghi ra file JSON")
+    dedupe_parser.add_argument('output', help="File kết quả dedupe")
+    subparsers.add_parser('state-compact', help="Xóa bản ghi trùng và thu gọn database trạng thái")
+    export_parser = subparsers.add_parser('state-export', help="Xuất trạng thái ra định dạng processed_files.log")
+    export_parser.add_argument('output', help="File log đầu ra")
+    watch_parser = subparsers.add_parser('watch', help="Chạy liên tục, xử lý file .mkv mới khi đã ghi xong")
+    watch_parser.add_argument('--settle', type=float, default=30.0,
+                              help="Số giây size/mtime phải giữ nguyên trước khi xử lý, mặc định 30")
+    watch_parser.add_argument('--poll-interval', type=float, default=10.0,
+                              help="Số giây giữa hai lần quét khi không có inotify, mặc định 10")
+    watch_parser.add_argument('--polling', action='store_true',
+                              help="Luôn quét định kỳ thay vì dùng inotify")
+    return parser.parse_args(argv)
+
+async def watch(pipeline, state, file_paths, flush_interval=5.0):
+    """Chạy pipeline với nguồn file từ watcher, commit trạng thái định kỳ."""
+    async def flush_loop():
+        while True:
+            await asyncio.sleep(flush_interval)
+            state.flush()
+    async def new_files():
+        async for file_path in file_paths:
+            # Bỏ qua (không in gì) file do chính pipeline vừa đổi tên
+            processed = state.find_by_name(os.path.basename(file_path))
+            if processed and processed['new_name'] == os.path.basename(file_path):
+                continue
+            yield file_path
+    flusher = asyncio.create_task(flush_loop())
     try:
-        probe = ffmpeg.probe(file_path)
-        subtitle_tracks = []
-        for stream in probe['streams']:
-            if stream['codec_type'] == 'subtitle':
-                index = stream.get('index', -1)
-                language = stream.get('tags', {}).get('language', 'und')
-                title = stream.get('tags', {}).get('title', '')
-                codec = stream.get('codec_name', '')
-                subtitle_tracks.append((index, language, title, codec))
-        return subtitle_tracks
-    except Exception as e:
-        print(f"Lỗi khi lấy thông tin subtitle từ {file_path}: {e}")
-        return []
-
-def get_file_signature(file_path):
-    """Lấy chữ ký của file (size và duration) để nhận diện file trùng."""
+        await pipeline.run(new_files())
+    finally:
+        flusher.cancel()
+
+def run_async(coroutine, profile_path=None):
+    """asyncio.run, chạy dưới cProfile nếu profile_path có đuôi .prof."""
+    if not (profile_path and profile_path.endswith('.prof')):
+        return asyncio.run(coroutine)
+    profile = cProfile.Profile()
+    profile.enable()
     try:
-        file_size = os.path.getsize(file_path)
-        probe = ffmpeg.probe(file_path)
-        duration = probe.get('format', {}).get('duration', '0')
-        return f"{file_size}_{duration}"
-    except Exception as e:
-        print(f"Error getting file signature: {e}")
-        return None
-
-def main():
+        return asyncio.run(coroutine)
+    finally:
+        profile.disable()
+        profile.dump_stats(profile_path)
+
+def report_profile(profiler, args):
+    """In bảng profile, ghi file JSON, trả về False nếu có file vượt --max-spawns-per-file."""
+    if args.profile:
+        print(profiler.summary(), end='')
+    if args.profile_output and not args.profile_output.endswith('.prof'):
+        profiler.write_json(args.profile_output)
+    if args.max_spawns_per_file is None:
+        return True
+    over = profiler.over_budget(args.max_spawns_per_file)
+    for record in over:
+        spawns = ", ".join(f"{program} x{count}" for program, count in sorted(record['spawns'].items()))
+        print(f"Spawn budget exceeded for {record['path']}: {spawns} (max {args.max_spawns_per_file}).")
+    return not over
+
+def main(argv=None):
+    args = parse_args(argv)
     input_folder = "."  # Folder hiện tại
     vn_folder = "Lồng Tiếng - Thuyết Minh"
     original_folder = "Original"
     log_file = os.path.join(r"C:\Subtitles", "processed_files.log")
+    state_file = os.path.join(os.path.dirname(log_file), "processed_files.db")
+    cache_file = os.path.join(os.path.dirname(log_file), "probe_cache.db")
+
+    create_folder(os.path.dirname(log_file))
+
+    if args.command == 'cache-clear':
+        cache = ProbeCache(cache_file)
+        removed = cache.invalidate(args.paths)
+        cache.close()
+        print(f"Removed {removed} entries from probe cache.")
+        return
+
+    # Mở store trạng thái, tự động chuyển log cũ sang store nếu còn
+    state = StateStore(state_file)
+    migrated = state.migrate_log(log_file)
+    if migrated:
+        print(f"Migrated {migrated} entries from {log_file} to {state_file}.")
+
+    if args.command in ('state-compact', 'state-export'):
+        if args.command == 'state-compact':
+            print(f"Removed {state.compact()} duplicate entries from {state_file}.")
+        else:
+            print(f"Exported {state.export(args.output)} entries to {args.output}.")
+        state.close()
+        return
 
-    create_folder(vn_folder)
-    create_folder(original_folder)
-
-    # Đọc danh sách file đã xử lý
-    processed_files, processed_signatures = read_processed_files(log_file)
+    cache = None if args.no_cache else ProbeCache(cache_file, max_entries=args.cache_size)
+    profiler = None
+    if args.profile or args.profile_output or args.max_spawns_per_file is not None:
+        profiler = Profiler()
 
     try:
-        mkv_files = [f for f in os.listdir(input_folder) if f.lower().endswith(".mkv")]
-        if not mkv_files:
-            print("No MKV files found in the folder.")
+        # Không quét vào các folder output để không xử lý lại file đã tách
+        exclude_dirs = {vn_folder, original_folder}
+        snapshot = None if args.full_scan else state
+        roots = args.root or [input_folder]
+
+        progress = Progress(sys.stdout, metrics_path=args.metrics)
+        scheduler = None
+        if not args.no_device_scheduler:
+            device_limits = {}
+            for item in args.device_limit:
+                path, _, limit = item.rpartition('=')
+                device_limits[path] = int(limit)
+            scheduler = DeviceScheduler(args.jobs, args.hdd_jobs, args.ssd_jobs, device_limits)
+            if args.jobs > 1:
+                for root in roots:
+                    print(scheduler.describe(root))
+        if args.command == 'dedupe':
+            # Luôn quét toàn bộ thư viện (snapshot chỉ liệt kê thư mục có thay đổi)
+            file_paths = [file_path
+                          for root in roots
+                          for file_path in iter_mkv_files(root, args.recursive, None, exclude_dirs)]
+            scanned, groups = find_duplicates(file_paths, cache, state, args.probe_jobs, args.probe == 'ebml')
+            totals = write_report(args.output, scanned, groups)['totals']
+            for group in groups:
+                for copy in group['copies']:
+                    for path in copy['duplicates']:
+                        print(f"Duplicate: {path} (same content as {copy['keep']})")
+            print(f"Scanned {scanned} files: {totals['candidate_files']} files in {totals['candidate_groups']} groups "
+                  f"with the same duration/resolution/tracks, {totals['duplicates']} confirmed duplicates "
+                  f"({totals['duplicate_bytes'] / (1024 * 1024):.1f} MB). Report saved to {args.output}.")
             return
 
-        for mkv_file in mkv_files:
-            file_path = os.path.join(input_folder, mkv_file)
-            print(f"Processing file: {file_path}")
-
-            # Kiểm tra file đã xử lý bằng tên và signature
-            file_signature = get_file_signature(file_path)
-            if mkv_file in processed_files:
-                print(f"File {mkv_file} was processed as {processed_files[mkv_file]['new_name']} on {processed_files[mkv_file]['time']}. Skipping.")
-                continue
-            elif file_signature and file_signature in processed_signatures:
-                print(f"File {mkv_file} has same content as processed file {processed_signatures[file_signature]['new_name']}. Skipping.")
-                continue
-
-            # Đọc thông tin file một lần duy nhất
-            try:
-                probe = ffmpeg.probe(file_path)
-                audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
-                subtitle_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'subtitle']
-            except Exception as e:
-                print(f"Error probing file {file_path}: {e}")
-                continue
+        duplicates = load_duplicates(args.skip_duplicates) if args.skip_duplicates else None
+        transcode_rules = load_rules(args.transcode)
+        pipeline = Pipeline(state, cache, vn_folder, original_folder,
+                            jobs=args.jobs, probe_jobs=args.probe_jobs,
+                            fingerprint=args.signature == 'fingerprint', progress=progress,
+                            ebml=args.probe == 'ebml', scheduler=scheduler, duplicates=duplicates,
+                            verify=args.verify, transcode_rules=transcode_rules,
+                            cpu_budget=CpuBudget(args.encoder_threads) if transcode_rules else None,
+                            in_place=args.in_place, profiler=profiler)
+
+        if args.command == 'plan':
+            file_paths = (file_path
+                          for root in roots
+                          for file_path in iter_mkv_files(root, args.recursive, snapshot, exclude_dirs))
+            entries = run_async(pipeline.plan(file_paths), args.profile_output)
+            plan = write_plan(args.output, entries, pipeline.discovered_count,
+                              {'vn_folder': vn_folder, 'original_folder': original_folder,
+                               'signature': args.signature})
+            totals = plan['totals']
+            print(f"Planned {totals['files']} of {pipeline.discovered_count} files: "
+                  f"{totals['subtitles']} subtitles, {totals['remux']} remux, {totals['renames']} renames; "
+                  f"estimated {totals['estimated_bytes_read'] / (1024 * 1024):.1f} MB read, "
+                  f"{totals['estimated_bytes_written'] / (1024 * 1024):.1f} MB written. Plan saved to {args.output}.")
+            return
 
-            # Kiểm tra subtitle và audio tiếng Việt
-            has_vie_subtitle = any(stream.get('tags', {}).get('language', 'und') == 'vie' 
-                                 for stream in subtitle_streams)
-            has_vie_audio = any(stream.get('tags', {}).get('language', 'und') == 'vie' 
-                               for stream in audio_streams)
+        # Dọn các job bị ngắt ở lần chạy trước (file .partial, bản ghi chưa lưu)
+        recovered = recover(state)
+        if recovered:
+            print(f"Recovered {recovered} interrupted jobs from the previous run.")
+
+        if args.command == 'apply':
+            plan = load_plan(args.plan)
+            run_async(pipeline.apply(plan['files']), args.profile_output)
+            stats = progress.snapshot()
+            print(f"Applied {pipeline.processed_count} of {len(plan['files'])} planned files "
+                  f"({stats['files_failed']} failed), read {pipeline.bytes_read / (1024 * 1024):.1f} MB from sources, "
+                  f"wrote {stats['bytes_written'] / (1024 * 1024):.1f} MB.")
+            return
 
-            # Xử lý subtitle tiếng Việt
-            if has_vie_subtitle:
-                for stream in subtitle_streams:
-                    if stream.get('tags', {}).get('language', 'und') == 'vie':
-                        subtitle_info = (
-                            stream['index'],
-                            'vie',
-                            stream.get('tags', {}).get('title', ''),
-                            stream.get('codec_name', '')
-                        )
-                        extract_subtitle(file_path, subtitle_info, log_file)
+        create_folder(vn_folder)
+        create_folder(original_folder)
 
-            # Nếu không có cả subtitle và audio tiếng Việt
-            if not has_vie_subtitle and not has_vie_audio:
-                print(f"No Vietnamese subtitle and audio found. Renaming file...")
-                first_audio = audio_streams[0] if audio_streams else None
-                if first_audio:
-                    first_audio_lang = first_audio.get('tags', {}).get('language', 'und')
-                    first_audio_info = (-1, -1, first_audio_lang, get_language_abbreviation(first_audio_lang))
-                    new_path = rename_simple(file_path)
-                    log_processed_file(log_file, mkv_file, os.path.basename(new_path))
-                continue
+        if args.command == 'watch':
+            file_paths = watch_mkv_files(roots, args.recursive, snapshot, exclude_dirs,
+                                         settle=args.settle, poll_interval=args.poll_interval,
+                                         use_inotify=False if args.polling else None)
+            try:
+                run_async(watch(pipeline, state, file_paths), args.profile_output)
+            except KeyboardInterrupt:
+                print(f"Stopped watching. Processed {pipeline.processed_count} files.")
+            return
 
-            # Xử lý video nếu có audio tiếng Việt
-            if has_vie_audio:
-                # Tìm audio track tiếng Việt có nhiều kênh nhất
-                vie_audio_tracks = [(i, stream.get('channels', 0), 'vie', 
-                                   stream.get('tags', {}).get('title', 'VIE'))
-                                  for i, stream in enumerate(audio_streams)
-                                  if stream.get('tags', {}).get('language', 'und') == 'vie']
-                if vie_audio_tracks:
-                    # Sắp xếp theo số kênh giảm dần
-                    vie_audio_tracks.sort(key=lambda x: x[1], reverse=True)
-                    selected_track = vie_audio_tracks[0]
-                    extract_video_with_audio(file_path, vn_folder, original_folder, log_file)
+        file_paths = (file_path
+                      for root in roots
+                      for file_path in iter_mkv_files(root, args.recursive, snapshot, exclude_dirs))
+        run_async(pipeline.run(file_paths), args.profile_output)
+        if not pipeline.discovered_count:
+            print("No MKV files found in the folder.")
+            return
+        stats = progress.snapshot()
+        print(f"Processed {pipeline.processed_count} of {pipeline.discovered_count} files "
+              f"({stats['files_failed']} failed), read {pipeline.bytes_read / (1024 * 1024):.1f} MB from sources "
+              f"at {stats['read_bytes_per_second'] / (1024 * 1024):.1f} MB/s, "
+              f"wrote {stats['bytes_written'] / (1024 * 1024):.1f} MB.")
 
     except Exception as e:
-        print(f"Error accessing input folder '{input_folder}': {e}")
+        print(f"Error accessing input folder: {e}")
+    finally:
+        state.close()
+        if cache is not None:
+            cache.close()
+    if profiler is not None and not report_profile(profiler, args):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
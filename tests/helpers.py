@@ -0,0 +1,97 @@
+import os
+import sys
+import struct
+import subprocess
+import textwrap
+from utils import mkv_utils as mkv
+
+def _uint(element_id, value):
+    return mkv._element(element_id, value.to_bytes(max(1, (value.bit_length() + 7) // 8), 'big'))
+
+def _track_entry(number, track_type, codec_id, language, default, extra):
+    payload = (_uint(mkv.TRACK_NUMBER, number) + _uint(mkv.TRACK_UID, 1000 + number)
+               + _uint(mkv.TRACK_TYPE, track_type) + mkv._element(mkv.CODEC_ID, codec_id.encode())
+               + mkv._element(mkv.TRACK_LANGUAGE, language.encode()) + _uint(mkv.FLAG_DEFAULT, int(default))
+               + extra)
+    return mkv._element(mkv.TRACK_ENTRY, payload)
+
+def build_mkv(path, audio=(('eng', 2, True),), subtitles=(), padding=256, body_size=64 * 1024, seed=0):
+    """Tạo file Matroska tối thiểu (đọc được bằng utils.mkv_utils) để test không cần ffmpeg.
+
+    audio là list (language, channels, default), subtitles là list (language, CodecID).
+    Sau Tracks có Void padding byte; Cluster chỉ chứa byte giả (seed để nội dung khác nhau).
+    """
+    entries = [_track_entry(1, 1, 'V_MPEG4/ISO/AVC', 'und', True,
+                            mkv._element(mkv.VIDEO, _uint(mkv.PIXEL_WIDTH, 1920) + _uint(mkv.PIXEL_HEIGHT, 1080)))]
+    for language, channels, default in audio:
+        entries.append(_track_entry(len(entries) + 1, 2, 'A_AAC', language, default,
+                                    mkv._element(mkv.AUDIO, _uint(mkv.CHANNELS, channels))))
+    for language, codec_id in subtitles:
+        entries.append(_track_entry(len(entries) + 1, 0x11, codec_id, language, False, b''))
+    info = mkv._element(mkv.INFO, _uint(mkv.TIMESTAMP_SCALE, 1000000)
+                        + mkv._element(mkv.DURATION, struct.pack('>d', 60000.0)))
+    tracks = mkv._element(mkv.TRACKS, b''.join(entries))
+    body = bytes((seed + i) % 251 for i in range(body_size))
+    cluster = mkv._element(mkv.CLUSTER, body)
+    segment = info + tracks + (mkv._void(padding) if padding else b'') + cluster
+    header = mkv._element(mkv.EBML_HEADER, mkv._element(mkv.EBML_DOCTYPE, b'matroska'))
+    with open(path, 'wb') as f:
+        f.write(header + mkv._element(mkv.SEGMENT, segment))
+    return path
+
+FAKE_FFMPEG = '''
+import sys
+# Tạo mọi output "file:..." của lệnh như ffmpeg thật (nội dung giả)
+for arg in sys.argv[1:]:
+    if arg.startswith('file:'):
+        with open(arg[len('file:'):], 'wb') as f:
+            f.write(b'output')
+'''
+
+FAKE_FFPROBE = '''
+import sys, json
+sys.path.insert(0, {root!r})
+from utils.mkv_utils import read_mkv_probe
+print(json.dumps(read_mkv_probe(sys.argv[-1])))
+'''
+
+def install_fake_tools(folder, monkeypatch):
+    """Đặt ffmpeg/ffprobe giả (script Python) lên đầu PATH, trả về folder."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for name, source in (('ffmpeg', FAKE_FFMPEG), ('ffprobe', FAKE_FFPROBE.format(root=root))):
+        tool = os.path.join(folder, name)
+        with open(tool, 'w', encoding='utf-8') as f:
+            f.write(f"#!{sys.executable}\n" + textwrap.dedent(source))
+        os.chmod(tool, 0o755)
+    monkeypatch.setenv('PATH', str(folder) + os.pathsep + os.environ.get('PATH', ''))
+    return folder
+
+def git(repo, *args):
+    """Chạy git trong repo (test), trả về stdout đã bỏ khoảng trắng hai đầu."""
+    result = subprocess.run(['git', *args], cwd=repo, capture_output=True, check=True)
+    return result.stdout.decode('utf-8').strip()
+
+def make_repo(folder, name='work'):
+    """Tạo remote bare và một repo đã có commit đầu tiên, push sẵn lên remote.
+
+    Trả về (đường dẫn repo, đường dẫn remote).
+    """
+    remote = os.path.join(folder, name + '.git')
+    repo = os.path.join(folder, name)
+    subprocess.run(['git', 'init', '-q', '--bare', remote], check=True)
+    subprocess.run(['git', 'init', '-q', repo], check=True)
+    git(repo, 'config', 'user.name', 'Test')
+    git(repo, 'config', 'user.email', 'test@example.com')
+    git(repo, 'remote', 'add', 'origin', remote)
+    with open(os.path.join(repo, 'README'), 'w') as f:
+        f.write('test\n')
+    git(repo, 'add', 'README')
+    git(repo, 'commit', '-q', '-m', 'init')
+    git(repo, 'push', '-q', '-u', 'origin', 'HEAD')
+    return repo, remote
+
+def commit_file(repo, name, content):
+    with open(os.path.join(repo, name), 'w') as f:
+        f.write(content)
+    git(repo, 'add', name)
+    git(repo, 'commit', '-q', '-m', f'update {name}')
@@ -0,0 +1,68 @@
+import os
+import time
+import hashlib
+import subprocess
+from utils.blob_store import BlobStore, read_pointer
+from utils.git_utils import commit_all, pointer_files
+from tests.helpers import git, make_repo
+
+CHUNK = 1024 * 1024
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_round_trip_through_remote(tmp_path):
+    repo, remote = make_repo(str(tmp_path))
+    blob_remote = str(tmp_path / 'blobs')
+    os.makedirs(os.path.join(repo, 'media'))
+    # Hai chunk đầu giống nhau để kiểm tra chunk chỉ được lưu một lần
+    content = b'a' * CHUNK * 2 + os.urandom(CHUNK // 2)
+    with open(os.path.join(repo, 'media', 'big file.bin'), 'wb') as f:
+        f.write(content)
+    with open(os.path.join(repo, 'notes.txt'), 'w') as f:
+        f.write('small\n')
+
+    result = commit_all(repo, 1, blobs=BlobStore(repo, blob_remote, chunk_size=CHUNK))
+    assert result['committed'] and result['push_code'] == 0
+    assert result['stored'] == ['media/big file.bin.blob']
+
+    pointer = read_pointer(os.path.join(repo, 'media', 'big file.bin.blob'))
+    assert pointer['sha256'] == hashlib.sha256(content).hexdigest()
+    assert pointer['size'] == len(content)
+    assert pointer['chunk_size'] == CHUNK
+    assert pointer['chunks'] == [hashlib.sha256(content[i:i + CHUNK]).hexdigest()
+                                 for i in range(0, len(content), CHUNK)]
+    assert len(set(pointer['chunks'])) == 2
+    assert '/media/big\\ file.bin' in read(os.path.join(repo, '.git', 'info', 'exclude')).decode().splitlines()
+    assert git(repo, 'ls-files') == 'README\nmedia/big file.bin.blob\nnotes.txt'
+    assert git(repo, 'status', '--porcelain') == ''
+
+    clone = str(tmp_path / 'clone')
+    subprocess.run(['git', 'clone', '-q', remote, clone], check=True)
+    store = BlobStore(clone, blob_remote, chunk_size=CHUNK)
+    pointers = pointer_files(clone)
+    assert store.restore(pointers) == ['media/big file.bin']
+    assert read(os.path.join(clone, 'media', 'big file.bin')) == content
+    assert git(clone, 'status', '--porcelain') == ''
+    # File đã khớp pointer thì không ghi lại
+    assert BlobStore(clone, blob_remote, chunk_size=CHUNK).restore(pointers) == []
+
+def test_sweep_timeout_stops_blob_hashing(tmp_path, monkeypatch):
+    repo, _ = make_repo(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    import commit
+    monkeypatch.setattr(commit, 'MAX_FILE_SIZE_MB', 1)
+    with open(os.path.join(repo, 'big.bin'), 'wb') as f:
+        f.write(os.urandom(CHUNK * 40))
+    write_object = BlobStore._write_object
+    def slow_write_object(self, root, digest, data):
+        time.sleep(0.3)
+        return write_object(self, root, digest, data)
+    monkeypatch.setattr(BlobStore, '_write_object', slow_write_object)
+    report = commit.commit_repo(repo, use_blobs=True, timeout=0.5)
+    # 10 chunk 4MB x 0.3 giây: phải dừng ngay sau hạn chót thay vì chạy hết
+    assert report['status'] == 'timeout'
+    assert report['seconds'] < 1.5
+    assert not os.path.exists(os.path.join(repo, 'big.bin.blob'))
+    assert git(repo, 'log', '--format=%s') == 'init'
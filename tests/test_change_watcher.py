@@ -0,0 +1,52 @@
+import os
+from utils.git_utils import ignored_dirs, tree_snapshot
+from tests.helpers import git, make_repo
+
+def write(repo, path, content='x'):
+    full_path = os.path.join(repo, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, 'w') as f:
+        f.write(content)
+
+def make_ignored_tree(tmp_path):
+    repo, _ = make_repo(str(tmp_path))
+    write(repo, '.gitignore', '*.log\n.venv/\nbuild\n')
+    write(repo, '.venv/lib/site.py')
+    write(repo, 'build/out/app.bin')
+    # logs/ chỉ chứa file bị ignore nhưng bản thân thư mục không bị ignore
+    write(repo, 'logs/run.log')
+    write(repo, 'src/main.py')
+    return repo
+
+def test_ignored_dirs_only_lists_directories_matching_a_pattern(tmp_path):
+    repo = make_ignored_tree(tmp_path)
+    assert ignored_dirs(repo) == {'.venv', 'build'}
+    snapshot = tree_snapshot(repo, skip_dirs=ignored_dirs(repo))
+    assert sorted(snapshot) == sorted(['.gitignore', 'README', os.path.join('logs', 'run.log'),
+                                       os.path.join('src', 'main.py')])
+
+def test_watcher_skips_ignored_dirs_and_follows_gitignore(tmp_path, monkeypatch):
+    repo = make_ignored_tree(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    import auto_commit
+    commits = []
+    monkeypatch.setattr(auto_commit, '_commit', lambda *args: commits.append(
+        auto_commit.commit_all(repo, 1, push=False)))
+    watcher = auto_commit.ChangeWatcher(repo)
+    assert watcher.tick()
+    assert len(commits) == 1
+    # Thay đổi trong thư mục bị ignore không làm chạy git status/commit
+    write(repo, '.venv/lib/new.py')
+    write(repo, 'build/out/app.bin', 'changed')
+    assert not watcher.tick()
+    # File mới trong thư mục chỉ chứa file bị ignore vẫn được commit
+    write(repo, 'logs/README.md')
+    assert watcher.tick()
+    assert 'logs/README.md' in git(repo, 'ls-files')
+    # Bỏ build khỏi .gitignore: thư mục được quét và commit
+    write(repo, '.gitignore', '*.log\n.venv/\n')
+    assert watcher.tick()
+    assert watcher.ignored == {'.venv'}
+    assert 'build/out/app.bin' in git(repo, 'ls-files')
+    assert not watcher.tick()
+    assert len(commits) == 3
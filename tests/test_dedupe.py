@@ -0,0 +1,26 @@
+import os
+import shutil
+from processors.dedupe import find_duplicates, SAMPLE_SKIP
+from tests.helpers import build_mkv
+
+BODY = 4 * 1024 * 1024
+
+def test_find_duplicates_groups_identical_copies(tmp_path):
+    original = str(build_mkv(tmp_path / 'a.mkv', body_size=BODY))
+    copy = shutil.copy(original, tmp_path / 'b.mkv')
+    # Khác nội dung nhưng cùng layout và cùng size: không phải bản copy
+    other = str(build_mkv(tmp_path / 'c.mkv', body_size=BODY, seed=1))
+    # Cùng nội dung, chỉ khác vài byte ở phần đầu file (bị bỏ qua khi lấy mẫu)
+    edited = shutil.copy(original, tmp_path / 'd.mkv')
+    with open(edited, 'r+b') as f:
+        f.seek(SAMPLE_SKIP // 2)
+        f.write(b'edited')
+    # Layout khác (thêm audio) thì không cùng nhóm ứng viên
+    build_mkv(tmp_path / 'e.mkv', audio=[('eng', 2, True), ('vie', 2, False)], body_size=BODY)
+
+    scanned, groups = find_duplicates(sorted(str(path) for path in tmp_path.glob('*.mkv')), jobs=2)
+    assert scanned == 5
+    [group] = groups
+    assert group['files'] == sorted([original, str(copy), other, str(edited)])
+    assert group['copies'] == [{'keep': original, 'duplicates': sorted([str(copy), str(edited)]),
+                                'size': os.path.getsize(original)}]
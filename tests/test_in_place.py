@@ -0,0 +1,69 @@
+import os
+import asyncio
+import script
+from processors.journal import recover
+from processors.pipeline import Pipeline, Job
+from processors.video import decide, prepare_default_audio
+from utils.ffmpeg_utils import probe_media_async
+from utils.file_utils import get_file_fingerprint
+from utils.mkv_utils import read_track_flags, write_region
+from utils.state_store import StateStore
+from tests.helpers import build_mkv, install_fake_tools
+
+def audio_flags(path):
+    return [(track['language'], track['default']) for track in read_track_flags(path) if track['type'] == 'audio']
+
+def run(tmp_path, monkeypatch, *args):
+    monkeypatch.chdir(tmp_path)
+    install_fake_tools(tmp_path, monkeypatch)
+    script.main(['--in-place', '--no-cache', *args])
+
+def renamed(tmp_path, prefix):
+    return [name for name in os.listdir(tmp_path) if name.startswith(prefix) and name.endswith('.mkv')]
+
+def test_in_place_sets_vietnamese_default(tmp_path, monkeypatch):
+    build_mkv(tmp_path / 'movie.mkv', audio=[('eng', 6, True), ('vie', 2, False), ('vie', 6, False)])
+    run(tmp_path, monkeypatch)
+    [name] = renamed(tmp_path, 'FHD_')
+    assert audio_flags(tmp_path / name) == [('eng', False), ('vie', False), ('vie', True)]
+    state = StateStore(os.path.join(r"C:\Subtitles", "processed_files.db"))
+    record = state.find_by_name('movie.mkv')
+    assert record['signature'] == get_file_fingerprint(str(tmp_path / name))
+    assert not state.pending_jobs()
+    state.close()
+
+def test_in_place_keeps_vietnamese_first_file(tmp_path, monkeypatch):
+    path = build_mkv(tmp_path / 'movie.mkv', audio=[('vie', 2, True), ('eng', 6, False)])
+    with open(path, 'rb') as f:
+        original = f.read()
+    run(tmp_path, monkeypatch)
+    [name] = renamed(tmp_path, 'FHD_')
+    with open(tmp_path / name, 'rb') as f:
+        assert f.read() == original
+
+def test_recover_rolls_back_torn_header_edit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(build_mkv(tmp_path / 'movie.mkv', audio=[('eng', 2, True), ('vie', 2, False)]))
+    with open(path, 'rb') as f:
+        original = f.read()
+    state = StateStore(str(tmp_path / 'state.db'))
+    pipeline = Pipeline(state, ebml=True, in_place=True)
+    job = pipeline_job(pipeline, path)
+    track, edit = prepare_default_audio(job.media)
+    action = dict(job.action, remux=None)
+    job.journal = pipeline._begin_job(job, action, edit)
+    # Ghi được một nửa header mới rồi bị ngắt
+    offset, _, new_bytes = edit
+    write_region(path, offset, new_bytes[:len(new_bytes) // 2])
+    assert recover(state) == 1
+    with open(path, 'rb') as f:
+        assert f.read() == original
+    assert not state.pending_jobs()
+    state.close()
+
+def pipeline_job(pipeline, path):
+    """Probe và decide một file như pipeline, trả về Job."""
+    job = Job(0, path)
+    job.media = asyncio.run(probe_media_async(path))
+    job.action = decide(job.media, pipeline.vn_folder, pipeline.original_folder)
+    return job
@@ -0,0 +1,47 @@
+import os
+from processors.journal import recover
+from utils.file_utils import partial_path
+from utils.state_store import StateStore
+
+def touch(path, content=b'x'):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def test_recover_cleans_partials_and_finishes_jobs(tmp_path):
+    subtitles = tmp_path / 'Subtitles'
+    original = tmp_path / 'Original'
+    subtitles.mkdir()
+    original.mkdir()
+    state = StateStore(str(tmp_path / 'state.db'))
+
+    # Job đã đổi tên file gốc nhưng chưa kịp ghi bản ghi: một phụ đề xong, một dở dang
+    done_srt, partial_srt = str(subtitles / 'a.srt'), str(subtitles / 'a.2.srt')
+    remux_a = str(original / 'a.mkv')
+    state.begin_job(str(tmp_path / 'a.mkv'), 'FHD_a.mkv', 'sig-a',
+                    {'subtitles': [done_srt, partial_srt], 'remux': remux_a})
+    touch(tmp_path / 'FHD_a.mkv')
+    touch(done_srt)
+    touch(partial_path(partial_srt))
+    touch(partial_path(remux_a))
+
+    # Job bị ngắt khi ffmpeg đang chạy: file gốc chưa đổi tên
+    remux_b = str(original / 'b.mkv')
+    state.begin_job(str(tmp_path / 'b.mkv'), 'FHD_b.mkv', 'sig-b', {'subtitles': [], 'remux': remux_b})
+    touch(tmp_path / 'b.mkv', b'source')
+    touch(partial_path(remux_b))
+
+    assert recover(state) == 2
+    assert sorted(os.listdir(subtitles)) == ['a.srt']
+    assert os.listdir(original) == []
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith('.mkv')) == ['FHD_a.mkv', 'b.mkv']
+    with open(tmp_path / 'b.mkv', 'rb') as f:
+        assert f.read() == b'source'
+
+    assert state.pending_jobs() == []
+    # Roll forward: ghi bù bản ghi phụ đề đã xong và bản ghi đổi tên
+    rows = state.conn.execute("SELECT old_name, new_name, signature FROM processed ORDER BY id").fetchall()
+    assert rows == [('a.mkv', 'a.srt', 'sig-a'), ('a.mkv', 'FHD_a.mkv', 'sig-a')]
+    # Job chưa đổi tên chỉ được đóng, file gốc sẽ được xử lý lại
+    assert state.find_by_name('b.mkv') is None
+    assert recover(state) == 0
+    state.close()
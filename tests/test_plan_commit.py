@@ -0,0 +1,42 @@
+import os
+from utils.git_utils import status_entries, plan_commit
+from tests.helpers import git, make_repo, commit_file
+
+def write(repo, name, content):
+    with open(os.path.join(repo, name), 'w') as f:
+        f.write(content)
+
+def test_plan_commit_reads_renames_and_unusual_names(tmp_path):
+    repo, _ = make_repo(str(tmp_path))
+    # Tên cũ bắt đầu bằng '1 ' như một bản ghi thường: phải được đọc như trường tên cũ
+    commit_file(repo, '1 old name.txt', 'renamed content\n')
+    git(repo, 'mv', '1 old name.txt', 'new name.txt')
+    write(repo, 'README', 'changed\n')
+    write(repo, 'with space.txt', 'x')
+    write(repo, 'line\nbreak.txt', 'x')
+    write(repo, 'big.bin', 'x' * 2000)
+    git(repo, 'add', 'big.bin')
+
+    assert sorted(status_entries(repo)) == [
+        ('.', 'M', 'README', None),
+        ('?', '?', 'line\nbreak.txt', None),
+        ('?', '?', 'with space.txt', None),
+        ('A', '.', 'big.bin', None),
+        ('R', '.', 'new name.txt', '1 old name.txt'),
+    ]
+    plan = plan_commit(repo, 1000)
+    assert sorted(plan['add']) == ['README', 'line\nbreak.txt', 'with space.txt']
+    assert sorted(plan['staged']) == ['README', 'line\nbreak.txt', 'new name.txt', 'with space.txt']
+    assert plan['large'] == [('big.bin', 2000)]
+    assert plan['unstage'] == ['big.bin']
+    assert plan['tracked_large'] == ['big.bin']
+
+def test_plan_commit_unstages_both_names_of_a_large_rename(tmp_path):
+    repo, _ = make_repo(str(tmp_path))
+    commit_file(repo, 'movie.bin', 'x' * 2000)
+    git(repo, 'mv', 'movie.bin', 'renamed movie.bin')
+
+    plan = plan_commit(repo, 1000)
+    assert plan['large'] == [('renamed movie.bin', 2000)]
+    assert plan['unstage'] == ['renamed movie.bin', 'movie.bin']
+    assert plan['add'] == [] and plan['staged'] == []
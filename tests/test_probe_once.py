@@ -0,0 +1,56 @@
+import os
+import asyncio
+from collections import Counter
+import utils.ffmpeg_utils as ffmpeg_utils
+from processors.pipeline import Pipeline
+from utils.mkv_utils import read_mkv_probe
+from utils.state_store import StateStore
+from tests.helpers import build_mkv, install_fake_tools
+
+LIBRARY = {
+    'english.mkv': [('eng', 6, True)],
+    'dubbed.mkv': [('eng', 6, True), ('vie', 2, False)],
+    # Không có gì để làm: không đổi tên, không có bản ghi nên lần sau vẫn probe
+    'vietnamese.mkv': [('vie', 2, True)],
+    'japanese.mkv': [('jpn', 2, True), ('vie', 6, False)],
+}
+
+def count_probes(monkeypatch):
+    """Thay ffmpeg.probe và run_ffprobe_async bằng bản đếm số lần gọi theo file."""
+    calls = Counter()
+    def probe(file_path, **kwargs):
+        calls[os.path.basename(file_path)] += 1
+        return read_mkv_probe(file_path)
+    async def run_ffprobe_async(file_path):
+        calls[os.path.basename(file_path)] += 1
+        return read_mkv_probe(file_path)
+    monkeypatch.setattr(ffmpeg_utils.ffmpeg, 'probe', probe)
+    monkeypatch.setattr(ffmpeg_utils, 'run_ffprobe_async', run_ffprobe_async)
+    return calls
+
+def run_pipeline(tmp_path, state, names):
+    pipeline = Pipeline(state, vn_folder='vn', original_folder='original', jobs=2, ebml=False)
+    asyncio.run(pipeline.run([str(tmp_path / name) for name in names]))
+    return pipeline
+
+def test_each_file_is_probed_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    install_fake_tools(tmp_path, monkeypatch)
+    os.makedirs('vn')
+    os.makedirs('original')
+    for seed, (name, audio) in enumerate(LIBRARY.items()):
+        build_mkv(tmp_path / name, audio=audio, seed=seed)
+    state = StateStore(str(tmp_path / 'state.db'))
+    calls = count_probes(monkeypatch)
+
+    pipeline = run_pipeline(tmp_path, state, LIBRARY)
+    assert pipeline.processed_count == len(LIBRARY)
+    assert calls == Counter({name: 1 for name in LIBRARY})
+
+    # Lần chạy sau (cả tên cũ lẫn tên mới sau khi đổi) không probe lại file nào
+    calls.clear()
+    names = [name for name in os.listdir(tmp_path) if name.endswith('.mkv') and name != 'vietnamese.mkv']
+    assert len(names) == len(LIBRARY) - 1
+    run_pipeline(tmp_path, state, names + [name for name in LIBRARY if name != 'vietnamese.mkv'])
+    assert not calls
+    state.close()
@@ -0,0 +1,81 @@
+import time
+import threading
+import utils.push_queue as push_queue
+from utils.push_queue import PushQueue
+from tests.helpers import git, make_repo, commit_file
+
+def record_pushes(monkeypatch, block=None):
+    """Ghi lại thời điểm mỗi lần git push; block (Event) giữ lần push đầu tới khi được set."""
+    pushes = []
+    run_git = push_queue.run_git
+    def counting_run_git(repo, args, *rest, **kwargs):
+        if args[0] == 'push':
+            pushes.append(time.monotonic())
+            if block is not None and len(pushes) == 1:
+                block.wait(10)
+        return run_git(repo, args, *rest, **kwargs)
+    monkeypatch.setattr(push_queue, 'run_git', counting_run_git)
+    return pushes
+
+def wait_for(condition, timeout=10):
+    until = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < until, "timed out"
+        time.sleep(0.01)
+
+def test_commits_made_during_a_push_are_coalesced(tmp_path, monkeypatch):
+    repo, remote = make_repo(str(tmp_path))
+    release = threading.Event()
+    pushes = record_pushes(monkeypatch, release)
+    queue = PushQueue(repo, base_delay=0.05).start()
+    wait_for(lambda: len(pushes) == 1)
+    # Ba commit trong lúc push khi khởi động còn chạy được đẩy chung một lần
+    for i in range(3):
+        commit_file(repo, 'data.txt', str(i))
+        queue.add()
+    release.set()
+    wait_for(lambda: queue.unpushed == 0)
+    assert queue.close(5) == 0
+    assert len(pushes) == 2
+    assert git(remote, 'rev-parse', 'HEAD') == git(repo, 'rev-parse', 'HEAD')
+
+def test_failed_push_backs_off_then_recovers(tmp_path, monkeypatch):
+    repo, remote = make_repo(str(tmp_path))
+    git(repo, 'remote', 'set-url', 'origin', str(tmp_path / 'missing.git'))
+    pushes = record_pushes(monkeypatch)
+    queue = PushQueue(repo, base_delay=0.05, max_delay=0.2).start()
+    commit_file(repo, 'data.txt', 'new')
+    queue.add()
+    wait_for(lambda: len(pushes) >= 5)
+    assert queue.unpushed == 1 and queue.last_error
+    gaps = [later - earlier for earlier, later in zip(pushes, pushes[1:])]
+    # base_delay nhân đôi sau mỗi lần lỗi: 0.05, 0.1, 0.2 rồi giữ ở max_delay
+    for gap, delay in zip(gaps, [0.05, 0.1, 0.2, 0.2]):
+        assert gap >= delay * 0.9
+    git(repo, 'remote', 'set-url', 'origin', remote)
+    wait_for(lambda: queue.unpushed == 0)
+    queue.close(5)
+    assert queue.failures == 0
+    assert git(remote, 'rev-parse', 'HEAD') == git(repo, 'rev-parse', 'HEAD')
+
+def test_watcher_pauses_commits_at_max_behind(tmp_path, monkeypatch):
+    repo, remote = make_repo(str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    from auto_commit import ChangeWatcher
+    git(repo, 'remote', 'set-url', 'origin', str(tmp_path / 'missing.git'))
+    queue = PushQueue(repo, max_behind=2, base_delay=60).start()
+    watcher = ChangeWatcher(repo, push_queue=queue)
+    for i in range(4):
+        with open(f'{repo}/data{i}.txt', 'w') as f:
+            f.write(str(i))
+        watcher.tick()
+    # Hai commit chưa push là đạt giới hạn: thay đổi thứ ba và thứ tư chưa được commit
+    assert queue.unpushed == 2
+    assert watcher.waiting
+    assert git(repo, 'status', '--porcelain', '--untracked-files=all') == '?? data2.txt\n?? data3.txt'
+    git(repo, 'remote', 'set-url', 'origin', remote)
+    queue.close(5)
+    assert queue.unpushed == 0
+    watcher.tick()
+    assert not watcher.waiting
+    assert git(repo, 'status', '--porcelain') == ''
@@ -0,0 +1,31 @@
+import pytest
+import script
+import utils.ffmpeg_utils as ffmpeg_utils
+from tests.helpers import build_mkv, install_fake_tools
+
+def make_library(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    install_fake_tools(tmp_path, monkeypatch)
+    # Một file chỉ đổi tên (0 tiến trình con), hai file remux (1 ffmpeg mỗi file)
+    build_mkv(tmp_path / 'english.mkv', audio=[('eng', 2, True)], seed=1)
+    build_mkv(tmp_path / 'dubbed.mkv', audio=[('eng', 6, True), ('vie', 2, False)], seed=2)
+    build_mkv(tmp_path / 'japanese.mkv', audio=[('jpn', 2, True), ('vie', 6, False)], seed=3)
+
+def test_pipeline_stays_within_spawn_budget(tmp_path, monkeypatch, capsys):
+    make_library(tmp_path, monkeypatch)
+    script.main(['--no-cache', '--max-spawns-per-file', '1'])
+    out = capsys.readouterr().out
+    assert "Processed 3 of 3 files (0 failed)" in out
+    assert "Spawn budget exceeded" not in out
+
+def test_extra_spawn_fails_the_budget(tmp_path, monkeypatch, capsys):
+    make_library(tmp_path, monkeypatch)
+    # Header MKV không đọc được nữa: mỗi file thêm một lần ffprobe
+    monkeypatch.setattr(ffmpeg_utils, 'read_header_probe', lambda file_path: None)
+    with pytest.raises(SystemExit) as exit_info:
+        script.main(['--no-cache', '--max-spawns-per-file', '1'])
+    assert exit_info.value.code == 1
+    out = capsys.readouterr().out
+    assert "Spawn budget exceeded for ./dubbed.mkv: ffmpeg x1, ffprobe x1 (max 1)." in out
+    assert "Spawn budget exceeded for ./japanese.mkv" in out
+    assert "english.mkv" not in out.split("Spawn budget exceeded", 1)[1]
@@ -0,0 +1,26 @@
+import os
+from utils.state_store import StateStore
+
+LINES = [
+    "movie.mkv|FHD_movie.mkv|2024-01-02 03:04:05|fp1:0123abcd",
+    "show.mkv|HD_show.mkv|2024-01-03 04:05:06|",
+]
+
+def test_migrate_log_round_trips_through_export(tmp_path):
+    log_file = str(tmp_path / 'processed_files.log')
+    with open(log_file, 'w', encoding='utf-8') as f:
+        f.write(LINES[0] + "\n" + "not a record\n" + "\n" + LINES[1] + "\n")
+    state = StateStore(str(tmp_path / 'state.db'))
+
+    assert state.migrate_log(log_file) == 2
+    assert not os.path.exists(log_file)
+    assert os.path.exists(log_file + ".migrated")
+    assert state.find_by_name('FHD_movie.mkv')['signature'] == 'fp1:0123abcd'
+    # Chỉ migrate một lần: log đã đổi tên thì không nhập lại
+    assert state.migrate_log(log_file) == 0
+
+    export_file = str(tmp_path / 'export.log')
+    assert state.export(export_file) == 2
+    with open(export_file, encoding='utf-8') as f:
+        assert f.read().splitlines() == LINES
+    state.close()
@@ -0,0 +1,27 @@
+from processors.subtitle import select_subtitles
+from processors.video import build_command
+from utils.ffmpeg_utils import MediaInfo
+
+def make_media(subtitle_tracks):
+    return MediaInfo('/lib/Movie.mkv', 1000, '60.0', '', 'FHD',
+                     [(1, 2, 'eng', 'ENG', 'aac')], subtitle_tracks)
+
+def test_text_subtitles_are_converted_to_srt():
+    media = make_media([(2, 'vie', '', 'subrip'), (3, 'vie', '', 'ass')])
+    selected = select_subtitles(media, '/subs')
+    assert [path for _, path in selected] == ['/subs/Movie.srt', '/subs/Movie.3.srt']
+    cmd = build_command(media, {'subtitles': selected, 'remux': None, 'rename': None})
+    assert cmd.count('srt') == 2
+
+def test_bitmap_subtitles_are_copied_not_converted():
+    media = make_media([(2, 'vie', '', 'hdmv_pgs_subtitle'), (3, 'vie', '', 'dvd_subtitle'),
+                        (4, 'vie', '', 'subrip')])
+    selected = select_subtitles(media, '/subs')
+    assert [path for _, path in selected] == ['/subs/Movie.sup', '/subs/Movie.3.mks', '/subs/Movie.4.srt']
+    cmd = build_command(media, {'subtitles': selected, 'remux': None, 'rename': None})
+    pgs = cmd.index('0:2')
+    assert cmd[pgs + 1:pgs + 3] == ['-c:s', 'copy']
+    vobsub = cmd.index('0:3')
+    assert cmd[vobsub + 1:vobsub + 5] == ['-c:s', 'copy', '-f', 'matroska']
+    text = cmd.index('0:4')
+    assert cmd[text + 1:text + 3] == ['-c:s', 'srt']
@@ -0,0 +1,325 @@
+import os
+import json
+import shutil
+import hashlib
+from utils.deadline import remaining
+
+POINTER_SUFFIX = '.blob'
+POINTER_HEADER = 'blobstore v1'
+CHUNK_SIZE = 4 * 1024 * 1024
+INDEX_VERSION = 1
+
+class BlobError(Exception):
+    """Lỗi của kho file lớn (thiếu object, pointer hỏng, sai hash)."""
+
+def pointer_path(path):
+    """Tên file pointer (được commit) của một file lớn: a/b.mkv -> a/b.mkv.blob."""
+    return path + POINTER_SUFFIX
+
+def is_pointer(path):
+    return path.endswith(POINTER_SUFFIX)
+
+def read_pointer(file_path):
+    """Đọc file pointer, trả về dict sha256, size, chunk_size, chunks; None nếu không phải pointer."""
+    try:
+        with open(file_path, "r", encoding='ascii') as f:
+            lines = f.read().split('\n')
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not lines or lines[0] != POINTER_HEADER:
+        return None
+    pointer = {'chunks': []}
+    try:
+        for line in lines[1:]:
+            if not line:
+                continue
+            key, _, value = line.partition(' ')
+            if key == 'sha256':
+                pointer['sha256'] = value
+            elif key == 'size':
+                pointer['size'] = int(value)
+            elif key == 'chunk-size':
+                pointer['chunk_size'] = int(value)
+            elif key == 'chunk':
+                pointer['chunks'].append(value)
+    except ValueError:
+        return None
+    if not {'sha256', 'size', 'chunk_size'} <= set(pointer):
+        return None
+    return pointer
+
+def write_pointer(file_path, pointer):
+    lines = [POINTER_HEADER, f"sha256 {pointer['sha256']}", f"size {pointer['size']}",
+             f"chunk-size {pointer['chunk_size']}"] + [f"chunk {chunk}" for chunk in pointer['chunks']]
+    temp_file = file_path + ".tmp"
+    with open(temp_file, "w", encoding='ascii', newline='\n') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temp_file, file_path)
+
+def _escape_exclude(path):
+    """Đường dẫn dạng pattern gitignore khớp đúng một file (neo ở gốc repo)."""
+    escaped = ''.join('\\' + char if char in '\\*?[!# ' else char for char in path)
+    return '/' + escaped
+
+class BlobStore:
+    """Kho object theo nội dung (giống LFS) cho các file quá lớn để commit vào git.
+
+    File lớn được chia thành chunk CHUNK_SIZE, mỗi chunk lưu một lần theo sha256
+    trong .git/blobs/objects (chunk giống nhau giữa các file chỉ lưu một bản).
+    Git chỉ nhận file pointer <tên>.blob liệt kê các chunk; file thật được thêm
+    vào .git/info/exclude. remote là một thư mục cùng cấu trúc objects, dùng để
+    chia sẻ object giữa các máy (ví dụ ổ mạng hoặc thư mục đồng bộ).
+    """
+
+    def __init__(self, repo, remote=None, chunk_size=CHUNK_SIZE):
+        self.repo = repo
+        self.git_dir = os.path.join(repo, '.git')
+        if not os.path.isdir(self.git_dir):
+            raise BlobError(f"{repo} has no .git directory (worktrees and submodules are not supported)")
+        self.root = os.path.join(self.git_dir, 'blobs')
+        self.remote = remote
+        self.chunk_size = chunk_size
+        self.index_file = os.path.join(self.root, 'index.json')
+        self.index = self._load_index()
+        self._excluded = None
+
+    # --- object ---
+
+    @staticmethod
+    def _object_path(root, digest):
+        return os.path.join(root, 'objects', digest[:2], digest[2:])
+
+    def _write_object(self, root, digest, data):
+        path = self._object_path(root, digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return True
+
+    def _read_object(self, digest):
+        """Đọc một chunk từ kho local, nếu thiếu thì lấy từ remote (và lưu lại ở local)."""
+        path = self._object_path(self.root, digest)
+        if not os.path.exists(path) and self.remote:
+            remote_path = self._object_path(self.remote, digest)
+            if os.path.exists(remote_path):
+                with open(remote_path, 'rb') as f:
+                    data = f.read()
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise BlobError(f"Object {digest} in {self.remote} is corrupt")
+                self._write_object(self.root, digest, data)
+                return data
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobError(f"Object {digest} is missing from the local store"
+                            + (f" and {self.remote}" if self.remote else ""))
+
+    # --- index: (size, mtime_ns, sha256) của file lớn để không phải hash lại ---
+
+    def _load_index(self):
+        try:
+            with open(self.index_file, "r", encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        return data.get('files', {}) if data.get('version') == INDEX_VERSION else {}
+
+    def save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        temp_file = self.index_file + ".tmp"
+        with open(temp_file, "w", encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self.index}, f, ensure_ascii=False)
+        os.replace(temp_file, self.index_file)
+
+    def _full_path(self, path):
+        return os.path.join(self.repo, path.replace('/', os.sep))
+
+    def _unchanged(self, path, stat):
+        entry = self.index.get(path)
+        return entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns
+
+    # --- exclude ---
+
+    def _exclude_file(self):
+        return os.path.join(self.git_dir, 'info', 'exclude')
+
+    def _exclude(self, paths):
+        """Thêm file lớn vào .git/info/exclude để git status không liệt kê lại."""
+        if self._excluded is None:
+            try:
+                with open(self._exclude_file(), "r", encoding='utf-8', errors='surrogateescape') as f:
+                    self._excluded = set(f.read().splitlines())
+            except FileNotFoundError:
+                self._excluded = set()
+        new = [_escape_exclude(path) for path in paths if _escape_exclude(path) not in self._excluded]
+        if not new:
+            return
+        os.makedirs(os.path.dirname(self._exclude_file()), exist_ok=True)
+        with open(self._exclude_file(), "a", encoding='utf-8', errors='surrogateescape') as f:
+            if os.path.getsize(self._exclude_file()) and not self._ends_with_newline():
+                f.write('\n')
+            f.write(''.join(pattern + '\n' for pattern in new))
+        self._excluded.update(new)
+
+    def _ends_with_newline(self):
+        with open(self._exclude_file(), 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    # --- lưu và khôi phục ---
+
+    def put(self, path):
+        """Lưu một file vào kho, trả về pointer.
+
+        File được đọc tuần tự từng chunk lớn; sha256 của cả file và của từng
+        chunk được tính trong cùng một lượt đọc, chunk đã có trong kho không ghi lại.
+        Hạn chót của deadline() được kiểm tra trước mỗi chunk.
+        """
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = 0
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        with open(self._full_path(path), 'rb', buffering=0) as f:
+            stat = os.fstat(f.fileno())
+            while True:
+                remaining(['blob', 'put', path])
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                data = view[:count]
+                file_hash.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                self._write_object(self.root, digest, data)
+                chunks.append(digest)
+                size += count
+        pointer = {'sha256': file_hash.hexdigest(), 'size': size, 'chunk_size': self.chunk_size, 'chunks': chunks}
+        self.index[path] = [stat.st_size, stat.st_mtime_ns, pointer['sha256']]
+        return pointer
+
+    def track(self, paths):
+        """Lưu các file lớn và ghi pointer cạnh chúng, trả về list pointer đã ghi mới hoặc thay đổi.
+
+        File không đổi (size và mtime như lần trước, pointer vẫn khớp) không bị đọc lại.
+        """
+        written = []
+        for path in paths:
+            try:
+                stat = os.stat(self._full_path(path))
+            except FileNotFoundError:
+                continue
+            pointer_file = self._full_path(pointer_path(path))
+            existing = read_pointer(pointer_file)
+            if (self._unchanged(path, stat) and existing is not None
+                    and existing['sha256'] == self.index[path][2]):
+                continue
+            pointer = self.put(path)
+            if existing != pointer:
+                write_pointer(pointer_file, pointer)
+                written.append(pointer_path(path))
+        self._exclude(paths)
+        self.save_index()
+        return written
+
+    def refresh(self):
+        """Các file đã vào kho (đang bị exclude) có thay đổi kể từ lần lưu trước.
+
+        Chỉ cần stat từng file, không gọi git; trả về list path cần track lại.
+        """
+        changed = []
+        for path in self.index:
+            try:
+                stat = os.stat(self._full_path(path))
+            except FileNotFoundError:
+                continue
+            if not self._unchanged(path, stat):
+                changed.append(path)
+        return changed
+
+    def _pointers(self, pointer_paths):
+        for path in pointer_paths:
+            pointer = read_pointer(self._full_path(path))
+            if pointer is None:
+                raise BlobError(f"{path} is not a valid pointer file")
+            yield path[:-len(POINTER_SUFFIX)], pointer
+
+    def push(self, pointer_paths):
+        """Chép các chunk của pointer sang remote nếu remote chưa có, trả về số object đã chép.
+
+        Như put(), dừng với subprocess.TimeoutExpired khi quá hạn chót của deadline().
+        """
+        if not self.remote:
+            return 0
+        copied = 0
+        for _, pointer in self._pointers(pointer_paths):
+            for digest in pointer['chunks']:
+                remote_path = self._object_path(self.remote, digest)
+                if os.path.exists(remote_path):
+                    continue
+                remaining(['blob', 'push', digest])
+                os.makedirs(os.path.dirname(remote_path), exist_ok=True)
+                shutil.copyfile(self._object_path(self.root, digest), remote_path + ".tmp")
+                os.replace(remote_path + ".tmp", remote_path)
+                copied += 1
+        return copied
+
+    def restore(self, pointer_paths, force=False):
+        """Dựng lại file thật từ pointer, trả về list file đã ghi.
+
+        File đang có và khớp pointer thì giữ nguyên (chỉ stat nếu đã có trong
+        index); file dựng lại được kiểm tra sha256 trước khi thay vào chỗ.
+        """
+        restored = []
+        pointers = list(self._pointers(pointer_paths))
+        for path, pointer in pointers:
+            full_path = self._full_path(path)
+            try:
+                stat = os.stat(full_path)
+            except FileNotFoundError:
+                stat = None
+            if not force and stat is not None and stat.st_size == pointer['size']:
+                if self._unchanged(path, stat) and self.index[path][2] == pointer['sha256']:
+                    continue
+                if self._hash_file(full_path) == pointer['sha256']:
+                    self.index[path] = [stat.st_size, stat.st_mtime_ns, pointer['sha256']]
+                    continue
+            temp_path = full_path + ".restore"
+            file_hash = hashlib.sha256()
+            try:
+                with open(temp_path, 'wb') as f:
+                    for digest in pointer['chunks']:
+                        remaining(['blob', 'restore', path])
+                        data = self._read_object(digest)
+                        file_hash.update(data)
+                        f.write(data)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+            if file_hash.hexdigest() != pointer['sha256']:
+                os.remove(temp_path)
+                raise BlobError(f"Restored {path} does not match its pointer sha256")
+            os.replace(temp_path, full_path)
+            stat = os.stat(full_path)
+            self.index[path] = [stat.st_size, stat.st_mtime_ns, pointer['sha256']]
+            restored.append(path)
+        self._exclude([path for path, _ in pointers])
+        self.save_index()
+        return restored
+
+    def _hash_file(self, file_path):
+        file_hash = hashlib.sha256()
+        buffer = bytearray(self.chunk_size)
+        view = memoryview(buffer)
+        with open(file_path, 'rb', buffering=0) as f:
+            while True:
+                remaining(['blob', 'hash', file_path])
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                file_hash.update(view[:count])
+        return file_hash.hexdigest()
@@ -0,0 +1,35 @@
+import time
+import subprocess
+import contextvars
+from contextlib import contextmanager
+
+# Hạn chót (time.monotonic) cho mọi lệnh git và thao tác kho file lớn trong context hiện tại
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+@contextmanager
+def deadline(seconds):
+    """Giới hạn tổng thời gian của các lệnh git và việc hash/chép file lớn trong khối with.
+
+    seconds là None thì không giới hạn. Hạn chót gắn với context hiện tại nên
+    mỗi thread của sweep có hạn chót riêng; quá hạn thì subprocess.TimeoutExpired
+    được ném ra (lệnh git đang chạy bị kill).
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining(command):
+    """Số giây còn lại tới hạn chót (None nếu không giới hạn).
+
+    Đã quá hạn thì ném subprocess.TimeoutExpired cho command; các vòng lặp dài
+    (đọc/chép từng chunk) gọi hàm này để dừng đúng hạn.
+    """
+    until = _deadline.get()
+    if until is None:
+        return None
+    left = until - time.monotonic()
+    if left <= 0:
+        raise subprocess.TimeoutExpired(command, 0)
+    return left
@@ -1 +1,364 @@
- 
\ No newline at end of file
+import os
+import re
+import json
+import asyncio
+from collections import deque
+import ffmpeg
+from utils.file_utils import get_file_fingerprint
+from utils.mkv_utils import read_mkv_probe, MkvError
+from utils.profiling import timed, record_spawn
+
+LANGUAGE_MAP = {
+    'eng': 'ENG',  # Tiếng Anh
+    'vie': 'VIE',  # Tiếng Việt
+    'und': 'UNK',  # Không xác định (Undefined)
+    'chi': 'CHI',  # Tiếng Trung
+    'zho': 'CHI',  # Tiếng Trung (mã khác)
+    'jpn': 'JPN',  # Tiếng Nhật
+    'kor': 'KOR',  # Tiếng Hàn
+    'fra': 'FRA',  # Tiếng Pháp
+    'deu': 'DEU',  # Tiếng Đức
+    'spa': 'SPA',  # Tiếng Tây Ban Nha
+    'ita': 'ITA',  # Tiếng Ý
+    'rus': 'RUS',  # Tiếng Nga
+    'tha': 'THA',  # Tiếng Thái
+    'ind': 'IND',  # Tiếng Indonesia
+    'msa': 'MSA',  # Tiếng Malaysia
+    'ara': 'ARA',  # Tiếng Ả Rập
+    'hin': 'HIN',  # Tiếng Hindi
+    'por': 'POR',  # Tiếng Bồ Đào Nha
+    'nld': 'NLD',  # Tiếng Hà Lan
+    'pol': 'POL',  # Tiếng Ba Lan
+    'tur': 'TUR',  # Tiếng Thổ Nhĩ Kỳ
+    'swe': 'SWE',  # Tiếng Thụy Điển
+    'nor': 'NOR',  # Tiếng Na Uy
+    'dan': 'DAN',  # Tiếng Đan Mạch
+    'fin': 'FIN',  # Tiếng Phần Lan
+    'ukr': 'UKR',  # Tiếng Ukraine
+    'ces': 'CES',  # Tiếng Séc
+    'hun': 'HUN',  # Tiếng Hungary
+    'ron': 'RON',  # Tiếng Romania
+    'bul': 'BUL',  # Tiếng Bulgaria
+    'hrv': 'HRV',  # Tiếng Croatia
+    'srp': 'SRP',  # Tiếng Serbia
+    'slv': 'SLV',  # Tiếng Slovenia
+    'ell': 'ELL',  # Tiếng Hy Lạp
+    'heb': 'HEB',  # Tiếng Do Thái
+    'kat': 'KAT',  # Tiếng Georgia
+    'lat': 'LAT',  # Tiếng Latin
+    'vie-Nom': 'NOM',  # Chữ Nôm
+    'cmn': 'CMN',  # Tiếng Trung (Phổ thông)
+    'yue': 'YUE',  # Tiếng Quảng Đông
+    'nan': 'NAN',  # Tiếng Mân Nam
+    'khm': 'KHM',  # Tiếng Khmer
+    'lao': 'LAO',  # Tiếng Lào
+    'mya': 'MYA',  # Tiếng Miến Điện
+    'ben': 'BEN',  # Tiếng Bengal
+    'tam': 'TAM',  # Tiếng Tamil
+    'tel': 'TEL',  # Tiếng Telugu
+    'mal': 'MAL',  # Tiếng Malayalam
+    'kan': 'KAN',  # Tiếng Kannada
+    'mar': 'MAR',  # Tiếng Marathi
+    'pan': 'PAN',  # Tiếng Punjab
+    'guj': 'GUJ',  # Tiếng Gujarat
+    'ori': 'ORI',  # Tiếng Oriya
+    'asm': 'ASM',  # Tiếng Assam
+    'urd': 'URD',  # Tiếng Urdu
+    'fas': 'FAS',  # Tiếng Ba Tư
+    'pus': 'PUS',  # Tiếng Pashto
+    'kur': 'KUR',  # Tiếng Kurdish
+}
+
+def get_language_abbreviation(language_code):
+    """Trả về tên viết tắt của ngôn ngữ dựa trên mã ngôn ngữ."""
+    return LANGUAGE_MAP.get(language_code, language_code.upper()[:3])
+
+def get_resolution_label(width, height):
+    """Lấy tên độ phân giải video (FHD, 4K, 2K, HD) từ kích thước khung hình."""
+    # 8k
+    if width >= 7680 or height >= 4320:
+        return "8K"
+    # 4k
+    elif width >= 3840 or height >= 2160:  # Bao gồm cả 3840x1608
+        return "4K"
+    # 2k
+    elif width >= 2560 or height >= 1440:
+        return "2K"
+    # FHD
+    elif width >= 1920 or height >= 1080:
+        return "FHD"
+    # HD
+    elif width >= 1280 or height >= 720:
+        return "HD"
+    # 480p
+    elif width >= 720 or height >= 480:
+        return "480p"
+    else:
+        return f"{width}p"
+
+class MediaInfo:
+    """Thông tin gọn của một file video, lấy từ đúng một lần probe.
+
+    audio_tracks: list các tuple (index, channels, language, title, codec),
+    title mặc định là tên viết tắt của ngôn ngữ.
+    subtitle_tracks: list các tuple (index, language, title, codec).
+    fingerprint: fingerprint nội dung lấy mẫu (None nếu không tính).
+    """
+    __slots__ = ('path', 'size', 'duration', 'year', 'resolution_label',
+                 'audio_tracks', 'subtitle_tracks', 'fingerprint')
+
+    def __init__(self, path, size, duration, year, resolution_label,
+                 audio_tracks, subtitle_tracks, fingerprint=None):
+        self.path = path
+        self.size = size
+        self.duration = duration
+        self.year = year
+        self.resolution_label = resolution_label
+        self.audio_tracks = audio_tracks
+        self.subtitle_tracks = subtitle_tracks
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_probe(cls, file_path, probe, size):
+        """Tạo MediaInfo từ kết quả ffmpeg.probe."""
+        resolution_label = "unknown_resolution"
+        audio_tracks = []
+        subtitle_tracks = []
+        for stream in probe.get('streams', []):
+            codec_type = stream.get('codec_type')
+            tags = stream.get('tags', {})
+            if codec_type == 'video' and resolution_label == "unknown_resolution":
+                if 'width' in stream and 'height' in stream:
+                    resolution_label = get_resolution_label(int(stream['width']), int(stream['height']))
+            elif codec_type == 'audio':
+                language = tags.get('language', 'und')
+                audio_tracks.append((
+                    stream.get('index', -1),
+                    stream.get('channels', 0),
+                    language,
+                    tags.get('title', get_language_abbreviation(language)),
+                    stream.get('codec_name', '')
+                ))
+            elif codec_type == 'subtitle':
+                subtitle_tracks.append((
+                    stream.get('index', -1),
+                    tags.get('language', 'und'),
+                    tags.get('title', ''),
+                    stream.get('codec_name', '')
+                ))
+        format_info = probe.get('format', {})
+        duration = format_info.get('duration', '0')
+        year = format_info.get('tags', {}).get('year', '').strip()
+        return cls(file_path, size, duration, year, resolution_label,
+                   audio_tracks, subtitle_tracks)
+
+    def to_json(self):
+        """Chuyển MediaInfo thành chuỗi JSON để lưu cache (không gồm path)."""
+        return json.dumps([self.size, self.duration, self.year, self.resolution_label,
+                           self.audio_tracks, self.subtitle_tracks, self.fingerprint],
+                          ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, file_path, data):
+        """Tạo lại MediaInfo từ chuỗi JSON của to_json."""
+        values = json.loads(data)
+        size, duration, year, resolution_label, audio_tracks, subtitle_tracks = values[:6]
+        fingerprint = values[6] if len(values) > 6 else None
+        return cls(file_path, size, duration, year, resolution_label,
+                   [tuple(track) for track in audio_tracks],
+                   [tuple(track) for track in subtitle_tracks], fingerprint)
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def base_name(self):
+        return os.path.splitext(self.name)[0]
+
+    @property
+    def signature(self):
+        """Chữ ký cũ của file (size và duration), vẫn dùng để so với log cũ."""
+        return f"{self.size}_{self.duration}"
+
+    @property
+    def content_signature(self):
+        """Chữ ký ghi vào log: fingerprint nếu có, ngược lại là chữ ký cũ."""
+        return self.fingerprint or self.signature
+
+    @property
+    def first_audio(self):
+        return self.audio_tracks[0] if self.audio_tracks else None
+
+    def has_audio_language(self, language):
+        return any(track[2] == language for track in self.audio_tracks)
+
+    def has_subtitle_language(self, language):
+        return any(track[1] == language for track in self.subtitle_tracks)
+
+def _probe_cached(file_path, cache, fingerprint):
+    """Phần probe không cần ffprobe: stat, tra cache và tính fingerprint.
+
+    Trả về (stat, fingerprint, MediaInfo hoặc None nếu vẫn phải chạy ffprobe).
+    """
+    st = os.stat(file_path)
+    file_fingerprint = None
+    if cache is not None:
+        media = cache.get(file_path, st)
+        if media is not None:
+            if fingerprint and not media.fingerprint:
+                media.fingerprint = get_file_fingerprint(file_path)
+                cache.put(media, st)
+            return st, media.fingerprint, media
+    if fingerprint:
+        file_fingerprint = get_file_fingerprint(file_path)
+        if cache is not None:
+            media = cache.get_by_signature(file_path, file_fingerprint)
+            if media is not None:
+                media.fingerprint = file_fingerprint
+                cache.put(media, st)
+                return st, file_fingerprint, media
+    return st, file_fingerprint, None
+
+def _media_from_probe(file_path, probe, st, file_fingerprint, cache):
+    media = MediaInfo.from_probe(file_path, probe, st.st_size)
+    media.fingerprint = file_fingerprint
+    if cache is not None:
+        cache.put(media, st)
+    return media
+
+def read_header_probe(file_path):
+    """Đọc metadata từ header Matroska trong process (không spawn ffprobe).
+
+    Trả về kết quả cùng dạng ffmpeg.probe, hoặc None nếu file không phải MKV
+    hay header không đọc được (khi đó dùng ffprobe).
+    """
+    if not file_path.lower().endswith(('.mkv', '.mka', '.mks', '.webm')):
+        return None
+    try:
+        return read_mkv_probe(file_path)
+    except (MkvError, OSError, ValueError):
+        return None
+
+def probe_media(file_path, cache=None, fingerprint=False, ebml=True):
+    """Probe file đúng một lần và trả về MediaInfo (None nếu lỗi).
+
+    Nếu có cache và file chưa đổi (size, mtime) thì chỉ tốn một lần stat.
+    Với fingerprint=True, fingerprint nội dung được tính khi cache miss và dùng
+    để tìm lại bản ghi của file bị copy/di chuyển trước khi phải gọi ffprobe.
+    Với ebml=True, header Matroska được đọc trực tiếp, chỉ gọi ffprobe khi không đọc được.
+    """
+    try:
+        st, file_fingerprint, media = _probe_cached(file_path, cache, fingerprint)
+        if media is not None:
+            return media
+        probe = read_header_probe(file_path) if ebml else None
+        if probe is None:
+            record_spawn('ffprobe')
+            probe = ffmpeg.probe(file_path)
+    except Exception as e:
+        print(f"Error probing file {file_path}: {e}")
+        return None
+    return _media_from_probe(file_path, probe, st, file_fingerprint, cache)
+
+async def run_ffprobe_async(file_path):
+    """Chạy ffprobe bằng asyncio subprocess, trả về kết quả giống ffmpeg.probe."""
+    record_spawn('ffprobe')
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-show_format', '-show_streams', '-of', 'json', file_path,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffprobe error: {stderr.decode('utf-8', errors='replace').strip()}")
+    return json.loads(stdout.decode('utf-8'))
+
+async def probe_media_async(file_path, cache=None, fingerprint=False, ebml=True):
+    """Bản asyncio của probe_media: stat/cache/fingerprint/đọc header chạy trong thread, ffprobe là subprocess."""
+    try:
+        with timed('cache'):
+            st, file_fingerprint, media = await asyncio.to_thread(_probe_cached, file_path, cache, fingerprint)
+        if media is not None:
+            return media
+        with timed('header'):
+            probe = await asyncio.to_thread(read_header_probe, file_path) if ebml else None
+        if probe is None:
+            with timed('ffprobe'):
+                probe = await run_ffprobe_async(file_path)
+    except Exception as e:
+        print(f"Error probing file {file_path}: {e}")
+        return None
+    return _media_from_probe(file_path, probe, st, file_fingerprint, cache)
+
+async def run_ffmpeg_async(cmd, on_progress=None, stderr_lines=200):
+    """Chạy lệnh ffmpeg bằng asyncio subprocess, trả về (returncode, stderr_tail, bytes_read).
+
+    ffmpeg được chạy với -progress pipe:1 và output tiến độ được đọc dần theo
+    từng khối; mỗi khối (dict key=value) được truyền cho on_progress nếu có.
+    stderr cũng được đọc theo dòng: chỉ giữ stderr_lines dòng cuối (ring buffer)
+    để báo lỗi, còn số byte đã đọc từ input được cộng dần khi gặp.
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+    record_spawn(os.path.basename(cmd[0]))
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stderr_tail = deque(maxlen=stderr_lines)
+    bytes_read = [None]
+
+    async def read_progress():
+        block = {}
+        async for line in process.stdout:
+            key, sep, value = line.decode('utf-8', errors='replace').strip().partition('=')
+            if not sep:
+                continue
+            block[key] = value
+            if key == 'progress':
+                if on_progress is not None:
+                    on_progress(block)
+                block = {}
+
+    async def read_stderr():
+        async for line in process.stderr:
+            text = line.decode('utf-8', errors='replace')
+            stderr_tail.append(text)
+            value = parse_bytes_read(text)
+            if value is not None:
+                bytes_read[0] = (bytes_read[0] or 0) + value
+
+    await asyncio.gather(read_progress(), read_stderr())
+    returncode = await process.wait()
+    return returncode, ''.join(stderr_tail), bytes_read[0]
+
+def parse_progress(block, duration=None):
+    """Đọc một khối -progress của ffmpeg, trả về (out_seconds, speed, total_size), thiếu thì None."""
+    out_seconds = None
+    value = block.get('out_time_us') or block.get('out_time_ms')
+    if value and value != 'N/A':
+        try:
+            out_seconds = max(int(value), 0) / 1000000
+        except ValueError:
+            pass
+    if out_seconds is not None and duration:
+        out_seconds = min(out_seconds, duration)
+    speed = None
+    value = block.get('speed', '').rstrip('x').strip()
+    if value and value != 'N/A':
+        try:
+            speed = float(value)
+        except ValueError:
+            pass
+    total_size = None
+    value = block.get('total_size')
+    if value and value != 'N/A':
+        try:
+            total_size = int(value)
+        except ValueError:
+            pass
+    return out_seconds, speed, total_size
+
+def parse_bytes_read(stderr_text):
+    """Lấy tổng số byte ffmpeg đã đọc từ input (dòng "Statistics: N bytes read" khi chạy -v verbose)."""
+    matches = re.findall(r'Statistics: (\d+) bytes read', stderr_text)
+    if not matches:
+        return None
+    return sum(int(value) for value in matches)
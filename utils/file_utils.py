@@ -1 +1,165 @@
- 
\ No newline at end of file
+import io
+import os
+import re
+import time
+import hashlib
+import threading
+import contextvars
+
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+FINGERPRINT_MIDDLE_BLOCKS = 6
+
+_rename_lock = threading.Lock()
+
+def create_folder(folder_name):
+    """Tạo folder nếu chưa tồn tại."""
+    os.makedirs(folder_name, exist_ok=True)
+
+def sanitize_filename(name):
+    """Loại bỏ các ký tự không hợp lệ trong tên tệp để tránh lỗi FFmpeg."""
+    # Thay thế các ký tự không hợp lệ bằng dấu gạch dưới
+    return re.sub(r'[<>:"/\\|?*\n\r\t]', '_', name)
+
+def rename_no_overwrite(src, dst):
+    """Đổi tên file nhưng không ghi đè file đã tồn tại (an toàn khi chạy song song)."""
+    with _rename_lock:
+        if os.path.exists(dst) and not os.path.samefile(src, dst):
+            raise FileExistsError(f"Destination already exists: {dst}")
+        os.rename(src, dst)
+
+class CapturedOutput(io.TextIOBase):
+    """Thay cho sys.stdout, gom output print của từng việc vào buffer riêng.
+
+    Buffer gắn với context hiện tại nên dùng được cho cả thread lẫn asyncio task.
+    Dùng capture()/capture_async() để chạy một hàm và lấy lại output của nó, nhờ
+    vậy output của từng file được in liền một khối và theo thứ tự cố định.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._buffer = contextvars.ContextVar('captured_output', default=None)
+
+    def write(self, text):
+        buffer = self._buffer.get()
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def capture(self, func, *args):
+        """Chạy func(*args), trả về (kết quả, output đã print)."""
+        buffer = []
+        token = self._buffer.set(buffer)
+        try:
+            result = func(*args)
+        finally:
+            self._buffer.reset(token)
+        return result, ''.join(buffer)
+
+    async def capture_async(self, func, *args):
+        """Như capture() nhưng cho coroutine function."""
+        buffer = []
+        token = self._buffer.set(buffer)
+        try:
+            result = await func(*args)
+        finally:
+            self._buffer.reset(token)
+        return result, ''.join(buffer)
+
+def get_file_fingerprint(file_path, block_size=FINGERPRINT_BLOCK_SIZE,
+                         middle_blocks=FINGERPRINT_MIDDLE_BLOCKS, skip=0):
+    """Tạo fingerprint nội dung từ size và các block lấy mẫu (đầu, giữa, cuối).
+
+    Chỉ đọc (middle_blocks + 2) block cố định nên không phụ thuộc kích thước file
+    và không cần gọi ffprobe. skip > 0 thì bỏ qua skip byte ở đầu và cuối file
+    khi lấy mẫu. Kết quả có dạng "fp1:<hex>".
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(str(size).encode())
+        if size <= 2 * skip + block_size * (middle_blocks + 2):
+            # File nhỏ: hash toàn bộ nội dung
+            offsets = range(0, size, block_size)
+        else:
+            span = size - 2 * skip - block_size
+            offsets = [skip + span * i // (middle_blocks + 1) for i in range(middle_blocks + 2)]
+        for offset in offsets:
+            f.seek(offset)
+            count = f.readinto(buffer)
+            digest.update(view[:count])
+    return f"fp1:{digest.hexdigest()}"
+
+# Thư mục có mtime mới hơn khoảng này chưa được lưu snapshot, vì file có thể vừa
+# được thêm trong cùng một "tick" thời gian với lần quét.
+SNAPSHOT_SETTLE_SECONDS = 2
+PARTIAL_SUFFIX = ".partial"
+
+def partial_path(path):
+    """Tên file tạm khi đang ghi output: movie.mkv -> movie.partial.mkv (giữ đuôi để ffmpeg chọn định dạng)."""
+    base, ext = os.path.splitext(path)
+    return base + PARTIAL_SUFFIX + ext
+
+def is_partial(name):
+    """File tạm chưa ghi xong (không được coi là file MKV để xử lý)."""
+    return os.path.splitext(name)[0].endswith(PARTIAL_SUFFIX)
+
+def list_folder(folder, snapshot=None, exclude_dirs=(), with_changed=False):
+    """Liệt kê file .mkv và thư mục con của folder, trả về (mkv_files, subdirs) đã sắp xếp.
+
+    Nếu snapshot có bản ghi với cùng mtime của thư mục thì dùng lại kết quả cũ
+    mà không cần liệt kê thư mục (chỉ tốn một lần stat). Với with_changed=True
+    thì trả thêm cờ cho biết thư mục có phải liệt kê lại hay không.
+    """
+    st = os.stat(folder)
+    key = os.path.abspath(folder)
+    if snapshot is not None:
+        cached = snapshot.get_dir_snapshot(key)
+        if cached is not None and cached[0] == st.st_mtime_ns:
+            if with_changed:
+                return cached[1], cached[2], False
+            return cached[1], cached[2]
+
+    mkv_files = []
+    subdirs = []
+    entry_count = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            entry_count += 1
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in exclude_dirs and not entry.name.startswith('.'):
+                    subdirs.append(entry.name)
+            elif entry.name.lower().endswith(".mkv") and not is_partial(entry.name) and entry.is_file():
+                mkv_files.append(entry.name)
+    mkv_files.sort()
+    subdirs.sort()
+    if snapshot is not None and time.time() - st.st_mtime > SNAPSHOT_SETTLE_SECONDS:
+        snapshot.put_dir_snapshot(key, st.st_mtime_ns, entry_count, mkv_files, subdirs)
+    if with_changed:
+        return mkv_files, subdirs, True
+    return mkv_files, subdirs
+
+def iter_mkv_files(root, recursive=False, snapshot=None, exclude_dirs=(), only_changed=False):
+    """Duyệt các file .mkv dưới root theo thứ tự tên (đệ quy nếu recursive).
+
+    Thư mục không đổi mtime kể từ lần quét trước được lấy từ snapshot, không liệt kê lại.
+    Với only_changed=True chỉ trả về file của các thư mục đã thay đổi.
+    """
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            mkv_files, subdirs, changed = list_folder(folder, snapshot, exclude_dirs, with_changed=True)
+        except OSError as e:
+            print(f"Error scanning folder '{folder}': {e}")
+            continue
+        if changed or not only_changed:
+            for mkv_file in mkv_files:
+                yield os.path.join(folder, mkv_file)
+        if recursive:
+            stack.extend(os.path.join(folder, subdir) for subdir in reversed(subdirs))
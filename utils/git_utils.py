@@ -1 +1,241 @@
- 
\ No newline at end of file
+import os
+import subprocess
+from datetime import datetime
+from utils.blob_store import is_pointer
+from utils.deadline import remaining
+
+class GitError(Exception):
+    """Lệnh git chạy lỗi (kèm stderr của git)."""
+
+def find_git_repos(root):
+    """Mọi Git repository nằm dưới root (kể cả root), không đi vào bên trong một repo."""
+    repos = []
+    pending = [os.path.abspath(root)]
+    while pending:
+        folder = pending.pop()
+        if os.path.exists(os.path.join(folder, '.git')):
+            repos.append(folder)
+            continue
+        try:
+            with os.scandir(folder) as entries:
+                pending += [entry.path for entry in entries
+                            if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.')]
+        except OSError:
+            continue
+    return sorted(repos)
+
+def find_git_repo(start=None):
+    """Tìm thư mục Git repository gần nhất."""
+    current = os.path.abspath(start or os.getcwd())
+    while current != os.path.dirname(current):  # Dừng khi lên tới thư mục gốc
+        if os.path.exists(os.path.join(current, '.git')):
+            return current
+        current = os.path.dirname(current)
+    return None
+
+def run_git(repo, args, input_data=None, check=True, timeout=None, literal=True):
+    """Chạy một lệnh git trong repo (không đổi thư mục làm việc của process).
+
+    --literal-pathspecs để tên file có ký tự như * hay [ không bị hiểu là pattern
+    (literal=False cho lệnh không nhận pathspec magic, như check-ignore).
+    Quá timeout giây (hoặc quá hạn chót của deadline()) thì
+    subprocess.TimeoutExpired được ném ra.
+    """
+    left = remaining(['git'] + list(args))
+    if left is not None:
+        timeout = left if timeout is None else min(timeout, left)
+    result = subprocess.run(['git'] + (['--literal-pathspecs'] if literal else []) + list(args), cwd=repo,
+                            input=input_data, capture_output=True, timeout=timeout)
+    if check and result.returncode != 0:
+        raise GitError(f"git {args[0]} failed ({result.returncode}): "
+                       f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+    return result
+
+def parse_status(data):
+    """Đọc output của git status --porcelain=v2 -z.
+
+    Trả về list (x, y, path, orig_path): x/y là trạng thái trong index/worktree
+    ('.' nếu không đổi, '?' với file chưa track), orig_path là tên cũ khi đổi tên.
+    """
+    entries = []
+    fields = data.decode('utf-8', errors='surrogateescape').split('\0')
+    i = 0
+    while i < len(fields):
+        field = fields[i]
+        i += 1
+        if not field or field.startswith('#'):
+            continue
+        kind = field[0]
+        if kind == '?':
+            entries.append(('?', '?', field[2:], None))
+        elif kind == '1':
+            parts = field.split(' ', 8)
+            entries.append((parts[1][0], parts[1][1], parts[8], None))
+        elif kind == '2':
+            parts = field.split(' ', 9)
+            # Bản ghi đổi tên: tên cũ nằm ở trường kế tiếp
+            entries.append((parts[1][0], parts[1][1], parts[9], fields[i]))
+            i += 1
+        elif kind == 'u':
+            parts = field.split(' ', 10)
+            entries.append((parts[1][0], parts[1][1], parts[10], None))
+    return entries
+
+def status_entries(repo):
+    """Toàn bộ thay đổi của repo từ đúng một lần gọi git status."""
+    return parse_status(run_git(repo, ['status', '--porcelain=v2', '-z', '--untracked-files=all']).stdout)
+
+def file_sizes(repo, paths):
+    """Kích thước các file (None nếu không còn tồn tại), quét mỗi thư mục một lần bằng scandir."""
+    by_folder = {}
+    for path in paths:
+        folder, name = os.path.split(path)
+        by_folder.setdefault(folder, set()).add(name)
+    sizes = dict.fromkeys(paths)
+    for folder, names in by_folder.items():
+        try:
+            with os.scandir(os.path.join(repo, folder)) as entries:
+                for entry in entries:
+                    if entry.name in names:
+                        # Thư mục (submodule) không tính kích thước
+                        size = entry.stat(follow_symlinks=False).st_size if not entry.is_dir(follow_symlinks=False) else 0
+                        sizes[os.path.join(folder, entry.name) if folder else entry.name] = size
+        except FileNotFoundError:
+            continue
+    return sizes
+
+# Không tính vào snapshot: dữ liệu của git và cache bytecode (luôn bị ignore)
+SNAPSHOT_SKIP_DIRS = {'.git', '__pycache__'}
+
+def ignored_dirs(repo):
+    """Các thư mục bị ignore (.gitignore, .git/info/exclude, excludesFile), đường dẫn tương đối.
+
+    git chỉ liệt kê thư mục ignore ở mức cao nhất (--directory) nên kết quả
+    nhỏ dù bên trong có rất nhiều file (.venv, node_modules, build). ls-files
+    còn liệt kê cả thư mục chưa theo dõi chỉ chứa file bị ignore (ví dụ logs/
+    với *.log), nên chỉ giữ thư mục mà chính nó khớp pattern (check-ignore):
+    file mới không bị ignore trong các thư mục đó vẫn phải được thấy.
+    """
+    data = run_git(repo, ['ls-files', '-z', '--others', '--ignored', '--exclude-standard', '--directory']).stdout
+    candidates = [path for path in data.decode('utf-8', errors='surrogateescape').split('\0') if path.endswith('/')]
+    if not candidates:
+        return set()
+    result = run_git(repo, ['check-ignore', '-z', '--stdin'], input_data=_pathspec_input(candidates),
+                     check=False, literal=False)
+    if result.returncode > 1:
+        raise GitError(f"git check-ignore failed ({result.returncode}): "
+                       f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+    ignored = result.stdout.decode('utf-8', errors='surrogateescape').split('\0')
+    return {path.rstrip('/').replace('/', os.sep) for path in ignored if path}
+
+def tree_snapshot(repo, skip_names=(), skip_dirs=()):
+    """Snapshot {đường dẫn tương đối: (size, mtime_ns)} của cây thư mục, không gọi git.
+
+    Dùng để phát hiện thay đổi rẻ tiền: chỉ chạy git status khi snapshot khác lần trước.
+    skip_dirs là các thư mục (đường dẫn tương đối, ví dụ từ ignored_dirs) không cần quét.
+    """
+    snapshot = {}
+    pending = ['']
+    while pending:
+        folder = pending.pop()
+        try:
+            with os.scandir(os.path.join(repo, folder)) as entries:
+                for entry in entries:
+                    path = os.path.join(folder, entry.name) if folder else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SNAPSHOT_SKIP_DIRS and path not in skip_dirs:
+                            pending.append(path)
+                    elif entry.name not in skip_names:
+                        stat = entry.stat(follow_symlinks=False)
+                        snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+    return snapshot
+
+def plan_commit(repo, max_size_bytes):
+    """Quyết định file nào được commit từ một snapshot status.
+
+    Trả về dict: add (file thay đổi trong worktree sẽ được add), large (list
+    (path, size) bị bỏ qua vì lớn hơn max_size_bytes), unstage (file lớn đã lỡ
+    nằm trong index cần bỏ ra), tracked_large (file lớn git đang theo dõi) và
+    staged (file sẽ có trong commit).
+    """
+    entries = status_entries(repo)
+    sizes = file_sizes(repo, [path.replace('/', os.sep) for _, _, path, _ in entries])
+    plan = {'add': [], 'large': [], 'unstage': [], 'tracked_large': [], 'staged': []}
+    for x, y, path, orig_path in entries:
+        size = sizes.get(path.replace('/', os.sep))
+        if size is not None and size > max_size_bytes:
+            plan['large'].append((path, size))
+            if x != '?':
+                plan['tracked_large'].append(path)
+            if x not in ('.', '?'):
+                plan['unstage'].append(path)
+                if orig_path:
+                    plan['unstage'].append(orig_path)
+            continue
+        if y != '.':
+            plan['add'].append(path)
+        if x != '.' or y != '.':
+            plan['staged'].append(path)
+    return plan
+
+def _pathspec_input(paths):
+    return b''.join(path.encode('utf-8', errors='surrogateescape') + b'\0' for path in paths)
+
+def add_paths(repo, paths):
+    """git add cho mọi path trong một lần gọi (kể cả file đã xóa)."""
+    if paths:
+        run_git(repo, ['add', '--pathspec-from-file=-', '--pathspec-file-nul'], _pathspec_input(paths))
+
+def unstage_paths(repo, paths):
+    """Bỏ các path ra khỏi index trong một lần gọi."""
+    if paths:
+        run_git(repo, ['reset', '-q', '--pathspec-from-file=-', '--pathspec-file-nul'], _pathspec_input(paths))
+
+def untrack_paths(repo, paths):
+    """Bỏ theo dõi các path (git rm --cached, file thật vẫn giữ) trong một lần gọi."""
+    if paths:
+        run_git(repo, ['rm', '-q', '--cached', '--ignore-unmatch', '--pathspec-from-file=-', '--pathspec-file-nul'],
+                _pathspec_input(paths))
+
+def pointer_files(repo):
+    """Các file pointer của kho file lớn đang được git theo dõi."""
+    data = run_git(repo, ['ls-files', '-z']).stdout.decode('utf-8', errors='surrogateescape')
+    return [path for path in data.split('\0') if path and is_pointer(path)]
+
+def commit_all(repo, max_size_mb, message=None, push=True, blobs=None):
+    """Add và commit mọi thay đổi nhỏ hơn max_size_mb, rồi push.
+
+    Số lần gọi git không phụ thuộc số file thay đổi: status, reset (nếu có file
+    lớn trong index), add, commit và push. Nếu có blobs (BlobStore), file lớn
+    được lưu vào kho và commit file pointer thay cho việc bỏ qua; file lớn đang
+    được git theo dõi thì bị bỏ theo dõi (git rm --cached) thay cho reset.
+    Trả về dict kết quả: committed, message, files, large, stored (các pointer
+    đã ghi), push_code (None nếu không push).
+    """
+    plan = plan_commit(repo, max_size_mb * 1024 * 1024)
+    result = {'committed': False, 'message': None, 'files': len(plan['staged']),
+              'large': plan['large'], 'stored': [], 'push_code': None}
+    if blobs is not None:
+        large = [path for path, _ in plan['large']]
+        result['stored'] = blobs.track(large + [path for path in blobs.refresh() if path not in large])
+        result['large'] = []
+        untrack_paths(repo, plan['tracked_large'] + [path for path in plan['unstage'] if path not in plan['tracked_large']])
+        plan['add'] += result['stored']
+        plan['staged'] += result['stored']
+        result['files'] = len(plan['staged'])
+    else:
+        unstage_paths(repo, plan['unstage'])
+    if not plan['staged']:
+        return result
+    add_paths(repo, plan['add'])
+    result['message'] = message or f"Auto commit at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    run_git(repo, ['commit', '-q', '-m', result['message']])
+    result['committed'] = True
+    if blobs is not None:
+        # Object phải có ở remote trước khi pointer được push (kể cả push qua PushQueue)
+        blobs.push(result['stored'])
+    if push:
+        result['push_code'] = run_git(repo, ['push', '-q'], check=False).returncode
+    return result
@@ -0,0 +1,622 @@
+import os
+import zlib
+import struct
+
+# ID các element Matroska/EBML cần đọc (giữ nguyên các bit đánh dấu độ dài)
+EBML_HEADER = 0x1A45DFA3
+EBML_DOCTYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMESTAMP_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+TRACK_UID = 0x73C5
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+TRACK_NAME = 0x536E
+TRACK_LANGUAGE = 0x22B59C
+TRACK_LANGUAGE_BCP47 = 0x22B59D
+FLAG_DEFAULT = 0x88
+FLAG_FORCED = 0x55AA
+VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+AUDIO = 0xE1
+CHANNELS = 0x9F
+BIT_DEPTH = 0x6264
+TAGS = 0x1254C367
+TAG = 0x7373
+TARGETS = 0x63C0
+TAG_TRACK_UID = 0x63C5
+TAG_EDITION_UID = 0x63C9
+TAG_CHAPTER_UID = 0x63C4
+TAG_ATTACHMENT_UID = 0x63C6
+SIMPLE_TAG = 0x67C8
+TAG_NAME = 0x45A3
+TAG_LANGUAGE = 0x447A
+TAG_STRING = 0x4487
+CLUSTER = 0x1F43B675
+VOID = 0xEC
+CRC32 = 0xBF
+
+TRACK_TYPES = {1: 'video', 2: 'audio', 0x11: 'subtitle'}
+
+# CodecID của Matroska -> tên codec như ffprobe báo (codec_name)
+CODEC_NAMES = {
+    'V_MPEG4/ISO/AVC': 'h264',
+    'V_MPEGH/ISO/HEVC': 'hevc',
+    'V_AV1': 'av1',
+    'V_VP8': 'vp8',
+    'V_VP9': 'vp9',
+    'V_MPEG4/ISO/SP': 'mpeg4',
+    'V_MPEG4/ISO/ASP': 'mpeg4',
+    'V_MPEG4/ISO/AP': 'mpeg4',
+    'V_MPEG1': 'mpeg1video',
+    'V_MPEG2': 'mpeg2video',
+    'V_MS/VFW/FOURCC': None,
+    'A_AAC': 'aac',
+    'A_AC3': 'ac3',
+    'A_EAC3': 'eac3',
+    'A_DTS': 'dts',
+    'A_TRUEHD': 'truehd',
+    'A_MLP': 'mlp',
+    'A_FLAC': 'flac',
+    'A_OPUS': 'opus',
+    'A_VORBIS': 'vorbis',
+    'A_MPEG/L3': 'mp3',
+    'A_MPEG/L2': 'mp2',
+    'A_MPEG/L1': 'mp1',
+    'S_TEXT/UTF8': 'subrip',
+    'S_TEXT/ASCII': 'text',
+    'S_TEXT/ASS': 'ass',
+    'S_TEXT/SSA': 'ass',
+    'S_ASS': 'ass',
+    'S_SSA': 'ass',
+    'S_TEXT/WEBVTT': 'webvtt',
+    'S_HDMV/PGS': 'hdmv_pgs_subtitle',
+    'S_HDMV/TEXTST': 'hdmv_text_subtitle',
+    'S_VOBSUB': 'dvd_subtitle',
+    'S_DVBSUB': 'dvb_subtitle',
+}
+# Các CodecID có hậu tố biến thể (A_AAC/MPEG4/LC, A_DTS/EXPRESS, ...)
+CODEC_PREFIXES = ('A_AAC', 'A_DTS')
+
+READ_LIMIT = 16 * 1024 * 1024  # Info/Tracks/Tags lớn hơn mức này coi như file hỏng
+
+class MkvError(Exception):
+    """File không phải Matroska hoặc header không đọc được (cần dùng ffprobe)."""
+
+def _read_vint(data, pos, keep_marker):
+    if pos >= len(data):
+        raise MkvError("Unexpected end of data")
+    first = data[pos]
+    if first == 0:
+        raise MkvError("Invalid EBML variable-length integer")
+    length = 1
+    mask = 0x80
+    while not first & mask:
+        mask >>= 1
+        length += 1
+    if pos + length > len(data):
+        raise MkvError("Unexpected end of data")
+    value = first if keep_marker else first & (mask - 1)
+    unknown = not keep_marker and value == mask - 1
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+        unknown = unknown and byte == 0xFF
+    return value, pos + length, unknown
+
+def _read_header(data, pos):
+    """Đọc ID và kích thước element, trả về (id, vị trí dữ liệu, kích thước hoặc None nếu không rõ)."""
+    element_id, pos, _ = _read_vint(data, pos, True)
+    size, pos, unknown = _read_vint(data, pos, False)
+    return element_id, pos, None if unknown else size
+
+def iter_elements(data, start=0, end=None):
+    """Duyệt các element con trong data[start:end], trả về (id, data_start, data_end)."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos < end:
+        element_id, data_start, size = _read_header(data, pos)
+        data_end = end if size is None else data_start + size
+        if data_end > end:
+            raise MkvError(f"Element 0x{element_id:X} overruns its parent")
+        yield element_id, data_start, data_end
+        pos = data_end
+
+def _uint(data, start, end):
+    return int.from_bytes(data[start:end], 'big') if end > start else 0
+
+def _float(data, start, end):
+    if end - start == 4:
+        return struct.unpack('>f', data[start:end])[0]
+    if end - start == 8:
+        return struct.unpack('>d', data[start:end])[0]
+    if end == start:
+        return 0.0
+    raise MkvError("Invalid float element size")
+
+def _string(data, start, end):
+    return bytes(data[start:end]).split(b'\0', 1)[0].decode('utf-8', errors='replace')
+
+def _dict_set(tags, key, value):
+    """Gán tag giống AVDictionary của ffmpeg: khóa so sánh không phân biệt hoa thường."""
+    for existing in [k for k in tags if k.lower() == key.lower()]:
+        del tags[existing]
+    tags[key] = value
+
+def _parse_info(data):
+    timestamp_scale = 1000000
+    duration = None
+    for element_id, start, end in iter_elements(data):
+        if element_id == TIMESTAMP_SCALE:
+            timestamp_scale = _uint(data, start, end)
+        elif element_id == DURATION:
+            duration = _float(data, start, end)
+    if duration is None:
+        raise MkvError("Segment has no duration")
+    # Làm tròn giống ffmpeg: duration * scale (ns) quy ra micro giây kiểu int64
+    return "%.6f" % (int(duration * timestamp_scale * 1000 / 1000000) / 1000000)
+
+def _codec_name(codec_id, track):
+    if codec_id in CODEC_NAMES:
+        name = CODEC_NAMES[codec_id]
+    elif codec_id.startswith(CODEC_PREFIXES):
+        name = CODEC_NAMES[codec_id.split('/', 1)[0]]
+    elif codec_id.startswith('A_PCM/'):
+        bits = track.get('bit_depth', 16)
+        if codec_id == 'A_PCM/FLOAT/IEEE':
+            name = f'pcm_f{bits}le'
+        elif bits == 8:
+            name = 'pcm_u8'
+        else:
+            name = f"pcm_s{bits}{'be' if codec_id == 'A_PCM/INT/BIG' else 'le'}"
+    else:
+        name = None
+    if name is None:
+        raise MkvError(f"Unsupported codec {codec_id}")
+    return name
+
+def _parse_tracks(data):
+    tracks = []
+    for element_id, start, end in iter_elements(data):
+        if element_id != TRACK_ENTRY:
+            continue
+        track = {'language': 'eng', 'uid': None}
+        codec_id = None
+        track_type = None
+        for child_id, child_start, child_end in iter_elements(data, start, end):
+            if child_id == TRACK_TYPE:
+                track_type = _uint(data, child_start, child_end)
+            elif child_id == CODEC_ID:
+                codec_id = _string(data, child_start, child_end)
+            elif child_id == TRACK_UID:
+                track['uid'] = _uint(data, child_start, child_end)
+            elif child_id == TRACK_NAME:
+                track['name'] = _string(data, child_start, child_end)
+            elif child_id == TRACK_LANGUAGE:
+                track['language'] = _string(data, child_start, child_end)
+            elif child_id == VIDEO:
+                for video_id, video_start, video_end in iter_elements(data, child_start, child_end):
+                    if video_id == PIXEL_WIDTH:
+                        track['width'] = _uint(data, video_start, video_end)
+                    elif video_id == PIXEL_HEIGHT:
+                        track['height'] = _uint(data, video_start, video_end)
+            elif child_id == AUDIO:
+                track['channels'] = 1
+                for audio_id, audio_start, audio_end in iter_elements(data, child_start, child_end):
+                    if audio_id == CHANNELS:
+                        track['channels'] = _uint(data, audio_start, audio_end)
+                    elif audio_id == BIT_DEPTH:
+                        track['bit_depth'] = _uint(data, audio_start, audio_end)
+        if track_type not in TRACK_TYPES or not codec_id:
+            # ffmpeg bỏ qua các track này nên index của stream sẽ lệch: dùng ffprobe
+            raise MkvError("Track without supported type or codec")
+        track['codec_type'] = TRACK_TYPES[track_type]
+        track['codec_name'] = _codec_name(codec_id, track)
+        tracks.append(track)
+    if not tracks:
+        raise MkvError("No tracks")
+    return tracks
+
+def _parse_simple_tags(data, start, end, tags, prefix=''):
+    for element_id, tag_start, tag_end in iter_elements(data, start, end):
+        if element_id != SIMPLE_TAG:
+            continue
+        name = None
+        language = 'und'
+        value = None
+        for child_id, child_start, child_end in iter_elements(data, tag_start, tag_end):
+            if child_id == TAG_NAME:
+                name = _string(data, child_start, child_end)
+            elif child_id == TAG_LANGUAGE:
+                language = _string(data, child_start, child_end)
+            elif child_id == TAG_STRING:
+                value = _string(data, child_start, child_end)
+        if not name:
+            continue
+        key = prefix + name
+        if language and language != 'und':
+            key += '-' + language
+        if value is not None:
+            _dict_set(tags, key, value)
+        # SimpleTag lồng nhau được ffmpeg đặt tên dạng CHA/CON
+        _parse_simple_tags(data, tag_start, tag_end, tags, key + '/')
+
+def _parse_tags(data, global_tags, track_tags):
+    for element_id, start, end in iter_elements(data):
+        if element_id != TAG:
+            continue
+        track_uid = None
+        other_target = False
+        for child_id, child_start, child_end in iter_elements(data, start, end):
+            if child_id != TARGETS:
+                continue
+            for target_id, target_start, target_end in iter_elements(data, child_start, child_end):
+                if target_id == TAG_TRACK_UID:
+                    track_uid = _uint(data, target_start, target_end)
+                elif target_id in (TAG_CHAPTER_UID, TAG_ATTACHMENT_UID, TAG_EDITION_UID):
+                    other_target = other_target or _uint(data, target_start, target_end) != 0
+        if other_target:
+            continue
+        if track_uid:
+            _parse_simple_tags(data, start, end, track_tags.setdefault(track_uid, {}))
+        else:
+            _parse_simple_tags(data, start, end, global_tags)
+
+class _Reader:
+    """Đọc element từ file bằng seek + read, chỉ đọc phần header cần thiết."""
+
+    def __init__(self, f, file_size):
+        self.f = f
+        self.file_size = file_size
+
+    def header(self, pos):
+        self.f.seek(pos)
+        data = self.f.read(16)
+        element_id, data_start, size = _read_header(data, 0)
+        return element_id, pos + data_start, size
+
+    def body(self, start, size):
+        if size is None or size > READ_LIMIT or start + size > self.file_size:
+            raise MkvError("Element size is invalid or too large")
+        self.f.seek(start)
+        data = self.f.read(size)
+        if len(data) != size:
+            raise MkvError("Unexpected end of file")
+        return data
+
+def _parse_seek_head(data, segment_start):
+    positions = {}
+    for element_id, start, end in iter_elements(data):
+        if element_id != SEEK:
+            continue
+        seek_id = None
+        position = None
+        for child_id, child_start, child_end in iter_elements(data, start, end):
+            if child_id == SEEK_ID:
+                seek_id = _uint(data, child_start, child_end)
+            elif child_id == SEEK_POSITION:
+                position = _uint(data, child_start, child_end)
+        if seek_id is not None and position is not None:
+            positions.setdefault(seek_id, []).append(segment_start + position)
+    return positions
+
+def _open_segment(reader):
+    """Kiểm tra EBML header, trả về (vị trí dữ liệu Segment, kích thước Segment hoặc None)."""
+    element_id, start, size = reader.header(0)
+    if element_id != EBML_HEADER:
+        raise MkvError("Not an EBML file")
+    header = reader.body(start, size)
+    doc_type = 'matroska'
+    for child_id, child_start, child_end in iter_elements(header):
+        if child_id == EBML_DOCTYPE:
+            doc_type = _string(header, child_start, child_end)
+    if doc_type not in ('matroska', 'webm'):
+        raise MkvError(f"Unsupported DocType {doc_type}")
+    element_id, segment_start, segment_size = reader.header(start + size)
+    if element_id != SEGMENT:
+        raise MkvError("Segment not found")
+    return segment_start, segment_size
+
+def _locate_elements(reader, element_ids):
+    """Tìm các element cấp một trong element_ids, trả về {id: (vị trí header, vị trí dữ liệu, kích thước)}."""
+    segment_start, segment_size = _open_segment(reader)
+    file_size = reader.file_size
+    segment_end = file_size if segment_size is None else min(segment_start + segment_size, file_size)
+
+    found = {}
+    seek_positions = {}
+    # Duyệt các element cấp cao nhất cho tới Cluster đầu tiên
+    pos = segment_start
+    while pos < segment_end:
+        element_id, data_start, size = reader.header(pos)
+        if element_id == CLUSTER or size is None:
+            break
+        if element_id in element_ids and element_id not in found:
+            found[element_id] = (pos, data_start, size)
+        elif element_id == SEEK_HEAD:
+            for seek_id, positions in _parse_seek_head(reader.body(data_start, size), segment_start).items():
+                seek_positions.setdefault(seek_id, []).extend(positions)
+        pos = data_start + size
+
+    # Element nằm sau các Cluster (thường là Tags do ffmpeg ghi ở cuối file): nhảy tới theo SeekHead
+    for element_id in element_ids:
+        for position in seek_positions.get(element_id, []):
+            if element_id in found or position >= segment_end:
+                break
+            found_id, data_start, size = reader.header(position)
+            if found_id == element_id:
+                found[element_id] = (position, data_start, size)
+    return found
+
+def read_mkv_probe(file_path):
+    """Đọc Segment Info, Tracks và Tags của file Matroska mà không cần ffprobe.
+
+    Trả về dict có cùng dạng với kết quả ffmpeg.probe (chỉ các trường
+    MediaInfo.from_probe dùng: streams với index/codec_type/codec_name/
+    width/height/channels/tags, format với duration/tags). Raise MkvError nếu
+    file không phải Matroska hoặc header bị hỏng.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        reader = _Reader(f, file_size)
+        found = {element_id: reader.body(data_start, size)
+                 for element_id, (_, data_start, size) in _locate_elements(reader, (INFO, TRACKS, TAGS)).items()}
+
+    if INFO not in found or TRACKS not in found:
+        raise MkvError("Segment Info or Tracks not found")
+    duration = _parse_info(found[INFO])
+    tracks = _parse_tracks(found[TRACKS])
+    global_tags = {}
+    track_tags = {}
+    if TAGS in found:
+        _parse_tags(found[TAGS], global_tags, track_tags)
+
+    streams = []
+    for index, track in enumerate(tracks):
+        tags = {}
+        if track['language'] != 'und':
+            tags['language'] = track['language']
+        if 'name' in track:
+            tags['title'] = track['name']
+        for key, value in track_tags.get(track['uid'], {}).items():
+            _dict_set(tags, key, value)
+        stream = {'index': index, 'codec_type': track['codec_type'],
+                  'codec_name': track['codec_name'], 'tags': tags}
+        for key in ('width', 'height', 'channels'):
+            if key in track:
+                stream[key] = track[key]
+        streams.append(stream)
+    if not any(stream['codec_type'] == 'video' and 'width' in stream for stream in streams):
+        # Không có video: ffprobe có thể lấy kích thước từ ảnh bìa (attachment)
+        raise MkvError("No video track with dimensions")
+    return {'streams': streams,
+            'format': {'duration': duration, 'size': str(file_size), 'tags': global_tags}}
+
+def read_segment_status(file_path):
+    """Kiểm tra file Matroska đã được ghi xong chưa, trả về (complete, duration).
+
+    Khi kết thúc bình thường, muxer matroska quay lại ghi kích thước Segment và
+    Duration vào header; file bị cắt ngang có Segment không rõ kích thước hoặc
+    không khớp với kích thước file. duration là chuỗi số giây như read_mkv_probe
+    (None nếu không có). Chỉ đọc vài KB ở đầu file.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        reader = _Reader(f, file_size)
+        element_id, start, size = reader.header(0)
+        if element_id != EBML_HEADER or size is None:
+            raise MkvError("Not an EBML file")
+        element_id, segment_start, segment_size = reader.header(start + size)
+        if element_id != SEGMENT:
+            raise MkvError("Segment not found")
+        complete = segment_size is not None and segment_start + segment_size == file_size
+        duration = None
+        pos = segment_start
+        while pos < file_size:
+            element_id, data_start, size = reader.header(pos)
+            if element_id == CLUSTER or size is None:
+                break
+            if element_id == INFO:
+                try:
+                    duration = _parse_info(reader.body(data_start, size))
+                except MkvError:
+                    pass
+                break
+            pos = data_start + size
+    return complete, duration
+
+def _encode_vint(value, length=None):
+    """Mã hóa kích thước element thành vint, length là số byte mong muốn (None: ngắn nhất)."""
+    minimum = 1
+    while value >= (1 << (7 * minimum)) - 1:
+        minimum += 1
+    if length is None or length < minimum:
+        length = minimum
+    if length > 8:
+        raise MkvError("Element too large")
+    return ((1 << (7 * length)) | value).to_bytes(length, 'big')
+
+def _element(element_id, payload, size_length=None):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + _encode_vint(len(payload), size_length) + payload
+
+def _void(total):
+    """Element Void chiếm đúng total byte (total >= 2)."""
+    for length in range(1, 9):
+        size = total - 1 - length
+        if size >= 0 and size < (1 << (7 * length)) - 1:
+            return _element(VOID, bytes(size), length)
+    raise MkvError(f"Cannot build a Void element of {total} bytes")
+
+def _children(data, start, end):
+    """Các element con: (id, vị trí header, vị trí dữ liệu, vị trí kết thúc, số byte của vint kích thước)."""
+    pos = start
+    for element_id, data_start, data_end in iter_elements(data, start, end):
+        id_length = (element_id.bit_length() + 7) // 8
+        yield element_id, pos, data_start, data_end, data_start - pos - id_length
+        pos = data_end
+
+def _with_crc(children):
+    """Nối các element con; nếu element đầu là CRC-32 thì tính lại theo phần còn lại."""
+    if children and children[0][0] == CRC32:
+        body = b''.join(raw for _, raw in children[1:])
+        return _element(CRC32, struct.pack('<I', zlib.crc32(body))) + body
+    return b''.join(raw for _, raw in children)
+
+def _edit_track_entry(data, start, end, changes):
+    """Tạo lại TrackEntry với các thay đổi: default, forced (bool), language, name (str)."""
+    values = {}
+    if 'default' in changes:
+        values[FLAG_DEFAULT] = int(bool(changes['default']))
+    if 'forced' in changes:
+        values[FLAG_FORCED] = int(bool(changes['forced']))
+    if 'language' in changes:
+        values[TRACK_LANGUAGE] = changes['language'].encode('ascii')
+    if 'name' in changes:
+        values[TRACK_NAME] = changes['name'].encode('utf-8')
+    # Giá trị mặc định theo đặc tả khi element không có trong file
+    defaults = {FLAG_DEFAULT: 1, FLAG_FORCED: 0, TRACK_LANGUAGE: b'eng', TRACK_NAME: b''}
+
+    children = []
+    for child_id, header_start, data_start, data_end, size_length in _children(data, start, end):
+        if child_id == VOID:
+            continue
+        if child_id == TRACK_LANGUAGE_BCP47 and TRACK_LANGUAGE in values:
+            # Player ưu tiên LanguageBCP47 nên sửa mỗi Language là không đủ
+            raise MkvError("Track has LanguageBCP47, cannot change its language in place")
+        if child_id in values:
+            value = values.pop(child_id)
+            if isinstance(value, int):
+                # Giữ nguyên số byte của giá trị cũ nếu đủ chỗ để không làm thay đổi kích thước
+                length = max(data_end - data_start, (value.bit_length() + 7) // 8, 1)
+                value = value.to_bytes(length, 'big')
+            children.append((child_id, _element(child_id, value, size_length)))
+        else:
+            children.append((child_id, bytes(data[header_start:data_end])))
+    for child_id, value in values.items():
+        if isinstance(value, int):
+            if value == defaults[child_id]:
+                continue
+            value = value.to_bytes(1, 'big')
+        elif value == defaults[child_id]:
+            continue
+        children.append((child_id, _element(child_id, value)))
+    return _with_crc(children)
+
+def read_track_flags(file_path):
+    """Đọc các thuộc tính có thể sửa tại chỗ của từng TrackEntry (theo thứ tự trong file).
+
+    Mỗi track là dict: type (video/audio/subtitle hoặc None), language, name,
+    default, forced.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        reader = _Reader(f, file_size)
+        found = _locate_elements(reader, (TRACKS,))
+        if TRACKS not in found:
+            raise MkvError("Tracks not found")
+        _, data_start, size = found[TRACKS]
+        data = reader.body(data_start, size)
+    tracks = []
+    for element_id, start, end in iter_elements(data):
+        if element_id != TRACK_ENTRY:
+            continue
+        track = {'type': None, 'language': 'eng', 'name': '', 'default': True, 'forced': False}
+        for child_id, child_start, child_end in iter_elements(data, start, end):
+            if child_id == TRACK_TYPE:
+                track['type'] = TRACK_TYPES.get(_uint(data, child_start, child_end))
+            elif child_id == TRACK_LANGUAGE:
+                track['language'] = _string(data, child_start, child_end)
+            elif child_id == TRACK_NAME:
+                track['name'] = _string(data, child_start, child_end)
+            elif child_id == FLAG_DEFAULT:
+                track['default'] = bool(_uint(data, child_start, child_end))
+            elif child_id == FLAG_FORCED:
+                track['forced'] = bool(_uint(data, child_start, child_end))
+        tracks.append(track)
+    return tracks
+
+def plan_track_edit(file_path, changes):
+    """Tính trước việc sửa thuộc tính track ngay trong header file Matroska, chưa ghi gì.
+
+    changes là {vị trí TrackEntry: {default, forced, language, name}}. Element
+    Tracks được tạo lại để ghi đè đúng chỗ cũ; phần dư được lấp bằng Void, phần
+    tăng thêm lấy từ Void ngay sau Tracks (padding mà muxer để lại). CRC-32 nếu
+    có được tính lại. Trả về (vị trí, byte gốc, byte mới) với byte gốc và byte
+    mới cùng độ dài, để có thể ghi lại byte gốc nếu việc ghi bị ngắt giữa chừng.
+    Raise MkvError nếu không sửa tại chỗ được (cần remux).
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        reader = _Reader(f, file_size)
+        found = _locate_elements(reader, (TRACKS,))
+        if TRACKS not in found:
+            raise MkvError("Tracks not found")
+        header_start, data_start, size = found[TRACKS]
+        data = reader.body(data_start, size)
+        size_length = data_start - header_start - 4  # ID của Tracks dài 4 byte
+
+        # Thử giữ nguyên độ dài vint kích thước để ít byte bị ghi đè nhất; nếu thiếu
+        # chỗ thì mã hóa TrackEntry với vint ngắn nhất để lấy thêm byte
+        for compact in (False, True):
+            children = []
+            position = 0
+            for child_id, child_header, child_start, child_end, child_size_length in _children(data, 0, len(data)):
+                if child_id == VOID:
+                    continue
+                if child_id == TRACK_ENTRY:
+                    if position in changes or compact:
+                        payload = _edit_track_entry(data, child_start, child_end, changes.get(position, {}))
+                        children.append((child_id, _element(child_id, payload,
+                                                            None if compact else child_size_length)))
+                    else:
+                        children.append((child_id, bytes(data[child_header:child_end])))
+                    position += 1
+                else:
+                    children.append((child_id, bytes(data[child_header:child_end])))
+            if any(index >= position for index in changes):
+                raise MkvError("Track index out of range")
+
+            # Chỗ có thể dùng: Tracks cũ và các Void liền sau nó
+            available = data_start + size - header_start
+            pos = data_start + size
+            while pos < file_size:
+                element_id, void_start, void_size = reader.header(pos)
+                if element_id != VOID or void_size is None:
+                    break
+                available += void_start + void_size - pos
+                pos = void_start + void_size
+
+            payload = _with_crc(children)
+            new_tracks = _element(TRACKS, payload, size_length)
+            remaining = available - len(new_tracks)
+            if remaining == 1:
+                # Void nhỏ nhất là 2 byte: dùng thêm một byte cho vint kích thước của Tracks
+                new_tracks = _element(TRACKS, payload, len(new_tracks) - len(payload) - 4 + 1)
+                remaining = available - len(new_tracks)
+            if remaining >= 0:
+                break
+        if remaining < 0:
+            raise MkvError(f"Not enough padding to rewrite Tracks in place ({-remaining} bytes short)")
+        if remaining:
+            new_tracks += _void(remaining)
+        f.seek(header_start)
+        original = f.read(len(new_tracks))
+    if len(original) != len(new_tracks):
+        raise MkvError("Unexpected end of file")
+    return header_start, original, new_tracks
+
+def write_region(file_path, offset, data):
+    """Ghi đè data tại offset của file (không đổi kích thước file) và fsync."""
+    with open(file_path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
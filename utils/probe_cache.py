@@ -0,0 +1,121 @@
+import os
+import time
+import sqlite3
+import threading
+from utils.ffmpeg_utils import MediaInfo
+
+class ProbeCache:
+    """Cache kết quả probe trên đĩa (SQLite), khóa theo (path, size, mtime_ns).
+
+    File bị đổi tên vẫn giữ nguyên size và mtime nên vẫn dùng lại được cache.
+    Số bản ghi bị giới hạn bởi max_entries, bản ghi lâu không dùng bị xóa trước.
+    """
+
+    def __init__(self, db_path, max_entries=50000, commit_every=200):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS probes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                signature TEXT,
+                data TEXT NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_probes_stat ON probes(size, mtime_ns);
+            CREATE INDEX IF NOT EXISTS idx_probes_signature ON probes(signature);
+            CREATE INDEX IF NOT EXISTS idx_probes_last_used ON probes(last_used);
+        """)
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
+
+    def _mark_dirty(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.conn.commit()
+            self._pending = 0
+
+    def get(self, file_path, st):
+        """Lấy MediaInfo từ cache nếu file chưa thay đổi, ngược lại trả về None."""
+        key = self._key(file_path)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (key, st.st_size, st.st_mtime_ns)).fetchone()
+            if row is None:
+                row = self._find_renamed(key, st)
+            if row is None:
+                return None
+            self.conn.execute("UPDATE probes SET last_used = ? WHERE path = ?", (time.time(), key))
+            self._mark_dirty()
+        return MediaInfo.from_json(file_path, row[0])
+
+    def _find_renamed(self, key, st):
+        """Tìm bản ghi của file đã bị đổi tên (cùng size, mtime, path cũ không còn)."""
+        for old_key, data in self.conn.execute(
+                "SELECT path, data FROM probes WHERE size = ? AND mtime_ns = ?",
+                (st.st_size, st.st_mtime_ns)).fetchall():
+            if not os.path.exists(old_key):
+                self.conn.execute("DELETE FROM probes WHERE path = ?", (key,))
+                self.conn.execute("UPDATE probes SET path = ? WHERE path = ?", (key, old_key))
+                return (data,)
+        return None
+
+    def get_by_signature(self, file_path, signature):
+        """Lấy MediaInfo theo chữ ký nội dung (dùng khi size/mtime không khớp)."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM probes WHERE signature = ? LIMIT 1", (signature,)).fetchone()
+        if row is None:
+            return None
+        return MediaInfo.from_json(file_path, row[0])
+
+    def put(self, media, st):
+        """Lưu MediaInfo vào cache."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO probes (path, size, mtime_ns, signature, data, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(media.path), st.st_size, st.st_mtime_ns,
+                 media.content_signature, media.to_json(), time.time()))
+            self._mark_dirty()
+
+    def evict(self):
+        """Xóa các bản ghi ít dùng nhất khi cache vượt quá max_entries."""
+        with self._lock:
+            count = self.conn.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+            if count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM probes WHERE path IN "
+                    "(SELECT path FROM probes ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,))
+                self.conn.commit()
+            return max(count - self.max_entries, 0)
+
+    def invalidate(self, paths=None):
+        """Xóa cache của các file chỉ định, hoặc toàn bộ nếu không chỉ định."""
+        with self._lock:
+            if paths:
+                cursor = self.conn.executemany(
+                    "DELETE FROM probes WHERE path = ?",
+                    [(self._key(path),) for path in paths])
+            else:
+                cursor = self.conn.execute("DELETE FROM probes")
+            self.conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        """Ghi các thay đổi còn lại, dọn cache và đóng kết nối."""
+        self.evict()
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
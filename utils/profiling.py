@@ -0,0 +1,110 @@
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Bản ghi của file đang xử lý trong context hiện tại (task asyncio hoặc thread)
+_current = contextvars.ContextVar('profile_record', default=None)
+
+def new_record(path):
+    return {'path': path, 'stages': {}, 'spawns': {}, 'bytes_read': 0, 'bytes_written': 0,
+            'started': time.perf_counter(), 'wall': None}
+
+@contextmanager
+def attach(record):
+    """Gắn record vào context: thời gian và số tiến trình con được tính cho file đó."""
+    if record is None:
+        yield
+        return
+    token = _current.set(record)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+def add_time(stage, seconds):
+    record = _current.get()
+    if record is not None:
+        record['stages'][stage] = record['stages'].get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    """Đo thời gian của một đoạn code và cộng vào stage của file hiện tại."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stage, time.perf_counter() - started)
+
+def record_spawn(program):
+    """Ghi nhận một lần tạo tiến trình con (ffprobe, ffmpeg) cho file hiện tại."""
+    record = _current.get()
+    if record is not None:
+        record['spawns'][program] = record['spawns'].get(program, 0) + 1
+
+class Profiler:
+    """Gom bản ghi từng file: thời gian từng bước, số tiến trình con, số byte đọc/ghi."""
+
+    def __init__(self):
+        self.records = []
+        self.started = time.perf_counter()
+
+    def finish(self, record, results=None):
+        record['wall'] = time.perf_counter() - record['started']
+        if results:
+            record['bytes_read'] = results.get('bytes_read') or 0
+            record['bytes_written'] = results.get('bytes_written') or 0
+        self.records.append(record)
+
+    def totals(self):
+        stages = {}
+        spawns = {}
+        for record in self.records:
+            for stage, seconds in record['stages'].items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+            for program, count in record['spawns'].items():
+                spawns[program] = spawns.get(program, 0) + count
+        return stages, spawns
+
+    def over_budget(self, max_spawns):
+        """Các file tạo nhiều tiến trình con hơn max_spawns."""
+        return [record for record in self.records if sum(record['spawns'].values()) > max_spawns]
+
+    def summary(self):
+        """Bảng tóm tắt: tổng/trung bình thời gian từng bước và số tiến trình con."""
+        stages, spawns = self.totals()
+        files = len(self.records)
+        elapsed = time.perf_counter() - self.started
+        lines = [f"Profile: {files} files in {elapsed:.2f}s "
+                 f"(the pipeline stages overlap; ffprobe/ffmpeg/rename/... are parts of them)",
+                 f"{'stage':<12}{'total s':>10}{'avg ms/file':>14}"]
+        for stage, seconds in sorted(stages.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"{stage:<12}{seconds:>10.3f}{seconds * 1000 / max(files, 1):>14.2f}")
+        lines.append(f"{'spawns':<12}" + (", ".join(f"{program} {count} ({count / max(files, 1):.2f}/file)"
+                                                   for program, count in sorted(spawns.items())) or "none"))
+        bytes_read = sum(record['bytes_read'] for record in self.records)
+        bytes_written = sum(record['bytes_written'] for record in self.records)
+        lines.append(f"{'bytes':<12}read {bytes_read / (1024 * 1024):.1f} MB, "
+                     f"written {bytes_written / (1024 * 1024):.1f} MB")
+        slowest = sorted(self.records, key=lambda record: record['wall'] or 0, reverse=True)[:5]
+        if slowest:
+            lines.append("slowest files:")
+            for record in slowest:
+                lines.append(f"  {record['wall']:.3f}s  {record['path']}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        stages, spawns = self.totals()
+        return {'elapsed_seconds': round(time.perf_counter() - self.started, 6),
+                'stage_seconds': {stage: round(seconds, 6) for stage, seconds in stages.items()},
+                'spawns': spawns,
+                'files': [{'path': record['path'],
+                           'wall_seconds': round(record['wall'] or 0, 6),
+                           'stage_seconds': {stage: round(seconds, 6) for stage, seconds in record['stages'].items()},
+                           'spawns': record['spawns'],
+                           'bytes_read': record['bytes_read'],
+                           'bytes_written': record['bytes_written']} for record in self.records]}
+
+    def write_json(self, path):
+        with open(path, "w", encoding='utf-8') as f:
+            json.dump(self.to_json(), f, ensure_ascii=False, indent=2)
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+from utils.ffmpeg_utils import parse_progress
+
+METRIC_PREFIX = "mkv_processor"
+
+def format_eta(seconds):
+    """Định dạng số giây thành HH:MM:SS."""
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class JobProgress:
+    """Tiến độ của một lệnh ffmpeg đang chạy."""
+    __slots__ = ('name', 'size', 'duration', 'started', 'out_seconds', 'speed')
+
+    def __init__(self, name, size, duration):
+        self.name = name
+        self.size = size
+        # MediaInfo giữ duration dạng chuỗi như ffprobe trả về (dùng cho chữ ký cũ)
+        try:
+            self.duration = float(duration)
+        except (TypeError, ValueError):
+            self.duration = None
+        self.started = time.monotonic()
+        self.out_seconds = None
+        self.speed = None
+
+    @property
+    def fraction(self):
+        if self.out_seconds is None or not self.duration:
+            return None
+        return min(self.out_seconds / self.duration, 1.0)
+
+    @property
+    def rate(self):
+        """Tốc độ đọc ước tính (byte/giây), theo phần thời lượng đã xử lý."""
+        fraction = self.fraction
+        elapsed = time.monotonic() - self.started
+        if fraction is None or elapsed <= 0:
+            return None
+        return fraction * self.size / elapsed
+
+    @property
+    def eta(self):
+        if self.out_seconds is None or not self.duration or not self.speed:
+            return None
+        return max(self.duration - self.out_seconds, 0) / self.speed
+
+class Progress:
+    """Theo dõi tiến độ các job ffmpeg, in trạng thái và ghi file metrics.
+
+    Trên terminal, trạng thái được vẽ lại trên một dòng mỗi interval giây; khi
+    output bị chuyển hướng thì in một dòng mỗi log_interval giây. Các bộ đếm
+    (file đã xong, byte đọc/ghi, lỗi, thời gian từng bước) được ghi ra
+    metrics_path: định dạng textfile của Prometheus nếu đuôi là .prom, còn lại là JSON.
+    """
+
+    def __init__(self, stream, metrics_path=None, interval=1.0, log_interval=30.0, metrics_interval=10.0):
+        self.stream = stream
+        self.metrics_path = metrics_path
+        self.is_tty = hasattr(stream, 'isatty') and stream.isatty()
+        self.interval = interval if self.is_tty else log_interval
+        self.metrics_interval = metrics_interval
+        self.jobs = {}
+        self.counters = {'files_done': 0, 'files_failed': 0, 'files_skipped': 0,
+                         'bytes_read': 0, 'bytes_written': 0}
+        self.stage_seconds = {}
+        self.started = time.monotonic()
+        self._last_render = 0.0
+        self._last_metrics = 0.0
+        self._line_width = 0
+
+    def start(self, key, media):
+        self.jobs[key] = JobProgress(media.name, media.size, media.duration)
+
+    def update(self, key, block):
+        """Nhận một khối -progress của ffmpeg cho job key."""
+        job = self.jobs.get(key)
+        if job is None:
+            return
+        out_seconds, speed, _ = parse_progress(block, job.duration)
+        if out_seconds is not None:
+            job.out_seconds = out_seconds
+        if speed is not None:
+            job.speed = speed
+        self.render()
+
+    def finish(self, key, bytes_read=None, bytes_written=None, failed=False):
+        self.jobs.pop(key, None)
+        self.counters['bytes_read'] += bytes_read or 0
+        self.counters['bytes_written'] += bytes_written or 0
+        if failed:
+            self.counters['files_failed'] += 1
+        self.render()
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+        self.write_metrics()
+
+    def add_stage_time(self, stage, seconds):
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def status_line(self):
+        """Dòng trạng thái: tổng MB/s, speed, ETA và tiến độ từng job."""
+        jobs = list(self.jobs.values())
+        rate = sum(job.rate or 0 for job in jobs)
+        speed = sum(job.speed or 0 for job in jobs)
+        etas = [job.eta for job in jobs if job.eta is not None]
+        parts = [f"[{len(jobs)} running, {self.counters['files_done']} done] "
+                 f"{rate / (1024 * 1024):.1f} MB/s, speed {speed:.2f}x, "
+                 f"ETA {format_eta(max(etas) if etas else None)}"]
+        for job in jobs:
+            fraction = job.fraction
+            percent = f"{fraction * 100:.0f}%" if fraction is not None else "?%"
+            parts.append(f"{job.name} {percent} {(job.rate or 0) / (1024 * 1024):.1f} MB/s "
+                         f"{job.speed or 0:.2f}x ETA {format_eta(job.eta)}")
+        return " | ".join(parts)
+
+    def render(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_render < self.interval:
+            return
+        self._last_render = now
+        if self.jobs:
+            line = self.status_line()
+            if self.is_tty:
+                self.stream.write("\r" + line.ljust(self._line_width))
+                self._line_width = len(line)
+            else:
+                self.stream.write(line + "\n")
+            self.stream.flush()
+        self.write_metrics()
+
+    def clear(self):
+        """Xóa dòng trạng thái trên terminal trước khi in nội dung khác."""
+        if self.is_tty and self._line_width:
+            self.stream.write("\r" + " " * self._line_width + "\r")
+            self._line_width = 0
+
+    def write(self, text):
+        """In text ra stream mà không bị dòng trạng thái chen vào."""
+        self.clear()
+        self.stream.write(text)
+        self.stream.flush()
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.started
+        data = dict(self.counters)
+        data['files_running'] = len(self.jobs)
+        data['elapsed_seconds'] = round(elapsed, 3)
+        data['read_bytes_per_second'] = round(self.counters['bytes_read'] / elapsed, 1) if elapsed > 0 else 0
+        data['stage_seconds'] = {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()}
+        data['updated'] = int(time.time())
+        return data
+
+    def to_prometheus(self):
+        data = self.snapshot()
+        lines = []
+        for name in ('files_done', 'files_failed', 'files_skipped', 'bytes_read', 'bytes_written'):
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+            lines.append(f"{METRIC_PREFIX}_{name}_total {data[name]}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_files_running gauge")
+        lines.append(f"{METRIC_PREFIX}_files_running {data['files_running']}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_stage_seconds_total counter")
+        for stage, seconds in sorted(data['stage_seconds'].items()):
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_total{{stage="{stage}"}} {seconds}')
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_update_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_update_timestamp_seconds {data['updated']}")
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self, force=False):
+        """Ghi file metrics (ghi file tạm rồi đổi tên để bên đọc không thấy file dở)."""
+        if not self.metrics_path:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_metrics < self.metrics_interval:
+            return
+        self._last_metrics = now
+        if self.metrics_path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        temp_path = self.metrics_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, self.metrics_path)
+        except OSError as e:
+            self.write(f"Error writing metrics file '{self.metrics_path}': {e}\n")
+            self.metrics_path = None
+
+    def close(self):
+        self.clear()
+        self.stream.flush()
+        self.write_metrics(force=True)
@@ -0,0 +1,103 @@
+import time
+import logging
+import threading
+import subprocess
+from utils.git_utils import run_git
+
+DEFAULT_MAX_BEHIND = 20
+DEFAULT_BASE_DELAY = 5
+DEFAULT_MAX_DELAY = 600
+DEFAULT_PUSH_TIMEOUT = 300
+
+class PushQueue:
+    """Push các commit ở một thread nền thay vì ngay sau mỗi commit.
+
+    add() chỉ ghi nhận commit mới và đánh thức worker; các commit dồn lại trong
+    lúc đang push hoặc đang chờ retry được đẩy chung trong một lần git push.
+    Push lỗi (hoặc quá timeout) được thử lại sau base_delay, 2*base_delay, ...
+    tối đa max_delay giây. has_room() báo khi số commit chưa push đạt
+    max_behind để bên commit tạm dừng (backpressure).
+    """
+
+    def __init__(self, repo, max_behind=DEFAULT_MAX_BEHIND, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, timeout=DEFAULT_PUSH_TIMEOUT):
+        self.repo = repo
+        self.max_behind = max_behind
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.unpushed = 0
+        # Push một lần khi khởi động để đẩy các commit còn sót từ lần chạy trước
+        self.pending = True
+        self.failures = 0
+        self.retry_at = 0.0
+        self.closed = False
+        self.last_error = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='git-push', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def add(self, commits=1):
+        """Ghi nhận commits commit mới cần push."""
+        with self._condition:
+            self.unpushed += commits
+            self.pending = True
+            self._condition.notify_all()
+
+    def has_room(self):
+        with self._condition:
+            return self.unpushed < self.max_behind
+
+    def close(self, timeout=None):
+        """Dừng worker; nếu còn commit chưa push thì thử push thêm một lần (bỏ qua thời gian chờ retry)."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        return self.unpushed
+
+    def _push(self):
+        try:
+            result = run_git(self.repo, ['push', '-q'], check=False, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return False, f"quá thời gian {self.timeout} giây"
+        except OSError as e:
+            return False, str(e)
+        if result.returncode != 0:
+            # Gộp stderr nhiều dòng thành một dòng log
+            stderr = ' | '.join(line.strip() for line in result.stderr.decode('utf-8', errors='replace').splitlines()
+                                if line.strip())
+            return False, f"mã {result.returncode}" + (f": {stderr}" if stderr else "")
+        return True, None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self.closed and not (self.pending and time.monotonic() >= self.retry_at):
+                    self._condition.wait(max(self.retry_at - time.monotonic(), 0) if self.pending else None)
+                if not self.pending:
+                    return
+                self.pending = False
+                batch = self.unpushed
+            ok, error = self._push()
+            with self._condition:
+                if ok:
+                    self.unpushed -= batch
+                    self.failures = 0
+                    self.retry_at = 0.0
+                    self.last_error = None
+                    logging.info(f"Push thành công {batch} commit")
+                else:
+                    self.failures += 1
+                    delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+                    self.retry_at = time.monotonic() + delay
+                    self.pending = True
+                    self.last_error = error
+                    logging.error(f"Push lỗi ({error}), còn {self.unpushed} commit chưa push, "
+                                  f"thử lại sau {delay} giây")
+                self._condition.notify_all()
+                if self.closed:
+                    return
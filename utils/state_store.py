@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import sqlite3
+import datetime
+import threading
+
+class StateStore:
+    """Lưu trạng thái các file đã xử lý trong SQLite, thay cho processed_files.log.
+
+    Mỗi lần xử lý chỉ lưu một dòng (tên cũ, tên mới, thời gian, chữ ký), có index
+    theo cả hai tên và theo chữ ký nên không cần đọc toàn bộ lịch sử khi khởi động.
+    Các bản ghi được commit theo lô để giảm số lần fsync.
+    """
+
+    def __init__(self, db_path, commit_every=50, commit_interval=2.0):
+        self.db_path = db_path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._pending = 0
+        self._last_commit = time.monotonic()
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS processed (
+                id INTEGER PRIMARY KEY,
+                old_name TEXT NOT NULL,
+                new_name TEXT NOT NULL,
+                time TEXT NOT NULL,
+                signature TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_processed_old_name ON processed(old_name);
+            CREATE INDEX IF NOT EXISTS idx_processed_new_name ON processed(new_name);
+            CREATE INDEX IF NOT EXISTS idx_processed_signature ON processed(signature);
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                rename_to TEXT,
+                signature TEXT NOT NULL DEFAULT '',
+                outputs TEXT NOT NULL,
+                started TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dir_snapshot (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                entry_count INTEGER NOT NULL,
+                mkv_files TEXT NOT NULL,
+                subdirs TEXT NOT NULL
+            );
+        """)
+
+    @staticmethod
+    def _info(row):
+        if row is None:
+            return None
+        return {"old_name": row[0], "new_name": row[1], "time": row[2], "signature": row[3]}
+
+    def find_by_name(self, name):
+        """Tìm bản ghi mới nhất có tên cũ hoặc tên mới trùng với name."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT old_name, new_name, time, signature FROM processed "
+                "WHERE old_name = ? OR new_name = ? ORDER BY id DESC LIMIT 1",
+                (name, name)).fetchone()
+        return self._info(row)
+
+    def find_by_signature(self, signature):
+        """Tìm bản ghi mới nhất có cùng chữ ký nội dung."""
+        if not signature:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT old_name, new_name, time, signature FROM processed "
+                "WHERE signature = ? ORDER BY id DESC LIMIT 1",
+                (signature,)).fetchone()
+        return self._info(row)
+
+    def record(self, old_name, new_name, signature="", time_processed=None):
+        """Ghi lại file đã được xử lý với tên cũ và mới."""
+        if time_processed is None:
+            time_processed = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO processed (old_name, new_name, time, signature) VALUES (?, ?, ?, ?)",
+                (old_name, new_name, time_processed, signature or ""))
+            self._pending += 1
+            if (self._pending >= self.commit_every
+                    or time.monotonic() - self._last_commit >= self.commit_interval):
+                self.flush()
+
+    def begin_job(self, source, rename_to, signature, outputs):
+        """Ghi vào journal một job sắp chạy (commit ngay), trả về id của job.
+
+        outputs là dict {'subtitles': [...], 'remux': path hoặc None} các file
+        output cuối cùng của job.
+        """
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO jobs (source, rename_to, signature, outputs, started) VALUES (?, ?, ?, ?, ?)",
+                (source, rename_to, signature or "", json.dumps(outputs, ensure_ascii=False),
+                 datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            self.flush()
+            return cursor.lastrowid
+
+    def finish_job(self, job_id, records, signature=""):
+        """Ghi các bản ghi (old_name, new_name) của job và xóa job khỏi journal trong cùng một commit."""
+        time_processed = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO processed (old_name, new_name, time, signature) VALUES (?, ?, ?, ?)",
+                [(old_name, new_name, time_processed, signature or "") for old_name, new_name in records])
+            self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self.flush()
+
+    def pending_jobs(self):
+        """Các job còn trong journal (bị ngắt giữa chừng ở lần chạy trước)."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, source, rename_to, signature, outputs, started FROM jobs ORDER BY id").fetchall()
+        return [{"id": row[0], "source": row[1], "rename_to": row[2], "signature": row[3],
+                 "outputs": json.loads(row[4]), "started": row[5]} for row in rows]
+
+    def get_dir_snapshot(self, path):
+        """Lấy snapshot của thư mục: (mtime_ns, mkv_files, subdirs) hoặc None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT mtime_ns, mkv_files, subdirs FROM dir_snapshot WHERE path = ?",
+                (path,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), json.loads(row[2])
+
+    def put_dir_snapshot(self, path, mtime_ns, entry_count, mkv_files, subdirs):
+        """Lưu snapshot của thư mục sau khi liệt kê."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dir_snapshot (path, mtime_ns, entry_count, mkv_files, subdirs) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (path, mtime_ns, entry_count,
+                 json.dumps(mkv_files, ensure_ascii=False), json.dumps(subdirs, ensure_ascii=False)))
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self.flush()
+
+    def flush(self):
+        """Commit các bản ghi đang chờ."""
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+            self._last_commit = time.monotonic()
+
+    def migrate_log(self, log_file):
+        """Nhập processed_files.log cũ vào store (một lần), sau đó đổi tên file log."""
+        if not os.path.exists(log_file):
+            return 0
+        rows = []
+        with open(log_file, "r", encoding='utf-8') as f:
+            for line in f:
+                parts = line.strip().split('|')
+                if len(parts) >= 2:
+                    rows.append((parts[0], parts[1],
+                                 parts[2] if len(parts) > 2 else "",
+                                 parts[3] if len(parts) > 3 else ""))
+        with self._lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO processed (old_name, new_name, time, signature) VALUES (?, ?, ?, ?)",
+                    rows)
+        os.replace(log_file, log_file + ".migrated")
+        return len(rows)
+
+    def compact(self):
+        """Xóa các bản ghi trùng lặp (giữ bản mới nhất) và thu gọn file database."""
+        with self._lock:
+            self.flush()
+            with self.conn:
+                cursor = self.conn.execute(
+                    "DELETE FROM processed WHERE id NOT IN "
+                    "(SELECT MAX(id) FROM processed GROUP BY old_name, new_name, signature)")
+            self.conn.execute("VACUUM")
+            return cursor.rowcount
+
+    def export(self, output_file):
+        """Xuất toàn bộ store ra định dạng processed_files.log (old|new|time|signature)."""
+        count = 0
+        with self._lock:
+            self.flush()
+            with open(output_file, "w", encoding='utf-8') as f:
+                for row in self.conn.execute(
+                        "SELECT old_name, new_name, time, signature FROM processed ORDER BY id"):
+                    f.write("|".join(row) + "\n")
+                    count += 1
+        return count
+
+    def close(self):
+        """Commit các bản ghi còn lại và đóng kết nối."""
+        with self._lock:
+            self.flush()
+            self.conn.close()
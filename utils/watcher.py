@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import struct
+import asyncio
+import ctypes
+import ctypes.util
+from collections import OrderedDict
+from utils.file_utils import iter_mkv_files, is_partial
+
+# Các cờ của inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+class StabilityTracker:
+    """Theo dõi các file ứng viên cho tới khi việc ghi file đã xong.
+
+    Một file được coi là xong khi size và mtime không đổi trong settle giây,
+    hoặc khi chương trình ghi đã đóng file (close_write / moved_to) và size,
+    mtime không đổi thêm trong ít nhất một lần kiểm tra. File có sẵn từ trước
+    (existing=True) được coi là xong nếu mtime đã cũ hơn settle giây.
+    """
+
+    def __init__(self, settle=30.0, remember=10000):
+        self.settle = settle
+        self.remember = remember
+        self.pending = {}
+        self.emitted = OrderedDict()
+
+    def touch(self, path, closed=False, existing=False):
+        """Ghi nhận có thay đổi trên file path."""
+        if not path.lower().endswith(".mkv") or is_partial(os.path.basename(path)):
+            return
+        entry = self.pending.get(path)
+        if entry is None:
+            # [size/mtime lần cuối, thời điểm bắt đầu ổn định, đã đóng, có sẵn từ trước]
+            self.pending[path] = [None, time.monotonic(), closed, existing]
+        else:
+            entry[2] = entry[2] or closed
+            entry[3] = entry[3] and existing
+
+    def forget(self, path):
+        self.pending.pop(path, None)
+
+    def ready(self):
+        """Trả về các file đã ghi xong (mỗi phiên bản file chỉ trả về một lần)."""
+        now = time.monotonic()
+        ready = []
+        for path, entry in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            key = (st.st_size, st.st_mtime_ns)
+            if key != entry[0]:
+                # File vẫn đang thay đổi: bắt đầu đếm lại
+                entry[0] = key
+                entry[1] = now
+                continue
+            if (entry[2] or now - entry[1] >= self.settle
+                    or (entry[3] and time.time() - st.st_mtime >= self.settle)):
+                del self.pending[path]
+                version = (path,) + key
+                if version in self.emitted:
+                    continue
+                self.emitted[version] = True
+                if len(self.emitted) > self.remember:
+                    self.emitted.popitem(last=False)
+                ready.append(path)
+        ready.sort()
+        return ready
+
+class PollingWatcher:
+    """Phát hiện file mới bằng cách quét định kỳ, dùng snapshot thư mục.
+
+    Mỗi lần quét chỉ stat các thư mục; chỉ thư mục có mtime thay đổi mới bị
+    liệt kê lại và chỉ file trong các thư mục đó mới được đưa vào theo dõi.
+    """
+
+    def __init__(self, roots, recursive, snapshot, exclude_dirs, tracker, interval=10.0):
+        self.roots = roots
+        self.recursive = recursive
+        self.snapshot = snapshot
+        self.exclude_dirs = exclude_dirs
+        self.tracker = tracker
+        self.interval = interval
+        self._next_scan = 0.0
+        self._first_scan = True
+
+    def _scan(self):
+        # Lần quét đầu đưa mọi file có sẵn vào theo dõi, các lần sau chỉ thư mục đã đổi
+        first_scan = self._first_scan
+        self._first_scan = False
+        for root in self.roots:
+            for file_path in iter_mkv_files(root, self.recursive, self.snapshot,
+                                            self.exclude_dirs, only_changed=not first_scan):
+                self.tracker.touch(file_path, existing=first_scan)
+
+    async def poll(self):
+        if time.monotonic() >= self._next_scan:
+            await asyncio.to_thread(self._scan)
+            self._next_scan = time.monotonic() + self.interval
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """Nhận sự kiện file từ inotify (Linux), không cần quét lại cây thư mục."""
+
+    def __init__(self, roots, recursive, exclude_dirs, tracker):
+        self.recursive = recursive
+        self.exclude_dirs = exclude_dirs
+        self.tracker = tracker
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.overflowed = False
+        for root in roots:
+            self._add_tree(root)
+
+    def _add_watch(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            print(f"Cannot watch folder '{folder}': {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = folder
+
+    def _add_tree(self, root, closed=False):
+        """Đăng ký theo dõi root (và thư mục con), đưa các file .mkv hiện có vào theo dõi.
+
+        closed=True khi cả thư mục được chuyển vào (file bên trong đã ghi xong).
+        """
+        stack = [root]
+        while stack:
+            folder = stack.pop()
+            self._add_watch(folder)
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (self.recursive and entry.name not in self.exclude_dirs
+                                    and not entry.name.startswith('.')):
+                                stack.append(entry.path)
+                        elif entry.name.lower().endswith(".mkv"):
+                            self.tracker.touch(entry.path, closed=closed, existing=True)
+            except OSError as e:
+                print(f"Error scanning folder '{folder}': {e}")
+
+    def _read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            folder = self.watches.get(wd)
+            if folder is None:
+                continue
+            if mask & (IN_IGNORED | IN_DELETE_SELF):
+                self.watches.pop(wd, None)
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if (mask & (IN_CREATE | IN_MOVED_TO) and self.recursive
+                        and name not in self.exclude_dirs and not name.startswith('.')):
+                    self._add_tree(path, closed=bool(mask & IN_MOVED_TO))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.tracker.forget(path)
+            else:
+                self.tracker.touch(path, closed=bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+
+    async def poll(self):
+        self._read_events()
+        if self.overflowed:
+            # Hàng đợi sự kiện của kernel bị tràn: quét lại các thư mục đang theo dõi
+            self.overflowed = False
+            for folder in list(self.watches.values()):
+                await asyncio.to_thread(self._rescan_folder, folder)
+
+    def _rescan_folder(self, folder):
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.name.lower().endswith(".mkv") and entry.is_file():
+                        self.tracker.touch(entry.path, existing=True)
+        except OSError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+def inotify_available():
+    return sys.platform.startswith('linux') and ctypes.util.find_library('c') is not None
+
+async def watch_mkv_files(roots, recursive=True, snapshot=None, exclude_dirs=(), settle=30.0,
+                          poll_interval=10.0, check_interval=1.0, use_inotify=None):
+    """Async iterator trả về các file .mkv mới sau khi đã ghi xong, chạy mãi mãi.
+
+    Dùng inotify nếu có (Linux), ngược lại quét định kỳ với snapshot thư mục.
+    """
+    tracker = StabilityTracker(settle)
+    if use_inotify is None:
+        use_inotify = inotify_available()
+    watcher = None
+    if use_inotify:
+        try:
+            watcher = InotifyWatcher(roots, recursive, exclude_dirs, tracker)
+            print(f"Watching {len(watcher.watches)} folders with inotify.")
+        except OSError as e:
+            print(f"inotify unavailable ({e}), falling back to polling.")
+    if watcher is None:
+        watcher = PollingWatcher(roots, recursive, snapshot, exclude_dirs, tracker, poll_interval)
+        print(f"Watching by polling every {poll_interval:g}s.")
+    try:
+        while True:
+            await watcher.poll()
+            for file_path in tracker.ready():
+                yield file_path
+            await asyncio.sleep(check_interval)
+    finally:
+        watcher.close()